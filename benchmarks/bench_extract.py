@@ -0,0 +1,356 @@
+"""Row building throughput: the compiled extractor vs one upsert call per row.
+
+Usage (from the project root):
+
+    python -m benchmarks.bench_extract --studies 5000
+    python -m benchmarks.bench_extract --locations 40 --outcomes 20
+
+Both paths run on the same validated studies, under
+MigratorMixIn.collect_rows, so nothing is written. The per-row path is
+migrate_to_db as it was before dbutils.tablespec, with one keyword per
+column for every row (the old behaviour, reproduced here). The rows of both
+paths are compared before timing.
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, List, Sequence, Tuple
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from dbutils.geo import geohash
+from dbutils.migrator import MigratorMixIn
+from models import ClinicalTrialStudy, parse_study
+from reader import iter_raw_studies
+
+
+def upsert(table_name: str, batch: bool = False, **values: Any) -> None:
+    # What each of the removed MigratorMixIn.migrate_* methods did: one
+    # keyword per column, put in the table's column order
+    columns = MigratorMixIn.COLUMN_MAP[table_name]
+    MigratorMixIn.upsert_table(table_name, [values[c] for c in columns], batch)
+
+
+def migrate_per_row(study: ClinicalTrialStudy) -> None:
+    # Extract NCT ID from the identification module
+    nct_id = study.protocolSection.identificationModule.nctId
+
+    # Migrate identification data
+    id_module = study.protocolSection.identificationModule
+    upsert(
+        "identification",
+        nct_id=nct_id,
+        nct_id_alias=id_module.nctIdAlias,
+        num_nct_aliases=id_module.numNctAliases,
+        org_study_id=id_module.orgStudyIdInfo.id,
+        org_study_id_type=id_module.orgStudyIdInfo.type,
+        org_study_id_link=id_module.secondaryIdInfo.secondaryIdLink,
+        num_secondary_ids=id_module.numSecondaryIds,
+        brief_title=id_module.briefTitle,
+        official_title=id_module.officialTitle,
+        acronym=id_module.acronym,
+        org_name=id_module.organization.fullName,
+        org_class=id_module.organization.class_,
+        brief_summary=study.protocolSection.descriptionModule.briefSummary,
+        detailed_description=study.protocolSection.descriptionModule.detailedDescription,
+        num_conditions=len(study.protocolSection.conditionsModule.conditions),
+        batch=True,
+    )
+
+    # Migrate status data
+    status_module = study.protocolSection.statusModule
+    upsert(
+        "status",
+        nct_id=nct_id,
+        status_verified_date=status_module.statusVerifiedDate,
+        overall_status=status_module.overallStatus,
+        last_known_status=status_module.lastKnownStatus,
+        why_stopped=status_module.whyStopped,
+        start_date=status_module.startDateStruct.date,
+        primary_completion_date=status_module.primaryCompletionDateStruct.date,
+        completion_date=status_module.completionDateStruct.date,
+        study_first_submit_date=status_module.studyFirstSubmitDate,
+        study_first_submit_qc_date=status_module.studyFirstSubmitQcDate,
+        study_first_post_date=status_module.studyFirstPostDateStruct.date,
+        results_waived=status_module.resultsWaived,
+        results_first_submit_date=status_module.resultsFirstSubmitDate,
+        results_first_submit_qc_date=status_module.resultsFirstSubmitQcDate,
+        results_first_post_date=status_module.resultsFirstPostDateStruct.date,
+        last_update_submit_date=status_module.lastUpdateSubmitDate,
+        last_update_post_date=status_module.lastUpdatePostDateStruct.date,
+        batch=True,
+    )
+
+    # Migrate oversight data
+    oversight_module = study.protocolSection.oversightModule
+    upsert(
+        "oversight",
+        nct_id=nct_id,
+        oversight_has_dmc=oversight_module.oversightHasDmc,
+        is_fda_regulated_drug=oversight_module.isFdaRegulatedDrug,
+        is_fda_regulated_device=oversight_module.isFdaRegulatedDevice,
+        is_ppsd=oversight_module.isPpsd,
+        is_us_export=oversight_module.isUsExport,
+        is_unapproved_device=oversight_module.isUnapprovedDevice,
+        is_fda_violation=oversight_module.isFdaViolation,
+        batch=True,
+    )
+
+    # Migrate design data
+    design_module = study.protocolSection.designModule
+    upsert(
+        "design",
+        nct_id=nct_id,
+        study_type=design_module.studyType,
+        patient_registry=(
+            design_module.studyType == "PATIENT_REGISTRY"
+            if design_module.studyType
+            else None
+        ),
+        allocation=design_module.designInfo.allocation,
+        intervention_model=design_module.designInfo.interventionModel,
+        primary_purpose=design_module.designInfo.primaryPurpose,
+        observational_model=design_module.designInfo.observationalModel,
+        enrollment_count=design_module.enrollmentInfo.count,
+        expanded_access_individual=design_module.expandedAccessTypes.individual,
+        expanded_access_intermediate=design_module.expandedAccessTypes.intermediate,
+        expanded_access_treatment=design_module.expandedAccessTypes.treatment,
+        num_phases=design_module.numPhases,
+        biospec_retention=design_module.bioSpec.retention,
+        biospec_description=design_module.bioSpec.description,
+        batch=True,
+    )
+
+    # Migrate phases data
+    if design_module.phases:
+        for phase in design_module.phases:
+            upsert("phases", nct_id=nct_id, phase=phase, batch=True)
+
+    # Migrate eligibility data
+    eligibility_module = study.protocolSection.eligibilityModule
+    upsert(
+        "eligibility",
+        nct_id=nct_id,
+        accepts_healthy_volunteers=eligibility_module.healthyVolunteers,
+        gender=eligibility_module.sex,
+        min_age=eligibility_module.minimumAge,
+        max_age=eligibility_module.maximumAge,
+        gender_based=eligibility_module.genderBased,
+        population_description=eligibility_module.studyPopulation,
+        sampling_method=eligibility_module.samplingMethod,
+        batch=True,
+    )
+
+    # Migrate conditions data
+    for condition in study.protocolSection.conditionsModule.conditions:
+        upsert("conditions", nct_id=nct_id, name=condition, batch=True)
+
+    # Migrate collaborators data
+    sponsor_module = study.protocolSection.sponsorCollaboratorsModule
+
+    # Lead sponsor
+    upsert(
+        "collaborators",
+        nct_id=nct_id,
+        responsible_party_type=sponsor_module.responsibleParty.type,
+        investigator_name=sponsor_module.responsibleParty.investigatorFullName,
+        investigator_affiliation=sponsor_module.responsibleParty.investigatorAffiliation,
+        collaborator_name=sponsor_module.leadSponsor.name,
+        collaborator_class=sponsor_module.leadSponsor.class_,
+        collaborator_type="lead sponsor",
+        batch=True,
+    )
+
+    # Other collaborators
+    for collaborator in sponsor_module.collaborators:
+        upsert(
+            "collaborators",
+            nct_id=nct_id,
+            responsible_party_type=sponsor_module.responsibleParty.type,
+            investigator_name=sponsor_module.responsibleParty.investigatorFullName,
+            investigator_affiliation=sponsor_module.responsibleParty.investigatorAffiliation,
+            collaborator_name=collaborator.name,
+            collaborator_class=collaborator.class_,
+            collaborator_type="collaborator",
+            batch=True,
+        )
+
+    # Migrate outcomes data
+    outcomes_module = study.protocolSection.outcomesModule
+
+    # Primary outcomes
+    for outcome in outcomes_module.primaryOutcomes:
+        upsert(
+            "outcome",
+            nct_id=nct_id,
+            type="primary",
+            measure=outcome.measure,
+            description=outcome.description,
+            time_frame=outcome.timeFrame,
+            batch=True,
+        )
+
+    # Secondary outcomes
+    for outcome in outcomes_module.secondaryOutcomes:
+        upsert(
+            "outcome",
+            nct_id=nct_id,
+            type="secondary",
+            measure=outcome.measure,
+            description=outcome.description,
+            time_frame=outcome.timeFrame,
+            batch=True,
+        )
+
+    # Other outcomes
+    for outcome in outcomes_module.otherOutcomes:
+        upsert(
+            "outcome",
+            nct_id=nct_id,
+            type="other",
+            measure=outcome.measure,
+            description=outcome.description,
+            time_frame=outcome.timeFrame,
+            batch=True,
+        )
+
+    # Migrate interventions data
+    for intervention in study.protocolSection.armsInterventionsModule.interventions:
+        upsert(
+            "interventions",
+            nct_id=nct_id,
+            intervention_type=intervention.type,
+            intervention_name=intervention.name,
+            intervention_description=intervention.description,
+            group_label=(
+                intervention.armGroupLabels[0] if intervention.armGroupLabels else None
+            ),
+            batch=True,
+        )
+
+    # Migrate groups data
+    for group in study.protocolSection.armsInterventionsModule.armGroups:
+        upsert(
+            "groups",
+            nct_id=nct_id,
+            group_type=group.type,
+            group_description=group.description,
+            group_label=group.label,
+            batch=True,
+        )
+
+    # Migrate facility data
+    for location in study.protocolSection.contactsLocationsModule.locations:
+        upsert(
+            "facility",
+            nct_id=nct_id,
+            name=location.facility,
+            status=location.status,
+            city=location.city,
+            state=location.state,
+            zip=location.zip,
+            country=location.country,
+            contacts=(
+                json.dumps(
+                    {
+                        "contacts": [
+                            contact.model_dump() for contact in location.contacts
+                        ]
+                    }
+                )
+                if location.contacts
+                else None
+            ),
+            latitude=location.geoPoint.lat if location.geoPoint else None,
+            longitude=location.geoPoint.lon if location.geoPoint else None,
+            geo_cell=(
+                geohash(location.geoPoint.lat, location.geoPoint.lon)
+                if location.geoPoint
+                else None
+            ),
+            batch=True,
+        )
+
+    # Migrate contact data
+    for contact in study.protocolSection.contactsLocationsModule.centralContacts:
+        upsert(
+            "contact",
+            nct_id=nct_id,
+            name=contact.name,
+            role=contact.role,
+            phone=contact.phone,
+            email=contact.email,
+            batch=True,
+        )
+
+    # Migrate official data
+    for official in study.protocolSection.contactsLocationsModule.overallOfficials:
+        upsert(
+            "officials",
+            nct_id=nct_id,
+            name=official.name,
+            role=official.role,
+            affiliation=official.affiliation,
+            batch=True,
+        )
+
+
+def migrate_compiled(study: ClinicalTrialStudy) -> None:
+    study.migrate_to_db(batch=True)
+
+
+def build_rows(
+    migrate: Callable[[ClinicalTrialStudy], None], studies: List[ClinicalTrialStudy]
+) -> List[Tuple[str, Sequence[Any]]]:
+    with MigratorMixIn.collect_rows() as rows:
+        for study in studies:
+            migrate(study)
+    return rows
+
+
+def time_rows(
+    migrate: Callable[[ClinicalTrialStudy], None],
+    studies: List[ClinicalTrialStudy],
+    repeat: int,
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build_rows(migrate, studies)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    path = corpus_path(args.corpus_dir, args.studies, shape_from_args(args), args.seed)
+    studies = [parse_study(raw) for _, raw in iter_raw_studies(path)]
+
+    expected = build_rows(migrate_per_row, studies)
+    actual = build_rows(migrate_compiled, studies)
+    if [(t, list(v)) for t, v in expected] != [(t, list(v)) for t, v in actual]:
+        raise SystemExit("The compiled extractor does not produce the same rows")
+    print(f"{len(studies):,} studies, {len(actual):,} rows")
+
+    baseline = None
+    for name, migrate in (
+        ("upsert per row", migrate_per_row),
+        ("compiled extractor", migrate_compiled),
+    ):
+        seconds = time_rows(migrate, studies, args.repeat)
+        baseline = baseline or seconds
+        print(
+            f"{name:>20}: {seconds * 1e6 / len(studies):7.1f} us/study, "
+            f"{len(actual) / seconds:12,.0f} rows/s ({baseline / seconds:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Latency of nearest-site queries against the geohash index.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_geo --studies 20000 --locations 40
+    python -m benchmarks.bench_geo --skip-load --radius 10,50,250
+
+Unless --skip-load is given, the schema is re-initialized and a synthetic
+corpus is loaded, so point it at a scratch database. Synthetic facilities
+are scattered around a handful of cities (see benchmarks.corpus). Every
+query around a random point near one of them is timed, and the first
+--check queries are compared with a full scan of the facility table.
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import _COUNTRIES, add_shape_arguments, shape_from_args
+from dbutils.geo import distance_km, nearest
+from dbutils.helpers import execute_query, init_database
+from dbutils.migrator import MigratorMixIn
+from main import load_studies
+
+
+def full_scan(lat: float, lon: float, radius_km: float, k: int):
+    """The distances of the sites nearest() should return, by brute force."""
+    rows = execute_query(
+        "SELECT nct_id, latitude, longitude FROM facility "
+        "WHERE status = 'RECRUITING' AND latitude IS NOT NULL"
+    )
+    sites = sorted(
+        (distance_km(lat, lon, site_lat, site_lon), nct_id)
+        for nct_id, site_lat, site_lon in rows
+    )
+    return [km for km, _ in sites if km <= radius_km][:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--radius", default="5,25,100", help="Radii in km")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--check", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.skip_load:
+        path = corpus_path(
+            args.corpus_dir, args.studies, shape_from_args(args), args.seed
+        )
+        MigratorMixIn.set_load_mode("copy")
+        init_database()
+        for _ in load_studies(path):
+            pass
+        MigratorMixIn.flush_all_batches()
+        execute_query("ANALYZE facility")
+    facilities = execute_query("SELECT count(*) FROM facility")[0][0]
+    print(f"{facilities:,} facilities")
+
+    cities = [city for _, *cities in _COUNTRIES for city in cities]
+    rng = random.Random(args.seed)
+    for radius_km in map(float, args.radius.split(",")):
+        latencies = []
+        found = 0
+        for i in range(args.queries):
+            _, city_lat, city_lon = rng.choice(cities)
+            lat = city_lat + rng.uniform(-0.3, 0.3)
+            lon = city_lon + rng.uniform(-0.3, 0.3)
+            started = time.perf_counter()
+            sites = nearest(lat, lon, radius_km, args.k)
+            latencies.append(time.perf_counter() - started)
+            found += len(sites)
+            if i < args.check:
+                expected = full_scan(lat, lon, radius_km, args.k)
+                actual = [site.distance_km for site in sites]
+                if len(actual) != len(expected) or any(
+                    abs(a - b) > 1e-6 for a, b in zip(actual, expected)
+                ):
+                    raise AssertionError(f"({lat}, {lon}): {actual} != {expected}")
+        latencies.sort()
+        print(
+            f"radius {radius_km:>6.0f} km: "
+            f"p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms, "
+            f"max {latencies[-1] * 1000:6.2f} ms, "
+            f"{found / args.queries:.1f} sites per query"
+        )
+
+
+if __name__ == "__main__":
+    main()
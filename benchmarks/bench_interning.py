@@ -0,0 +1,97 @@
+"""Storage and load throughput with and without interned columns.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_interning --studies 20000
+    python -m benchmarks.bench_interning --modes copy --locations 40
+
+For each load mode, the schema is re-initialized with interning off and on
+(see dbutils.schema.set_interning) and a synthetic corpus is loaded into it.
+Studies are validated and turned into rows before the clock starts; queuing
+and writing them is timed, which includes resolving ids for the interned
+columns. The on-disk size of every table, dimension tables included, is
+reported after each load. The schema is re-initialized, so point it at a
+scratch database.
+"""
+
+import argparse
+import time
+from typing import Any, Dict
+
+from benchmarks.bench_pipeline import _build_rows, _validate, corpus_path, iter_chunks
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from dbutils.helpers import execute_query, init_database
+from dbutils.migrator import MigratorMixIn
+from dbutils.schema import (
+    DIMENSION_TABLES,
+    INTERNED_COLUMNS,
+    set_interning,
+    table_names,
+)
+
+
+def load(path: str, chunk_size: int) -> Dict[str, Any]:
+    seconds = 0.0
+    rows = 0
+    for chunk in iter_chunks(path, chunk_size):
+        built = list(_build_rows(_validate(chunk)))
+        started = time.perf_counter()
+        for table_name, values in built:
+            MigratorMixIn.add_to_batch(table_name, values)
+        seconds += time.perf_counter() - started
+        rows += len(built)
+    started = time.perf_counter()
+    MigratorMixIn.flush_all_batches()
+    return {"rows": rows, "seconds": seconds + time.perf_counter() - started}
+
+
+def relation_sizes() -> Dict[str, int]:
+    """Total bytes (heap, TOAST and indexes) per table."""
+    return dict(
+        execute_query(
+            "SELECT t::text, pg_total_relation_size(t) "
+            "FROM unnest(%s::regclass[]) AS t",
+            (list(table_names()),),
+        )
+    )
+
+
+def run(path: str, chunk_size: int, interned: bool, mode: str) -> Dict[str, Any]:
+    set_interning(interned)
+    MigratorMixIn.set_load_mode(mode)
+    init_database()
+    result = load(path, chunk_size)
+    execute_query("ANALYZE")
+    return {**result, "sizes": relation_sizes()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--modes", default="executemany,copy", help="Load modes")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    path = corpus_path(args.corpus_dir, args.studies, shape_from_args(args), args.seed)
+    try:
+        for mode in args.modes.split(","):
+            for interned in (False, True):
+                result = run(path, args.chunk_size, interned, mode)
+                sizes = result["sizes"]
+                interned_tables = sum(sizes[name] for name in INTERNED_COLUMNS)
+                dimensions = sum(sizes.get(name, 0) for name in DIMENSION_TABLES)
+                print(
+                    f"{mode:>12} {'interned' if interned else 'text':>8}: "
+                    f"{result['rows'] / result['seconds']:>9,.0f} rows/s, "
+                    f"total {sum(sizes.values()) / 2**20:7.1f} MiB, "
+                    f"interned tables {interned_tables / 2**20:7.1f} MiB, "
+                    f"dimensions {dimensions / 2**20:6.1f} MiB"
+                )
+    finally:
+        set_interning(False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Index size and upsert throughput of the two conflict key modes.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_keys --studies 20000
+    python -m benchmarks.bench_keys --modes copy --locations 40 --outcomes 20
+
+For each key mode (see dbutils.schema.KEY_MODES) and load mode, the schema is
+re-initialized and a synthetic corpus is loaded twice: into empty tables, then
+again on top of itself, where every row conflicts. Only the writer calls are
+timed. Table and index sizes of HASHED_KEY_TABLES are reported after the
+first load. The schema is re-initialized, so point it at a scratch database.
+"""
+
+import argparse
+from typing import Any, Dict
+
+from benchmarks.bench_pipeline import (
+    _build_rows,
+    _timed,
+    _validate,
+    corpus_path,
+    iter_chunks,
+)
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from dbutils.helpers import execute_query, init_database
+from dbutils.migrator import MigratorMixIn
+from dbutils.schema import HASHED_KEY_TABLES, KEY_MODES
+
+
+def load(path: str, chunk_size: int, mode: str) -> Dict[str, Any]:
+    timer = {"seconds": 0.0}
+    writer = MigratorMixIn.LOAD_MODES[mode]
+    MigratorMixIn.LOAD_MODES[mode] = _timed(writer, timer)
+    rows = 0
+    try:
+        for chunk in iter_chunks(path, chunk_size):
+            for table_name, values in _build_rows(_validate(chunk)):
+                MigratorMixIn.add_to_batch(table_name, values)
+                rows += 1
+        MigratorMixIn.flush_all_batches()
+    finally:
+        MigratorMixIn.LOAD_MODES[mode] = writer
+    return {"rows": rows, "seconds": timer["seconds"]}
+
+
+def relation_sizes() -> Dict[str, int]:
+    """Heap and index bytes of the hashed tables, summed."""
+    table_bytes, index_bytes = execute_query(
+        "SELECT sum(pg_table_size(t)), sum(pg_indexes_size(t)) "
+        "FROM unnest(%s::regclass[]) AS t",
+        (list(HASHED_KEY_TABLES),),
+    )[0]
+    return {"table_bytes": int(table_bytes), "index_bytes": int(index_bytes)}
+
+
+def run(path: str, chunk_size: int, key_mode: str, mode: str) -> Dict[str, Any]:
+    MigratorMixIn.set_key_mode(key_mode)
+    MigratorMixIn.set_load_mode(mode)
+    init_database()
+    first = load(path, chunk_size, mode)
+    execute_query("ANALYZE")
+    sizes = relation_sizes()
+    again = load(path, chunk_size, mode)
+    return {
+        "rows": first["rows"],
+        "insert_seconds": first["seconds"],
+        "upsert_seconds": again["seconds"],
+        **sizes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--modes", default="executemany,copy", help="Load modes")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    path = corpus_path(args.corpus_dir, args.studies, shape_from_args(args), args.seed)
+    try:
+        for mode in args.modes.split(","):
+            for key_mode in KEY_MODES:
+                result = run(path, args.chunk_size, key_mode, mode)
+                rows = result["rows"]
+                print(
+                    f"{mode:>12} {key_mode:>8}: "
+                    f"insert {rows / result['insert_seconds']:>9,.0f} rows/s, "
+                    f"upsert {rows / result['upsert_seconds']:>9,.0f} rows/s, "
+                    f"indexes {result['index_bytes'] / 2**20:7.1f} MiB, "
+                    f"tables {result['table_bytes'] / 2**20:7.1f} MiB"
+                )
+    finally:
+        MigratorMixIn.set_key_mode("columns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Compare the executemany and COPY load modes against a live database.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_load_modes --studies 20000
+    python -m benchmarks.bench_load_modes --reload
+
+With --reload, the timed load goes on top of a previous one of the same
+studies whose child rows (facility, conditions) were all different, as when
+an export is refreshed. Only the replace mode removes the stale ones, so the
+facility row count is printed for every mode. The last site of every study
+is listed twice with a NULL state, which does not conflict in a unique key,
+so the run fails if copy and executemany store different facility counts.
+The schema is re-initialized, so point it at a scratch database.
+"""
+
+import argparse
+import random
+import string
+import time
+
+from dbutils.helpers import init_database, execute_query
+from dbutils.migrator import MigratorMixIn
+
+
+def _text(rng: random.Random, size: int) -> str:
+    return "".join(rng.choices(string.ascii_letters + " ", k=size))
+
+
+def make_rows(n_studies: int, children_per_study: int, seed: int = 0):
+    rng = random.Random(seed)
+    identification, facility, conditions = [], [], []
+    for i in range(n_studies):
+        nct_id = f"NCT{i:08d}"
+        identification.append(
+            [
+                nct_id,
+                [],
+                0,
+                f"ORG-{i}",
+                None,
+                None,
+                0,
+                _text(rng, 80),
+                _text(rng, 160),
+                None,
+                _text(rng, 30),
+                "INDUSTRY",
+                _text(rng, 500),
+                _text(rng, 2000),
+                children_per_study,
+            ]
+        )
+        for j in range(children_per_study):
+            facility.append(
+                [
+                    nct_id,
+                    _text(rng, 40),
+                    "RECRUITING",
+                    _text(rng, 12),
+                    None,
+                    f"{rng.randint(10000, 99999)}",
+                    "United States",
+                    None,
+                    None,
+                    None,
+                    None,
+                ]
+            )
+            conditions.append([nct_id, f"{_text(rng, 20)} {j}"])
+        if facility:
+            # A site listed twice. Its key has a NULL state, so the two rows
+            # do not conflict and every load mode must keep both
+            facility.append(list(facility[-1]))
+    return {
+        "identification": identification,
+        "facility": facility,
+        "conditions": conditions,
+    }
+
+
+def load(rows) -> float:
+    started = time.perf_counter()
+    for table_name, table_rows in rows.items():
+        for row in table_rows:
+            MigratorMixIn.add_to_batch(table_name, row)
+        MigratorMixIn._flush_batch(table_name)
+    return time.perf_counter() - started
+
+
+def run(mode: str, rows, previous=None) -> float:
+    init_database()
+    MigratorMixIn.set_load_mode(mode)
+    if previous is not None:
+        load(previous)
+    return load(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--children", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--reload", action="store_true", help="Time a load over a previous one"
+    )
+    args = parser.parse_args()
+
+    rows = make_rows(args.studies, args.children)
+    previous = make_rows(args.studies, args.children, seed=1) if args.reload else None
+    total_rows = sum(len(r) for r in rows.values())
+    counts = {}
+    for mode in MigratorMixIn.LOAD_MODES:
+        if args.reload and mode == "bulk":
+            # Appends to keyed tables would violate their keys
+            continue
+        timings = [run(mode, rows, previous) for _ in range(args.repeat)]
+        best = min(timings)
+        count = counts[mode] = execute_query("SELECT count(*) FROM facility")[0][0]
+        print(
+            f"{mode:>12}: {best:8.3f}s best of {args.repeat} "
+            f"({total_rows / best:,.0f} rows/s), {count} facility rows"
+        )
+
+    if counts["executemany"] != counts["copy"]:
+        raise AssertionError(
+            f"copy stored {counts['copy']} facility rows, "
+            f"executemany {counts['executemany']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Time and memory per study: json.loads + model_validate vs validating the
+raw bytes directly, in full or projected.
+
+Usage (from the project root):
+
+    python -m benchmarks.bench_parse --studies 5000
+    python -m benchmarks.bench_parse --locations 40 --description-words 2000
+    python -m benchmarks.bench_parse --result-measures 10 --references 10
+
+Studies are read with reader.iter_raw_studies from a generated corpus (see
+benchmarks.corpus). Time is measured without tracing. Memory is measured in a
+separate pass with tracemalloc: the peak allocated while validating one study,
+and what is still allocated once the validated model is all that is left.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from functools import partial
+from statistics import mean, median
+from typing import Callable, Dict, List
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from models import ClinicalTrialStudy, parse_study
+from reader import iter_raw_studies
+
+
+def via_dict(raw: bytes) -> ClinicalTrialStudy:
+    return ClinicalTrialStudy.model_validate(json.loads(raw))
+
+
+PATHS: Dict[str, Callable[[bytes], ClinicalTrialStudy]] = {
+    "json.loads + model_validate": via_dict,
+    "parse_study (raw bytes)": parse_study,
+    "parse_study (projected)": partial(parse_study, projected=True),
+}
+
+
+def time_per_study(parse: Callable, studies: List[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in studies:
+            parse(raw)
+        best = min(best, time.perf_counter() - started)
+    return best / len(studies)
+
+
+def memory_per_study(parse: Callable, studies: List[bytes]) -> Dict[str, float]:
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for raw in studies:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            model = parse(raw)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            del model
+    finally:
+        tracemalloc.stop()
+    return {"peak": mean(peaks), "peak_median": median(peaks), "model": mean(retained)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    path = corpus_path(args.corpus_dir, args.studies, shape_from_args(args), args.seed)
+    studies = [raw for _, raw in iter_raw_studies(path)]
+    size = mean(map(len, studies))
+    print(f"{len(studies):,} studies, {size / 1024:.1f} KiB of JSON on average")
+
+    for name, parse in PATHS.items():
+        seconds = time_per_study(parse, studies, args.repeat)
+        memory = memory_per_study(parse, studies)
+        print(
+            f"{name:>28}: {seconds * 1e6:8.1f} us/study, "
+            f"peak {memory['peak'] / 1024:7.1f} KiB/study "
+            f"(median {memory['peak_median'] / 1024:.1f}), "
+            f"model {memory['model'] / 1024:.1f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
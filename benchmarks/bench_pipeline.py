@@ -0,0 +1,319 @@
+"""Parse, transform and load throughput on a synthetic corpus.
+
+Usage (from the project root, with the DB* environment variables set for the
+load stage):
+
+    python -m benchmarks.bench_pipeline --sizes 1k,100k --out results.json
+    python -m benchmarks.bench_pipeline --sizes 1M --stages parse,transform
+    python -m benchmarks.bench_pipeline --compare baseline.json --out results.json
+
+Stages, each timed on its own:
+
+- parse: models.parse_study (validation straight from the raw bytes)
+- transform: migrate_to_db row building (under MigratorMixIn.collect_rows)
+- load: the time spent in each dbutils.helpers writer (one result per load
+  mode), plus finalize_database for the bulk mode
+
+Corpora are generated once with benchmarks.corpus and cached in --corpus-dir.
+Studies are streamed in chunks, so memory stays bounded at any size. The load
+stage re-initializes the schema, so point it at a scratch database.
+
+Results are written as JSON. With --compare, every result is matched against
+the same benchmark in a previous results file, and the exit status is 1 if
+any got slower by more than --tolerance.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from benchmarks.corpus import (
+    CorpusShape,
+    add_shape_arguments,
+    shape_from_args,
+    write_corpus,
+)
+from dbutils.migrator import MigratorMixIn
+from models import ClinicalTrialStudy, parse_study
+from reader import iter_raw_studies
+
+STAGES = ("parse", "transform", "load")
+_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(size: str) -> int:
+    size = size.strip().lower()
+    if size[-1] in _SUFFIXES:
+        return int(float(size[:-1]) * _SUFFIXES[size[-1]])
+    return int(size)
+
+
+def corpus_path(directory: str, n: int, shape: CorpusShape, seed: int) -> str:
+    """Generate the corpus on first use; its name covers everything it
+    depends on, so a cached file is never stale."""
+    digest = hashlib.blake2b(
+        json.dumps([shape, seed]).encode(), digest_size=4
+    ).hexdigest()
+    path = os.path.join(directory, f"corpus-{n}-{digest}.json")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        print(f"Generating {n:,} studies into {path}")
+        write_corpus(path + ".tmp", n, shape, seed)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def iter_chunks(path: str, chunk_size: int) -> Iterator[List[bytes]]:
+    studies = (raw for _, raw in iter_raw_studies(path))
+    while chunk := list(islice(studies, chunk_size)):
+        yield chunk
+
+
+def _validate(chunk: List[bytes]) -> List[ClinicalTrialStudy]:
+    return [parse_study(raw) for raw in chunk]
+
+
+def _build_rows(
+    studies: List[ClinicalTrialStudy],
+) -> List[Tuple[str, Sequence[Any]]]:
+    with MigratorMixIn.collect_rows() as rows:
+        for study in studies:
+            study.migrate_to_db(batch=True)
+    return rows
+
+
+def bench_parse(path: str, chunk_size: int) -> Dict[str, Any]:
+    studies = size = 0
+    elapsed = 0.0
+    for chunk in iter_chunks(path, chunk_size):
+        started = time.perf_counter()
+        _validate(chunk)
+        elapsed += time.perf_counter() - started
+        studies += len(chunk)
+        size += sum(map(len, chunk))
+    return {"studies": studies, "bytes": size, "seconds": elapsed}
+
+
+def bench_transform(path: str, chunk_size: int) -> Dict[str, Any]:
+    studies = rows = 0
+    elapsed = 0.0
+    for chunk in iter_chunks(path, chunk_size):
+        parsed = _validate(chunk)
+        started = time.perf_counter()
+        rows += len(_build_rows(parsed))
+        elapsed += time.perf_counter() - started
+        studies += len(chunk)
+    return {"studies": studies, "rows": rows, "seconds": elapsed}
+
+
+def _timed(writer: Callable, timer: Dict[str, float]) -> Callable:
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return writer(*args, **kwargs)
+        finally:
+            timer["seconds"] += time.perf_counter() - started
+
+    return wrapper
+
+
+def bench_load(path: str, chunk_size: int, mode: str) -> List[Dict[str, Any]]:
+    """Only the writer calls are timed: parsing and row building happen
+    between flushes exactly as in main.load_studies, but are not counted."""
+    from dbutils.helpers import finalize_database, init_database
+
+    init_database(bulk=mode == "bulk")
+    MigratorMixIn.set_load_mode(mode)
+    timer = {"seconds": 0.0}
+    writer = MigratorMixIn.LOAD_MODES[mode]
+    MigratorMixIn.LOAD_MODES[mode] = _timed(writer, timer)
+    studies = rows = 0
+    try:
+        for chunk in iter_chunks(path, chunk_size):
+            for table_name, values in _build_rows(_validate(chunk)):
+                MigratorMixIn.add_to_batch(table_name, values)
+                rows += 1
+            studies += len(chunk)
+        MigratorMixIn.flush_all_batches()
+    finally:
+        MigratorMixIn.LOAD_MODES[mode] = writer
+
+    results = [{"studies": studies, "rows": rows, "seconds": timer["seconds"]}]
+    if mode == "bulk":
+        started = time.perf_counter()
+        finalize_database()
+        results.append(
+            {
+                "benchmark": "finalize",
+                "studies": studies,
+                "rows": rows,
+                "seconds": time.perf_counter() - started,
+            }
+        )
+    return results
+
+
+def _best_of(repeat: int, run: Callable[[], Any]) -> Any:
+    # Results of one run are a dict, or a list of dicts for the load stage
+    def seconds(result) -> float:
+        return (result[0] if isinstance(result, list) else result)["seconds"]
+
+    return min((run() for _ in range(repeat)), key=seconds)
+
+
+def _with_rates(result: Dict[str, Any]) -> Dict[str, Any]:
+    seconds = result["seconds"] or float("nan")
+    result["studies_per_second"] = result["studies"] / seconds
+    if "rows" in result:
+        result["rows_per_second"] = result["rows"] / seconds
+    if "bytes" in result:
+        result["mb_per_second"] = result["bytes"] / seconds / 1e6
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(shape: CorpusShape, seed: int, with_db: bool) -> Dict[str, Any]:
+    import psycopg
+    import pydantic
+
+    env = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pydantic": pydantic.VERSION,
+        "psycopg": psycopg.__version__,
+        "seed": seed,
+        "shape": shape._asdict(),
+        "batch_target_latency": MigratorMixIn._BATCH_SIZER.target_latency,
+        "batch_initial_bytes": MigratorMixIn._BATCH_SIZER.initial_bytes,
+        "batch_max_rows": MigratorMixIn._MAX_QUEUE_SIZE,
+        "queue_memory_limit": MigratorMixIn.QUEUE_MEMORY_LIMIT,
+    }
+    if with_db:
+        from dbutils.helpers import execute_query
+
+        env["postgres"] = execute_query("SHOW server_version")[0][0]
+    return env
+
+
+def result_key(result: Dict[str, Any]) -> Tuple:
+    return (result["benchmark"], result.get("mode"), result["studies"])
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> bool:
+    """Print the change of every benchmark present in both runs and return
+    whether none of them regressed by more than `tolerance`."""
+    previous = {result_key(result): result for result in baseline}
+    ok = True
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        benchmark, mode, studies = result_key(result)
+        name = f"{benchmark}[{mode}]" if mode else benchmark
+        print(
+            f"{name:>20} {studies:>9,}: {before['seconds']:9.3f}s -> "
+            f"{result['seconds']:9.3f}s ({change:+7.1%})"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k", help="e.g. 1k,100k,1M")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument(
+        "--modes",
+        default=",".join(MigratorMixIn.LOAD_MODES),
+        help="Load modes for the load stage",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",")]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    shape = shape_from_args(args)
+
+    results = []
+    for n in map(parse_size, args.sizes.split(",")):
+        path = corpus_path(args.corpus_dir, n, shape, args.seed)
+        runs = []
+        if "parse" in stages:
+            runs.append(
+                ({"benchmark": "parse"}, lambda: bench_parse(path, args.chunk_size))
+            )
+        if "transform" in stages:
+            runs.append(
+                (
+                    {"benchmark": "transform"},
+                    lambda: bench_transform(path, args.chunk_size),
+                )
+            )
+        if "load" in stages:
+            for mode in args.modes.split(","):
+                runs.append(
+                    (
+                        {"benchmark": "load", "mode": mode},
+                        lambda mode=mode: bench_load(path, args.chunk_size, mode),
+                    )
+                )
+        for labels, run in runs:
+            measured = _best_of(args.repeat, run)
+            for result in measured if isinstance(measured, list) else [measured]:
+                result = _with_rates({**labels, **result})
+                results.append(result)
+                name = result["benchmark"]
+                if result.get("mode"):
+                    name += f"[{result['mode']}]"
+                print(
+                    f"{name:>20} {n:>9,}: {result['seconds']:9.3f}s "
+                    f"({result['studies_per_second']:,.0f} studies/s)"
+                )
+
+    report = {
+        "environment": environment(shape, args.seed, "load" in stages),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
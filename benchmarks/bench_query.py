@@ -0,0 +1,83 @@
+"""Latency of reading studies back, cold and from the cache.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_query --studies 20000
+    python -m benchmarks.bench_query --skip-load --reads 2000 --batch 50
+
+Unless --skip-load is given, the schema is re-initialized and a synthetic
+corpus is loaded, so point it at a scratch database. Random loaded studies
+are then read:
+
+- per table: one SELECT per table, as a client without dbutils.query would
+- cold: fetch_study with the cache bypassed, one round trip per study
+- batch: fetch_studies for --batch studies at a time, bypassing the cache
+- hot: fetch_study served from STUDY_CACHE
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from dbutils.helpers import execute_query, init_database
+from dbutils.migrator import MigratorMixIn
+from dbutils.query import STUDY_CACHE, fetch_studies, fetch_study
+from main import load_studies
+
+
+def per_table(nct_id: str) -> None:
+    for table_name in MigratorMixIn.COLUMN_MAP:
+        execute_query(
+            f"SELECT * FROM {table_name} WHERE nct_id = %s", (nct_id,), prepare=True
+        )
+
+
+def timed(label: str, reads: int, read: Callable[[], None]) -> None:
+    started = time.perf_counter()
+    read()
+    seconds = time.perf_counter() - started
+    print(f"{label:>10}: {seconds / reads * 1e6:10.1f} us/study")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.skip_load:
+        path = corpus_path(
+            args.corpus_dir, args.studies, shape_from_args(args), args.seed
+        )
+        MigratorMixIn.set_load_mode("copy")
+        init_database()
+        for _ in load_studies(path):
+            pass
+        MigratorMixIn.flush_all_batches()
+        execute_query("ANALYZE")
+    loaded = [row[0] for row in execute_query("SELECT nct_id FROM identification")]
+    rng = random.Random(args.seed)
+    nct_ids: List[str] = [rng.choice(loaded) for _ in range(args.reads)]
+    batches = [nct_ids[i : i + args.batch] for i in range(0, len(nct_ids), args.batch)]
+
+    timed("per table", args.reads, lambda: [per_table(n) for n in nct_ids])
+    timed("cold", args.reads, lambda: [fetch_study(n, cache=False) for n in nct_ids])
+    timed(
+        "batch",
+        args.reads,
+        lambda: [fetch_studies(batch, cache=False) for batch in batches],
+    )
+    STUDY_CACHE.clear()
+    fetch_studies(nct_ids)
+    timed("hot", args.reads, lambda: [fetch_study(n) for n in nct_ids])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Dashboard counts from the rollups against aggregating the tables.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_rollups --studies 20000
+    python -m benchmarks.bench_rollups --skip-load --touched 100,1000
+
+Unless --skip-load is given, the schema is re-initialized and a synthetic
+corpus is loaded, so point it at a scratch database. For every dimension of
+dbutils.rollups.ROLLUPS, rollup() is timed against the equivalent
+COUNT(DISTINCT nct_id) over the base table, and the two results are
+compared. Then refresh() is timed for --touched random studies at a time,
+against recounting every study.
+"""
+
+import argparse
+import random
+import time
+from typing import Callable
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from dbutils.helpers import execute_query, init_database
+from dbutils.migrator import MigratorMixIn
+from dbutils.rollups import ROLLUPS, refresh, rollup
+from dbutils.schema import interning, text_expression
+from main import load_studies
+
+
+def aggregate(dimension: str):
+    """What rollup(dimension) returns, computed from the base table."""
+    table_name, column, condition = ROLLUPS[dimension]
+    value = text_expression("t", table_name, column, interning())
+    return execute_query(
+        f"SELECT {value} AS value, count(DISTINCT t.nct_id) AS trials "
+        f"FROM {table_name} t WHERE t.{column} IS NOT NULL"
+        + (f" AND {condition}" if condition else "")
+        + " GROUP BY 1 ORDER BY trials DESC, value"
+    )
+
+
+def timed(repeat: int, function: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--touched", default="10,100,1000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    nct_ids = None
+    if not args.skip_load:
+        path = corpus_path(
+            args.corpus_dir, args.studies, shape_from_args(args), args.seed
+        )
+        MigratorMixIn.set_load_mode("copy")
+        init_database()
+        for _ in load_studies(path):
+            pass
+        MigratorMixIn.flush_all_batches()
+        nct_ids = MigratorMixIn.pop_written_studies()
+    if not nct_ids:
+        nct_ids = {row[0] for row in execute_query("SELECT nct_id FROM identification")}
+    started = time.perf_counter()
+    refresh(nct_ids)
+    print(f"recount of {len(nct_ids):,} studies: {time.perf_counter() - started:.2f}s")
+    execute_query("ANALYZE")
+
+    for dimension in ROLLUPS:
+        if rollup(dimension) != aggregate(dimension):
+            raise AssertionError(f"{dimension}: rollup differs from the tables")
+        maintained = timed(args.repeat, lambda: rollup(dimension))
+        scanned = timed(args.repeat, lambda: aggregate(dimension))
+        print(
+            f"{dimension:>15}: rollup {maintained * 1000:8.2f} ms, "
+            f"aggregate {scanned * 1000:8.2f} ms ({scanned / maintained:.0f}x)"
+        )
+
+    rng = random.Random(args.seed)
+    studies = sorted(nct_ids)
+    for touched in map(int, args.touched.split(",")):
+        seconds = timed(
+            args.repeat,
+            lambda: refresh(rng.sample(studies, min(touched, len(studies)))),
+        )
+        print(f"refresh of {touched:>6,} studies: {seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Latency of ranked full-text search against ILIKE scans.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_search --studies 20000
+    python -m benchmarks.bench_search --skip-load --queries 200 --words 2
+
+Unless --skip-load is given, the schema is re-initialized and a synthetic
+corpus is loaded, so point it at a scratch database. Each query is made of
+--words random words of the corpus vocabulary, searched with
+dbutils.search.search (with and without a status filter) and with the
+ILIKE scan over the same columns that it replaces.
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import _WORDS, add_shape_arguments, shape_from_args
+from dbutils.helpers import execute_query, init_database
+from dbutils.migrator import MigratorMixIn
+from dbutils.search import search
+from main import load_studies
+
+_ILIKE = (
+    "SELECT i.nct_id FROM identification i WHERE {} "
+    "OR EXISTS (SELECT 1 FROM outcome o WHERE o.nct_id = i.nct_id AND {}) "
+    "OR EXISTS (SELECT 1 FROM interventions v WHERE v.nct_id = i.nct_id AND {}) "
+    "LIMIT %s"
+)
+
+
+def ilike(words: List[str], k: int) -> None:
+    def all_words(columns: List[str]) -> str:
+        text = " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+        return "(" + " AND ".join(f"{text} ILIKE %s" for _ in words) + ")"
+
+    patterns = [f"%{word}%" for word in words]
+    execute_query(
+        _ILIKE.format(
+            all_words(
+                [
+                    "i.brief_title",
+                    "i.official_title",
+                    "i.brief_summary",
+                    "i.detailed_description",
+                ]
+            ),
+            all_words(["o.measure"]),
+            all_words(["v.intervention_name"]),
+        ),
+        patterns * 3 + [k],
+    )
+
+
+def percentiles(label: str, queries: List[List[str]], run: Callable) -> None:
+    latencies = []
+    for words in queries:
+        started = time.perf_counter()
+        run(words)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(
+        f"{label:>16}: p50 {latencies[len(latencies) // 2] * 1000:8.2f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--words", type=int, default=2)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.skip_load:
+        path = corpus_path(
+            args.corpus_dir, args.studies, shape_from_args(args), args.seed
+        )
+        MigratorMixIn.set_load_mode("copy")
+        init_database()
+        started = time.perf_counter()
+        for _ in load_studies(path):
+            pass
+        MigratorMixIn.flush_all_batches()
+        print(f"load: {time.perf_counter() - started:.2f}s")
+        execute_query("ANALYZE")
+
+    vocabulary = _WORDS.split()
+    rng = random.Random(args.seed)
+    queries = [rng.sample(vocabulary, args.words) for _ in range(args.queries)]
+    percentiles("search", queries, lambda words: search(" ".join(words), args.k))
+    percentiles(
+        "search + status",
+        queries,
+        lambda words: search(" ".join(words), args.k, statuses=["RECRUITING"]),
+    )
+    percentiles("ILIKE", queries, lambda words: ilike(words, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Load throughput by number of shard writers.
+
+Usage (from the project root, with the DB* environment variables set):
+
+    python -m benchmarks.bench_shards --studies 20000 --shards 1,2,4,8
+
+For every shard count the schema is re-initialized and the whole corpus is
+loaded, parsing included, as `python main.py --shards N` would. One shard is
+the single-process load. Throughput stops growing once the server or the
+machine's cores are saturated. The schema is re-initialized, so point it at
+a scratch database.
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_pipeline import corpus_path
+from benchmarks.corpus import add_shape_arguments, shape_from_args
+from dbutils.helpers import init_database
+from dbutils.migrator import MigratorMixIn
+from main import load_studies
+from sharding import ShardedLoader
+
+
+def run(path: str, shards: int, chunk_size: int) -> float:
+    init_database()
+    started = time.perf_counter()
+    if shards == 1:
+        for _ in load_studies(path):
+            pass
+        MigratorMixIn.flush_all_batches()
+    else:
+        with ShardedLoader(shards, chunk_size) as sharded:
+            for _ in sharded.load(path):
+                pass
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--load-mode", default="executemany")
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--corpus-dir", default="benchmarks/.corpus")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    path = corpus_path(args.corpus_dir, args.studies, shape_from_args(args), args.seed)
+    MigratorMixIn.set_load_mode(args.load_mode)
+    baseline = None
+    for shards in map(int, args.shards.split(",")):
+        seconds = run(path, shards, args.chunk_size)
+        baseline = baseline or seconds
+        print(
+            f"{shards:>3} shards: {seconds:8.2f}s "
+            f"({args.studies / seconds:,.0f} studies/s, {baseline / seconds:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
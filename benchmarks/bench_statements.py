@@ -0,0 +1,110 @@
+"""Per-flush statement overhead before and after the statement registry.
+
+Usage (from the project root):
+
+    python -m benchmarks.bench_statements
+    python -m benchmarks.bench_statements --db   # also time flushes on a live DB
+
+The first part needs no database: it compares re-reading routines/upsert.sql
+and re-composing the statement on every flush (the old behaviour) with a
+registry lookup. With --db, it also flushes small batches of `conditions` rows
+with server-side prepared statements disabled and enabled. The schema is
+re-initialized, so point it at a scratch database.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from psycopg import sql
+
+from dbutils.helpers import (
+    execute_query,
+    init_database,
+    pooled_connection,
+    upsert_statement,
+)
+from dbutils.migrator import MigratorMixIn
+
+ROUTINES = Path(__file__).parent.parent / "dbutils" / "routines"
+
+
+def compose_every_time(table_name, columns, conflict_columns):
+    with open(ROUTINES / "upsert.sql", "r") as f:
+        query_template = sql.SQL(f.read())
+    query = query_template.format(
+        table_name=sql.Identifier(table_name),
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        values=sql.SQL(", ").join(sql.Placeholder() * len(columns)),
+        conflict_columns=sql.SQL(", ").join(map(sql.Identifier, conflict_columns)),
+        updates=sql.SQL(", ").join(
+            map(
+                lambda col: sql.SQL("{} = EXCLUDED.{}".format(col, col)),
+                columns,
+            )
+        ),
+    )
+    return query.as_string(None)
+
+
+def time_statements(build, rounds: int) -> float:
+    tables = list(MigratorMixIn.COLUMN_MAP)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for table_name in tables:
+            build(
+                table_name,
+                MigratorMixIn.COLUMN_MAP[table_name],
+                MigratorMixIn.CONFLICT_COLUMNS[table_name],
+            )
+    return (time.perf_counter() - started) / (rounds * len(tables))
+
+
+def time_flushes(prepare: bool, flushes: int, rows_per_flush: int) -> float:
+    columns = MigratorMixIn.COLUMN_MAP["conditions"]
+    query = upsert_statement("conditions", columns, ["nct_id", "name"])
+    with pooled_connection() as conn:
+        # None disables automatic preparation entirely
+        conn.prepare_threshold = 0 if prepare else None
+        conn.prepared_max = 100
+        started = time.perf_counter()
+        for flush in range(flushes):
+            rows = [
+                ["NCT00000000", f"condition {flush}-{i}"] for i in range(rows_per_flush)
+            ]
+            with conn.cursor() as cur:
+                for row in rows:
+                    cur.execute(query, row)
+            conn.commit()
+        elapsed = time.perf_counter() - started
+        conn.prepare_threshold = 5
+    return elapsed / flushes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--db", action="store_true")
+    parser.add_argument("--flushes", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=20)
+    args = parser.parse_args()
+
+    before = time_statements(compose_every_time, args.rounds)
+    after = time_statements(upsert_statement, args.rounds)
+    print(f"statement per flush, compose every time: {before * 1e6:8.1f} us")
+    print(f"statement per flush, registry lookup:    {after * 1e6:8.1f} us")
+
+    if args.db:
+        init_database()
+        execute_query(
+            "INSERT INTO identification (nct_id, brief_title) VALUES (%s, %s)",
+            ["NCT00000000", "benchmark"],
+        )
+        unprepared = time_flushes(False, args.flushes, args.rows)
+        prepared = time_flushes(True, args.flushes, args.rows)
+        print(f"flush of {args.rows} rows, unprepared: {unprepared * 1e3:8.2f} ms")
+        print(f"flush of {args.rows} rows, prepared:   {prepared * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
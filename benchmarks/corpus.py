@@ -0,0 +1,409 @@
+"""Seeded synthetic ClinicalTrials.gov studies for benchmarks.
+
+Usage (from the project root):
+
+    python -m benchmarks.corpus --studies 100000 --out corpus.json
+    python -m benchmarks.corpus --studies 1000 --locations 40 --jsonl --out big.jsonl
+
+Every study validates against ClinicalTrialStudy and produces rows for every
+table. Study `i` depends only on the seed and `i`, so a corpus of any size is
+a prefix of every larger one generated with the same seed and shape.
+"""
+
+import argparse
+import json
+import random
+from typing import Any, Dict, Iterator, List, NamedTuple
+
+_WORDS = (
+    "patients randomized placebo controlled trial efficacy safety dose "
+    "treatment therapy chronic acute disease cancer tumor diabetes asthma "
+    "hypertension infection vaccine cohort outcome response survival adverse "
+    "events baseline week month follow up primary secondary endpoint study "
+    "phase open label double blind arm group clinical hospital care quality "
+    "life pain score measure change reduction improvement risk children adults"
+).split()
+
+_COUNTRIES = (
+    ("United States", ("Boston", 42.36, -71.06), ("Houston", 29.76, -95.37)),
+    ("France", ("Paris", 48.86, 2.35), ("Lyon", 45.76, 4.84)),
+    ("Japan", ("Tokyo", 35.68, 139.69), ("Osaka", 34.69, 135.50)),
+    ("Brazil", ("Sao Paulo", -23.55, -46.63), ("Recife", -8.05, -34.88)),
+    ("Kenya", ("Nairobi", -1.29, 36.82), ("Mombasa", -4.04, 39.67)),
+)
+
+_STATUSES = ("RECRUITING", "COMPLETED", "ACTIVE_NOT_RECRUITING", "TERMINATED")
+_CLASSES = ("INDUSTRY", "NIH", "OTHER", "OTHER_GOV")
+_PHASES = ("EARLY_PHASE1", "PHASE1", "PHASE2", "PHASE3", "PHASE4")
+
+
+class CorpusShape(NamedTuple):
+    """Per-study list lengths (the exact count is drawn from 0..2x the mean)
+    and text sizes in words. With `result_measures`, every study has a
+    resultsSection reporting that many outcome measures on average."""
+
+    locations: int = 8
+    outcomes: int = 4
+    collaborators: int = 2
+    conditions: int = 3
+    interventions: int = 2
+    arm_groups: int = 2
+    contacts: int = 1
+    officials: int = 1
+    summary_words: int = 60
+    description_words: int = 300
+    eligibility_words: int = 150
+    browse_leaves: int = 2
+    references: int = 0
+    result_measures: int = 0
+
+
+def _count(rng: random.Random, mean: int) -> int:
+    return rng.randint(0, 2 * mean) if mean else 0
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(_WORDS, k=max(words, 1)))
+
+
+def _date(rng: random.Random, partial: bool = False) -> str:
+    year, month = rng.randint(2000, 2025), rng.randint(1, 12)
+    if partial:
+        return f"{year}-{month:02d}"
+    return f"{year}-{month:02d}-{rng.randint(1, 28):02d}"
+
+
+def _date_struct(rng: random.Random) -> Dict[str, str]:
+    return {
+        "date": _date(rng, rng.random() < 0.3),
+        "type": rng.choice(("ACTUAL", "ESTIMATED")),
+    }
+
+
+def generate_study(
+    i: int, shape: CorpusShape = CorpusShape(), seed: int = 0
+) -> Dict[str, Any]:
+    """The raw JSON (as a dict) of synthetic study `i`."""
+    rng = random.Random(f"{seed}:{i}")
+    nct_id = f"NCT{i:08d}"
+
+    arm_labels = [
+        f"Arm {k}: {_text(rng, 2)}" for k in range(_count(rng, shape.arm_groups))
+    ]
+    locations = []
+    for k in range(_count(rng, shape.locations)):
+        country, *cities = rng.choice(_COUNTRIES)
+        city, lat, lon = rng.choice(cities)
+        locations.append(
+            {
+                "facility": f"{_text(rng, 2).title()} Hospital {k}",
+                "status": rng.choice(_STATUSES),
+                "city": city,
+                "state": city if country == "United States" else None,
+                "zip": f"{rng.randint(10000, 99999)}",
+                "country": country,
+                "contacts": [
+                    {"name": f"Contact {k}", "role": "CONTACT", "phone": f"555-{k:04d}"}
+                ][: rng.randint(0, 1)],
+                "geoPoint": {
+                    "lat": round(lat + rng.uniform(-0.2, 0.2), 5),
+                    "lon": round(lon + rng.uniform(-0.2, 0.2), 5),
+                },
+            }
+        )
+
+    def outcomes(kind: str):
+        return [
+            {
+                "measure": f"{kind} outcome {k}: {_text(rng, 6)}",
+                "description": _text(rng, 25),
+                "timeFrame": f"{rng.randint(1, 52)} weeks",
+            }
+            for k in range(_count(rng, shape.outcomes))
+        ]
+
+    study = {
+        "protocolSection": {
+            "identificationModule": {
+                "nctId": nct_id,
+                "orgStudyIdInfo": {"id": f"ORG-{i}"},
+                "organization": {
+                    "fullName": f"{_text(rng, 2).title()} Institute",
+                    "class": rng.choice(_CLASSES),
+                },
+                "briefTitle": _text(rng, 12),
+                "officialTitle": _text(rng, 25),
+                "acronym": _text(rng, 1).upper(),
+            },
+            "statusModule": {
+                "statusVerifiedDate": _date(rng, True),
+                "overallStatus": rng.choice(_STATUSES),
+                "startDateStruct": _date_struct(rng),
+                "primaryCompletionDateStruct": _date_struct(rng),
+                "completionDateStruct": _date_struct(rng),
+                "studyFirstSubmitDate": _date(rng),
+                "studyFirstSubmitQcDate": _date(rng),
+                "studyFirstPostDateStruct": _date_struct(rng),
+                "lastUpdateSubmitDate": _date(rng),
+                "lastUpdatePostDateStruct": _date_struct(rng),
+            },
+            "sponsorCollaboratorsModule": {
+                "responsibleParty": {"type": "SPONSOR"},
+                "leadSponsor": {
+                    "name": f"Sponsor {i % 997}",
+                    "class": rng.choice(_CLASSES),
+                },
+                "collaborators": [
+                    {
+                        "name": f"Collaborator {rng.randint(0, 9999)}-{k}",
+                        "class": rng.choice(_CLASSES),
+                    }
+                    for k in range(_count(rng, shape.collaborators))
+                ],
+            },
+            "oversightModule": {
+                "oversightHasDmc": rng.random() < 0.5,
+                "isFdaRegulatedDrug": rng.random() < 0.5,
+                "isFdaRegulatedDevice": rng.random() < 0.1,
+            },
+            "descriptionModule": {
+                "briefSummary": _text(rng, shape.summary_words),
+                "detailedDescription": _text(rng, shape.description_words),
+            },
+            "conditionsModule": {
+                "conditions": [
+                    f"{_text(rng, 2).title()} {k}"
+                    for k in range(_count(rng, shape.conditions))
+                ],
+                "keywords": [_text(rng, 1) for _ in range(rng.randint(0, 5))],
+            },
+            "designModule": {
+                "studyType": "INTERVENTIONAL",
+                "phases": sorted(rng.sample(_PHASES, rng.randint(0, 2))),
+                "designInfo": {
+                    "allocation": "RANDOMIZED",
+                    "interventionModel": "PARALLEL",
+                    "primaryPurpose": "TREATMENT",
+                    "maskingInfo": {"masking": "DOUBLE"},
+                },
+                "enrollmentInfo": {"count": rng.randint(10, 5000), "type": "ACTUAL"},
+            },
+            "armsInterventionsModule": {
+                "armGroups": [
+                    {
+                        "label": label,
+                        "type": "EXPERIMENTAL",
+                        "description": _text(rng, 20),
+                    }
+                    for label in arm_labels
+                ],
+                "interventions": [
+                    {
+                        "type": "DRUG",
+                        "name": f"Drug {rng.randint(0, 9999)}-{k}",
+                        "description": _text(rng, 20),
+                        "armGroupLabels": arm_labels[:1],
+                    }
+                    for k in range(_count(rng, shape.interventions))
+                ],
+            },
+            "outcomesModule": {
+                "primaryOutcomes": outcomes("primary"),
+                "secondaryOutcomes": outcomes("secondary"),
+            },
+            "eligibilityModule": {
+                "eligibilityCriteria": _text(rng, shape.eligibility_words),
+                "healthyVolunteers": rng.random() < 0.2,
+                "sex": rng.choice(("ALL", "FEMALE", "MALE")),
+                "minimumAge": f"{rng.randint(0, 30)} Years",
+                "maximumAge": f"{rng.randint(40, 90)} Years",
+                "stdAges": ["ADULT"],
+            },
+            "contactsLocationsModule": {
+                "centralContacts": [
+                    {
+                        "name": f"Central Contact {k}",
+                        "role": "CONTACT",
+                        "phone": f"555-{rng.randint(0, 9999):04d}",
+                        "email": f"contact{k}@example.org",
+                    }
+                    for k in range(_count(rng, shape.contacts))
+                ],
+                "overallOfficials": [
+                    {
+                        "name": f"Official {k}",
+                        "affiliation": f"{_text(rng, 2).title()} University",
+                        "role": "PRINCIPAL_INVESTIGATOR",
+                    }
+                    for k in range(_count(rng, shape.officials))
+                ],
+                "locations": locations,
+            },
+        },
+        "derivedSection": {
+            "miscInfoModule": {"versionHolder": "2025-01-01"},
+            "conditionBrowseModule": {
+                "meshes": [
+                    {"id": f"D{rng.randint(0, 99999):06d}", "term": _text(rng, 2)}
+                ],
+                "browseLeaves": [
+                    {"id": f"M{k}", "name": _text(rng, 2), "relevance": "HIGH"}
+                    for k in range(_count(rng, shape.browse_leaves))
+                ],
+            },
+        },
+        "hasResults": False,
+    }
+    # Drawn last, so the rest of the study does not depend on these shapes
+    if shape.references:
+        study["protocolSection"]["referencesModule"] = {
+            "references": [
+                {
+                    "pmid": str(rng.randint(10000000, 39999999)),
+                    "type": rng.choice(("BACKGROUND", "RESULT", "DERIVED")),
+                    "citation": _text(rng, 30),
+                }
+                for _ in range(_count(rng, shape.references))
+            ]
+        }
+    if shape.result_measures:
+        study["resultsSection"] = _results(rng, arm_labels, shape.result_measures)
+        study["hasResults"] = True
+    return study
+
+
+def _results(
+    rng: random.Random, arm_labels: List[str], measures: int
+) -> Dict[str, Any]:
+    groups = [
+        {"id": f"OG{k:03d}", "title": label, "description": _text(rng, 15)}
+        for k, label in enumerate(arm_labels or ["Overall"])
+    ]
+
+    def measurements():
+        return [
+            {
+                "groupId": group["id"],
+                "value": f"{rng.uniform(0, 100):.1f}",
+                "spread": f"{rng.uniform(0, 20):.2f}",
+            }
+            for group in groups
+        ]
+
+    return {
+        "outcomeMeasuresModule": {
+            "outcomeMeasures": [
+                {
+                    "type": rng.choice(("PRIMARY", "SECONDARY")),
+                    "title": _text(rng, 8),
+                    "description": _text(rng, 30),
+                    "populationDescription": _text(rng, 20),
+                    "reportingStatus": "POSTED",
+                    "paramType": "MEAN",
+                    "dispersionType": "STANDARD_DEVIATION",
+                    "unitOfMeasure": "score on a scale",
+                    "timeFrame": f"{rng.randint(1, 52)} weeks",
+                    "groups": groups,
+                    "denoms": [
+                        {
+                            "units": "Participants",
+                            "counts": [
+                                {
+                                    "groupId": group["id"],
+                                    "value": str(rng.randint(5, 500)),
+                                }
+                                for group in groups
+                            ],
+                        }
+                    ],
+                    "classes": [
+                        {"categories": [{"measurements": measurements()}]}
+                        for _ in range(rng.randint(1, 3))
+                    ],
+                }
+                for _ in range(_count(rng, measures))
+            ]
+        },
+        "adverseEventsModule": {
+            "frequencyThreshold": "5",
+            "timeFrame": f"{rng.randint(1, 52)} weeks",
+            "eventGroups": [
+                {
+                    "id": f"EG{k:03d}",
+                    "title": group["title"],
+                    "seriousNumAffected": rng.randint(0, 20),
+                    "seriousNumAtRisk": rng.randint(20, 500),
+                }
+                for k, group in enumerate(groups)
+            ],
+            "otherEvents": [
+                {
+                    "term": _text(rng, 2),
+                    "organSystem": _text(rng, 3),
+                    "stats": [
+                        {
+                            "groupId": f"EG{k:03d}",
+                            "numEvents": rng.randint(0, 50),
+                            "numAffected": rng.randint(0, 40),
+                            "numAtRisk": rng.randint(40, 500),
+                        }
+                        for k in range(len(groups))
+                    ],
+                }
+                for _ in range(_count(rng, measures))
+            ],
+        },
+    }
+
+
+def iter_corpus(
+    n: int, shape: CorpusShape = CorpusShape(), seed: int = 0
+) -> Iterator[Dict[str, Any]]:
+    for i in range(n):
+        yield generate_study(i, shape, seed)
+
+
+def write_corpus(
+    path: str,
+    n: int,
+    shape: CorpusShape = CorpusShape(),
+    seed: int = 0,
+    jsonl: bool = False,
+) -> None:
+    """Write `n` studies as a JSON array (like the ClinicalTrials.gov export)
+    or as JSON Lines, one study at a time."""
+    with open(path, "w") as f:
+        if not jsonl:
+            f.write("[")
+        for i, study in enumerate(iter_corpus(n, shape, seed)):
+            if i and not jsonl:
+                f.write(",\n")
+            f.write(json.dumps(study))
+            if jsonl:
+                f.write("\n")
+        if not jsonl:
+            f.write("]\n")
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seed", type=int, default=0)
+    for name, default in CorpusShape._field_defaults.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+
+
+def shape_from_args(args: argparse.Namespace) -> CorpusShape:
+    return CorpusShape(**{name: getattr(args, name) for name in CorpusShape._fields})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=1000)
+    parser.add_argument("--out", default="corpus.json")
+    parser.add_argument("--jsonl", action="store_true")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+    write_corpus(args.out, args.studies, shape_from_args(args), args.seed, args.jsonl)
+
+
+if __name__ == "__main__":
+    main()
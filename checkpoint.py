@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import os
+import signal
+import time
+
+# Overrides the default of a hidden file next to the input
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH")
+
+
+def checkpoint_path(input_path: str) -> str:
+    """Where the checkpoint for `input_path` is kept."""
+    if CHECKPOINT_PATH:
+        return CHECKPOINT_PATH
+    directory, name = os.path.split(os.path.abspath(input_path))
+    return os.path.join(directory, f".{name}.argon_checkpoint.json")
+
+
+class Checkpoint:
+    """The last input position whose studies are fully committed.
+
+    Stored as a small JSON file next to the input, replaced atomically so a
+    crash while writing it leaves the previous checkpoint intact.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        offset: int = 0,
+        studies: int = 0,
+        flushed_tables: Optional[List[str]] = None,
+        input_size: Optional[int] = None,
+        input_mtime: Optional[float] = None,
+        updated_at: Optional[float] = None,
+    ):
+        self.input_path = input_path
+        self.offset = offset
+        self.studies = studies
+        self.flushed_tables = flushed_tables or []
+        self.input_size = input_size
+        self.input_mtime = input_mtime
+        self.updated_at = updated_at
+
+    @classmethod
+    def load(cls, input_path: str, path: Optional[str] = None) -> "Checkpoint":
+        """Read the checkpoint for `input_path`, refusing one that was taken
+        for another file or for a different version of the same file."""
+        path = path or checkpoint_path(input_path)
+        with open(path, "r") as f:
+            checkpoint = cls(**json.load(f))
+        stat = os.stat(input_path)
+        if (
+            os.path.abspath(checkpoint.input_path) != os.path.abspath(input_path)
+            or checkpoint.input_size != stat.st_size
+            or checkpoint.input_mtime != stat.st_mtime
+        ):
+            raise ValueError(
+                f"Checkpoint {path} was taken for a different input than {input_path}"
+            )
+        return checkpoint
+
+    def save(
+        self,
+        offset: int,
+        studies: int,
+        flushed_tables: List[str],
+        path: Optional[str] = None,
+    ) -> None:
+        path = path or checkpoint_path(self.input_path)
+        stat = os.stat(self.input_path)
+        self.offset = offset
+        self.studies = studies
+        self.flushed_tables = sorted(set(self.flushed_tables) | set(flushed_tables))
+        self.input_size = stat.st_size
+        self.input_mtime = stat.st_mtime
+        self.updated_at = time.time()
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.as_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "input_path": self.input_path,
+            "offset": self.offset,
+            "studies": self.studies,
+            "flushed_tables": self.flushed_tables,
+            "input_size": self.input_size,
+            "input_mtime": self.input_mtime,
+            "updated_at": self.updated_at,
+        }
+
+    def clear(self, path: Optional[str] = None) -> None:
+        path = path or checkpoint_path(self.input_path)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class StopRequested:
+    """Set by the first SIGINT/SIGTERM; see graceful_stop."""
+
+    def __init__(self):
+        self.signal: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return self.signal is not None
+
+
+@contextmanager
+def graceful_stop() -> Iterator[StopRequested]:
+    """Turn the first SIGINT/SIGTERM into a flag the load loop checks between
+    studies, so it can flush and checkpoint before exiting. A second signal
+    interrupts immediately."""
+    stop = StopRequested()
+    previous = {}
+
+    def handler(signum, frame):
+        if stop:
+            raise KeyboardInterrupt
+        stop.signal = signum
+        print(f"\nReceived {signal.Signals(signum).name}, flushing pending batches...")
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous[signum] = signal.signal(signum, handler)
+    try:
+        yield stop
+    finally:
+        for signum, old_handler in previous.items():
+            signal.signal(signum, old_handler)
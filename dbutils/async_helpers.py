@@ -0,0 +1,202 @@
+from psycopg import AsyncConnection
+from psycopg.pq import TransactionStatus
+from dbutils.helpers import (
+    connection_params,
+    copy_statement,
+    copy_upsert_statements,
+    delete_children_statements,
+    upsert_statement,
+)
+from dbutils.schema import child_tables
+from dbutils.metrics import METRICS
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, List, Optional
+import asyncio
+import os
+import time
+
+
+async def get_async_connection() -> AsyncConnection:
+    """Get an asyncio connection to the PostgreSQL database."""
+    return await AsyncConnection.connect(**connection_params())
+
+
+class AsyncConnectionPool:
+    """Reuses up to `max_size` AsyncConnections within one event loop.
+
+    A connection whose user was cancelled or failed mid-transaction is closed
+    rather than returned, so the server rolls back whatever was in flight.
+    """
+
+    def __init__(self, max_size: int = 4):
+        self.max_size = max_size
+        self._idle: List[AsyncConnection] = []
+        self._slots = asyncio.Semaphore(max_size)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[AsyncConnection]:
+        # Waiting for a slot and opening new connections count as "connect"
+        started = time.perf_counter()
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await get_async_connection()
+            METRICS.observe(
+                "db_seconds", time.perf_counter() - started, phase="connect"
+            )
+            reusable = False
+            try:
+                yield conn
+                reusable = (
+                    not conn.closed
+                    and conn.info.transaction_status == TransactionStatus.IDLE
+                )
+            finally:
+                if reusable:
+                    self._idle.append(conn)
+                else:
+                    await conn.close()
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._idle.pop().close()
+
+
+_ASYNC_POOL: Optional[AsyncConnectionPool] = None
+_ASYNC_POOL_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_async_pool() -> AsyncConnectionPool:
+    """The pool for the running event loop, sized by `ASYNC_MAX_CONNECTIONS`."""
+    global _ASYNC_POOL, _ASYNC_POOL_LOOP
+    loop = asyncio.get_running_loop()
+    if _ASYNC_POOL is None or _ASYNC_POOL_LOOP is not loop:
+        _ASYNC_POOL = AsyncConnectionPool(int(os.getenv("ASYNC_MAX_CONNECTIONS", "4")))
+        _ASYNC_POOL_LOOP = loop
+    return _ASYNC_POOL
+
+
+async def close_async_pool() -> None:
+    global _ASYNC_POOL, _ASYNC_POOL_LOOP
+    if _ASYNC_POOL is not None:
+        await _ASYNC_POOL.close()
+    _ASYNC_POOL = _ASYNC_POOL_LOOP = None
+
+
+async def async_batch_execute_query(query, params):
+    async with get_async_pool().connection() as conn:
+        try:
+            async with conn.cursor() as cur:
+                with METRICS.timer("db_seconds", phase="execute"):
+                    await cur.executemany(query, params)
+            with METRICS.timer("db_seconds", phase="commit"):
+                await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            raise e
+
+
+async def async_execute_query(query, params=None):
+    """Execute a query and return results."""
+    async with get_async_pool().connection() as conn:
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                result = await cur.fetchall() if cur.description else None
+            await conn.commit()
+            return result
+        except Exception as e:
+            await conn.rollback()
+            raise e
+
+
+async def async_batch_upsert(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    query = upsert_statement(table_name, columns, conflict_columns)
+    await async_batch_execute_query(query, values)
+
+
+async def async_copy_upsert(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    """Async counterpart of helpers.copy_upsert."""
+    create_query, copy_query, merge_query = copy_upsert_statements(
+        table_name, columns, conflict_columns
+    )
+
+    async with get_async_pool().connection() as conn:
+        try:
+            async with conn.cursor() as cur:
+                with METRICS.timer("db_seconds", phase="execute"):
+                    await cur.execute(create_query)
+                    async with cur.copy(copy_query) as copy:
+                        for row in values:
+                            await copy.write_row(row)
+                    await cur.execute(merge_query)
+            with METRICS.timer("db_seconds", phase="commit"):
+                await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            raise e
+
+
+async def async_copy_insert(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    """Async counterpart of helpers.copy_insert."""
+    async with get_async_pool().connection() as conn:
+        try:
+            async with conn.cursor() as cur:
+                with METRICS.timer("db_seconds", phase="execute"):
+                    async with cur.copy(copy_statement(table_name, columns)) as copy:
+                        for row in values:
+                            await copy.write_row(row)
+            with METRICS.timer("db_seconds", phase="commit"):
+                await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            raise e
+
+
+async def async_copy_replace(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    """Async counterpart of helpers.copy_replace."""
+    if table_name in child_tables():
+        await async_copy_insert(table_name, columns, values, conflict_columns)
+        return
+    create_query, copy_query, merge_query = copy_upsert_statements(
+        table_name, columns, conflict_columns
+    )
+
+    async with get_async_pool().connection() as conn:
+        try:
+            async with conn.cursor() as cur:
+                with METRICS.timer("db_seconds", phase="execute"):
+                    for delete_query, position in delete_children_statements(
+                        table_name, columns
+                    ):
+                        await cur.execute(
+                            delete_query, ([row[position] for row in values],)
+                        )
+                    await cur.execute(create_query)
+                    async with cur.copy(copy_query) as copy:
+                        for row in values:
+                            await copy.write_row(row)
+                    await cur.execute(merge_query)
+            with METRICS.timer("db_seconds", phase="commit"):
+                await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            raise e
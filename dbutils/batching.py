@@ -0,0 +1,73 @@
+from typing import Any, Dict, Iterable
+import os
+
+# Rough per-row and per-value overhead of the wire format and the Python list
+_ROW_OVERHEAD = 16
+_VALUE_OVERHEAD = 8
+
+
+def estimate_row_bytes(values: Iterable[Any]) -> int:
+    """Approximate payload of one row: the length of its text values plus a
+    fixed cost per value. Cheap enough to run on every queued row."""
+    size = _ROW_OVERHEAD
+    for value in values:
+        if isinstance(value, str):
+            size += len(value) + _VALUE_OVERHEAD
+        elif isinstance(value, (list, tuple)):
+            size += estimate_row_bytes(value)
+        else:
+            size += _VALUE_OVERHEAD
+    return size
+
+
+class BatchSizer:
+    """Per-table byte budgets that converge toward a target flush latency.
+
+    A table's queue is flushed once its estimated payload reaches the table's
+    budget. After each flush of at least half a budget, the budget is scaled
+    by target / measured latency, by at most `max_step` either way, and kept
+    within [`min_bytes`, `max_bytes`]. Tables with wide rows (identification,
+    facility) therefore flush after fewer rows than narrow ones (phases).
+    """
+
+    def __init__(
+        self,
+        target_latency: float = 0.25,
+        initial_bytes: int = 256 * 1024,
+        min_bytes: int = 16 * 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_step: float = 2.0,
+    ):
+        self.target_latency = target_latency
+        self.initial_bytes = initial_bytes
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.max_step = max_step
+        self.budgets: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "BatchSizer":
+        return cls(
+            target_latency=float(os.getenv("BATCH_TARGET_LATENCY", "0.25")),
+            initial_bytes=int(os.getenv("BATCH_INITIAL_BYTES", str(256 * 1024))),
+            min_bytes=int(os.getenv("BATCH_MIN_BYTES", str(16 * 1024))),
+            max_bytes=int(os.getenv("BATCH_MAX_BYTES", str(32 * 1024 * 1024))),
+        )
+
+    def budget(self, table_name: str) -> int:
+        return self.budgets.get(table_name, self.initial_bytes)
+
+    def record(self, table_name: str, flushed_bytes: int, seconds: float) -> int:
+        """Adapt the table's budget to a completed flush and return it.
+
+        Small flushes (end of run, checkpoints, parents flushed ahead of a
+        child) are dominated by the per-commit overhead and are ignored.
+        """
+        budget = self.budget(table_name)
+        if flushed_bytes < budget / 2 or seconds <= 0:
+            return budget
+        factor = self.target_latency / seconds
+        factor = min(max(factor, 1 / self.max_step), self.max_step)
+        budget = int(min(max(flushed_bytes * factor, self.min_bytes), self.max_bytes))
+        self.budgets[table_name] = budget
+        return budget
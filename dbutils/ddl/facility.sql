@@ -8,8 +8,12 @@ CREATE TABLE IF NOT EXISTS facility (
     zip TEXT,
     country TEXT,
     contacts JSONB,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    geo_cell TEXT COLLATE "C", -- geohash, see dbutils/geo.py
     FOREIGN KEY (nct_id) REFERENCES identification (nct_id),
     UNIQUE (nct_id, name, status, city, state, zip, country)
 );
 
-CREATE INDEX IF NOT EXISTS idx_facility_nct_id ON facility(nct_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_facility_nct_id ON facility(nct_id);
+CREATE INDEX IF NOT EXISTS idx_facility_geo_cell ON facility (geo_cell);
\ No newline at end of file
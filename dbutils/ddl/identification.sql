@@ -13,7 +13,15 @@ CREATE TABLE IF NOT EXISTS identification (
     org_class TEXT,
     brief_summary TEXT,
     detailed_description TEXT,
-    num_conditions INTEGER
+    num_conditions INTEGER,
+    -- Weighted for ts_rank, see dbutils/search.py
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(brief_title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(official_title, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(brief_summary, '')), 'C')
+        || setweight(to_tsvector('english', coalesce(detailed_description, '')), 'D')
+    ) STORED
 );
 
 CREATE INDEX IF NOT EXISTS idx_identification_org_study_id_type ON identification (org_study_id_type);
+CREATE INDEX IF NOT EXISTS idx_identification_search ON identification USING GIN (search_vector);
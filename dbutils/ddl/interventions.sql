@@ -5,9 +5,13 @@ CREATE TABLE IF NOT EXISTS interventions (
     intervention_name TEXT,
     intervention_description TEXT,
     group_label TEXT,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(intervention_name, '')), 'B')
+    ) STORED,
     FOREIGN KEY (nct_id) REFERENCES identification (nct_id),
     UNIQUE (nct_id, intervention_type, intervention_name, intervention_description, group_label)
 );
 
 CREATE INDEX IF NOT EXISTS idx_interventions_nct_id ON interventions(nct_id);
 CREATE INDEX IF NOT EXISTS idx_interventions_intervention_type ON interventions(intervention_type);
+CREATE INDEX IF NOT EXISTS idx_interventions_search ON interventions USING GIN (search_vector);
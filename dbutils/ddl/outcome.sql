@@ -5,8 +5,12 @@ CREATE TABLE IF NOT EXISTS outcome (
     measure TEXT,
     description TEXT,
     time_frame TEXT,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(measure, '')), 'C')
+    ) STORED,
     FOREIGN KEY (nct_id) REFERENCES identification (nct_id),
     UNIQUE (nct_id, type, measure, description, time_frame)
 );
 
 CREATE INDEX IF NOT EXISTS idx_outcome_nct_id ON outcome(nct_id);
+CREATE INDEX IF NOT EXISTS idx_outcome_search ON outcome USING GIN (search_vector);
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS rollup_counts (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    trials INTEGER NOT NULL,
+    PRIMARY KEY (dimension, value)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rollup_counts_trials ON rollup_counts (dimension, trials DESC);
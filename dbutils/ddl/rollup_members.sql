@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS rollup_members (
+    nct_id TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (nct_id, dimension, value)
+);
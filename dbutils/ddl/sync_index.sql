@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS sync_index (
+    nct_id TEXT PRIMARY KEY,
+    last_update_post_date DATE,
+    fingerprint TEXT NOT NULL
+);
\ No newline at end of file
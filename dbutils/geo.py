@@ -0,0 +1,183 @@
+"""Facility coordinates and the nearest recruiting sites around a point.
+
+Every facility with a geoPoint stores its latitude, longitude and geohash
+(`geo_cell`, GEOHASH_PRECISION characters, ~5 m). Facilities in one geohash
+cell share its prefix, and `geo_cell` is collated "C", so the cells around
+a point are ranges of the B-tree index on it. No extension is needed.
+nearest() scans the cells covering a circle and ranks what they hold by
+great-circle distance.
+"""
+
+from functools import lru_cache
+from math import asin, ceil, cos, log2, radians, sin, sqrt
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from dbutils.helpers import execute_query
+from dbutils.schema import interning, text_expression
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = radians(1) * EARTH_RADIUS_KM
+# Cells scanned per query; smaller cells are used as long as they fit
+_MAX_CELLS = 16
+
+
+def _spread(bits: int) -> int:
+    """Move bit i of a 32-bit int to bit 2i."""
+    bits = (bits | (bits << 16)) & 0x0000FFFF0000FFFF
+    bits = (bits | (bits << 8)) & 0x00FF00FF00FF00FF
+    bits = (bits | (bits << 4)) & 0x0F0F0F0F0F0F0F0F
+    bits = (bits | (bits << 2)) & 0x3333333333333333
+    return (bits | (bits << 1)) & 0x5555555555555555
+
+
+def geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """The geohash of a point: longitude and latitude bits interleaved,
+    longitude first, five per base32 character."""
+    bits = 5 * precision
+    lat_bits, lon_bits = bits // 2, bits - bits // 2
+    # Bisecting an interval n times is the same as quantizing to 2**n steps
+    lat_index = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    lon_index = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    if lon_bits > lat_bits:
+        code = _spread(lon_index) | _spread(lat_index) << 1
+    else:
+        code = _spread(lon_index) << 1 | _spread(lat_index)
+    return "".join(_BASE32[(code >> shift) & 31] for shift in range(bits - 5, -1, -5))
+
+
+def geo_cell(point) -> Optional[str]:
+    """The stored geohash of a models.GeoPoint, if there is one."""
+    return geohash(point.lat, point.lon) if point is not None else None
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Height and width in degrees of a geohash cell."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def _bounding_box(
+    lat: float, lon: float, radius_km: float
+) -> Tuple[float, float, float, float]:
+    dlat = radius_km / _KM_PER_DEGREE
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    # Meridians converge, so the box is widest at its edge nearest a pole
+    widest = max(abs(lat_min), abs(lat_max))
+    if widest >= 90.0 or dlat / cos(radians(widest)) >= 180.0:
+        return lat_min, lat_max, -180.0, 180.0
+    dlon = dlat / cos(radians(widest))
+    return lat_min, lat_max, lon - dlon, lon + dlon
+
+
+def _steps(start: float, stop: float, step: float) -> List[float]:
+    count = ceil((stop - start) / step)
+    return [start + i * step for i in range(count)] + [stop]
+
+
+def covering_cells(lat: float, lon: float, radius_km: float) -> List[str]:
+    """Geohash prefixes whose cells cover the circle, at the finest
+    precision that needs at most _MAX_CELLS of them. An empty prefix stands
+    for the whole world."""
+    lat_min, lat_max, lon_min, lon_max = _bounding_box(lat, lon, radius_km)
+    precision = GEOHASH_PRECISION
+    while precision:
+        height, width = cell_size(precision)
+        cells = (ceil((lat_max - lat_min) / height) + 1) * (
+            ceil((lon_max - lon_min) / width) + 1
+        )
+        if cells <= _MAX_CELLS:
+            break
+        # Each step down makes cells 4 to 8 times larger
+        precision -= max(1, int(log2(cells / _MAX_CELLS) / 5))
+    if precision <= 0:
+        return [""]
+    height, width = cell_size(precision)
+    prefixes: Set[str] = set()
+    for cell_lat in _steps(lat_min, lat_max, height):
+        for cell_lon in _steps(lon_min, lon_max, width):
+            # Boxes that cross the antimeridian continue on the other side
+            wrapped = (cell_lon + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash(cell_lat, wrapped, precision))
+    return sorted(prefixes)
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance between two points."""
+    a = (
+        sin(radians(lat2 - lat1) / 2) ** 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0)))
+
+
+class NearbySite(NamedTuple):
+    nct_id: str
+    brief_title: Optional[str]
+    overall_status: Optional[str]
+    facility: Optional[str]
+    city: Optional[str]
+    state: Optional[str]
+    country: Optional[str]
+    latitude: float
+    longitude: float
+    distance_km: float
+
+
+@lru_cache(maxsize=None)
+def _nearest_statement(interned: bool) -> str:
+    columns = ", ".join(
+        [
+            "f.nct_id",
+            "i.brief_title",
+            text_expression("s", "status", "overall_status", interned),
+            text_expression("f", "facility", "name", interned),
+            text_expression("f", "facility", "city", interned),
+            "f.state",
+            text_expression("f", "facility", "country", interned),
+        ]
+    )
+    # The cells are index ranges; the haversine distance is only computed
+    # for the facilities in them.
+    return (
+        f"SELECT {columns}, f.latitude, f.longitude, distance.km "
+        "FROM unnest(%(low)s::text[], %(high)s::text[]) AS c (low, high) "
+        'JOIN facility f ON f.geo_cell >= c.low COLLATE "C" '
+        'AND f.geo_cell < c.high COLLATE "C" '
+        f"CROSS JOIN LATERAL (SELECT {2 * EARTH_RADIUS_KM} * asin(least(1, sqrt("
+        "power(sin(radians(f.latitude - %(lat)s) / 2), 2) "
+        "+ cos(radians(%(lat)s)) * cos(radians(f.latitude)) "
+        "* power(sin(radians(f.longitude - %(lon)s) / 2), 2)))) AS km) distance "
+        "JOIN identification i ON i.nct_id = f.nct_id "
+        "LEFT JOIN status s ON s.nct_id = f.nct_id "
+        "WHERE f.status = ANY(%(statuses)s) AND distance.km <= %(within)s "
+        "ORDER BY distance.km LIMIT %(k)s"
+    )
+
+
+def nearest(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    k: int = 10,
+    statuses: Iterable[str] = ("RECRUITING",),
+) -> List[NearbySite]:
+    """The `k` facilities closest to (lat, lon), within `radius_km`, whose
+    site status is one of `statuses`, nearest first."""
+    cells = covering_cells(lat, lon, radius_km)
+    rows = execute_query(
+        _nearest_statement(interning()),
+        {
+            "low": cells,
+            # "~" sorts after every geohash character
+            "high": [cell + "~" for cell in cells],
+            "lat": lat,
+            "lon": lon,
+            "within": radius_km,
+            "statuses": list(statuses),
+            "k": k,
+        },
+        prepare=True,
+    )
+    return [NearbySite(*row) for row in rows]
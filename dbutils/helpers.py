@@ -1,27 +1,151 @@
 from psycopg import sql, connect
+from dbutils.metrics import METRICS
+from dbutils.pool import get_pool, close_pool
+from dbutils.schema import (
+    HASH_COLUMN,
+    HASHED_KEY_TABLES,
+    INTERNED_COLUMNS,
+    child_references,
+    child_tables,
+    clause_columns,
+    read_ddl,
+    referenced_columns,
+    serial_columns,
+    split_ddl,
+    table_order,
+)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import atexit
 import os
 
 
-def upsert(
-    table_name: str, columns: list[str], values: list[str], conflict_columns: list[str]
-):
-    with open(Path(__file__).parent / "routines" / "upsert.sql", "r") as f:
-        query_template = sql.SQL(f.read())
-    query = query_template.format(
+@lru_cache(maxsize=None)
+def read_routine(name: str) -> str:
+    """Contents of `routines/<name>.sql`, read from disk once per process."""
+    with open(Path(__file__).parent / "routines" / f"{name}.sql", "r") as f:
+        return f.read()
+
+
+def _updates(columns: Iterable[str]) -> sql.Composable:
+    return sql.SQL(", ").join(
+        map(
+            lambda col: sql.SQL("{} = EXCLUDED.{}".format(col, col)),
+            columns,
+        )
+    )
+
+
+# The statement registry: every statement below is composed and rendered to
+# SQL text once per (table, columns, conflict columns) and reused for the
+# lifetime of the process. Because the text is identical on every call,
+# psycopg reuses the server-side prepared statement on pooled connections.
+@lru_cache(maxsize=None)
+def _upsert_statement(
+    table_name: str, columns: Tuple[str, ...], conflict_columns: Tuple[str, ...]
+) -> str:
+    query = sql.SQL(read_routine("upsert")).format(
         table_name=sql.Identifier(table_name),
         columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
-        values=sql.SQL(", ").join(map(sql.Literal, values)),
+        values=sql.SQL(", ").join(sql.Placeholder() * len(columns)),
         conflict_columns=sql.SQL(", ").join(map(sql.Identifier, conflict_columns)),
-        updates=sql.SQL(", ").join(
-            map(
-                lambda col: sql.SQL("{} = EXCLUDED.{}".format(col, col)),
-                columns,
-            )
-        ),
+        updates=_updates(columns),
     )
-    execute_query(query)
+    return query.as_string(None)
+
+
+def upsert_statement(
+    table_name: str, columns: List[str], conflict_columns: List[str]
+) -> str:
+    """The upsert template with one placeholder per column."""
+    return _upsert_statement(table_name, tuple(columns), tuple(conflict_columns))
+
+
+@lru_cache(maxsize=None)
+def _copy_upsert_statements(
+    table_name: str, columns: Tuple[str, ...], conflict_columns: Tuple[str, ...]
+) -> Tuple[str, str, str]:
+    staging_name = sql.Identifier(f"staging_{table_name}")
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    conflict_list = sql.SQL(", ").join(map(sql.Identifier, conflict_columns))
+
+    create_query = sql.SQL(read_routine("create_staging")).format(
+        staging_name=staging_name,
+        table_name=sql.Identifier(table_name),
+        columns=column_list,
+    )
+    copy_query = sql.SQL("COPY {staging_name} ({columns}) FROM STDIN").format(
+        staging_name=staging_name, columns=column_list
+    )
+    merge_query = sql.SQL(read_routine("merge_staging")).format(
+        table_name=sql.Identifier(table_name),
+        staging_name=staging_name,
+        columns=column_list,
+        conflict_columns=conflict_list,
+        updates=_updates(columns),
+    )
+    return (
+        create_query.as_string(None),
+        copy_query.as_string(None),
+        merge_query.as_string(None),
+    )
+
+
+def copy_upsert_statements(
+    table_name: str, columns: List[str], conflict_columns: List[str]
+) -> Tuple[str, str, str]:
+    """The create-staging, COPY and merge statements used by copy_upsert."""
+    return _copy_upsert_statements(table_name, tuple(columns), tuple(conflict_columns))
+
+
+@lru_cache(maxsize=None)
+def _copy_statement(table_name: str, columns: Tuple[str, ...]) -> str:
+    return (
+        sql.SQL("COPY {table_name} ({columns}) FROM STDIN")
+        .format(
+            table_name=sql.Identifier(table_name),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        )
+        .as_string(None)
+    )
+
+
+def copy_statement(table_name: str, columns: List[str]) -> str:
+    """COPY ... FROM STDIN into the target table itself."""
+    return _copy_statement(table_name, tuple(columns))
+
+
+@lru_cache(maxsize=None)
+def _delete_children_statements(
+    table_name: str, columns: Tuple[str, ...]
+) -> Tuple[Tuple[str, int], ...]:
+    return tuple(
+        (
+            sql.SQL("DELETE FROM {child} WHERE {column} = ANY(%s)")
+            .format(child=sql.Identifier(child), column=sql.Identifier(column))
+            .as_string(None),
+            columns.index(referenced),
+        )
+        for child, column, referenced in child_references(table_name)
+    )
+
+
+def delete_children_statements(
+    table_name: str, columns: List[str]
+) -> Tuple[Tuple[str, int], ...]:
+    """(DELETE statement, position of the referenced column in a row) for
+    every child table (see schema.child_tables) referencing `table_name`."""
+    return _delete_children_statements(table_name, tuple(columns))
+
+
+def upsert(
+    table_name: str, columns: list[str], values: list[str], conflict_columns: list[str]
+):
+    query = upsert_statement(table_name, columns, conflict_columns)
+    execute_query(query, values, prepare=True)
 
 
 def batch_upsert(
@@ -30,72 +154,347 @@ def batch_upsert(
     values: Iterable[Iterable[str]],
     conflict_columns: List[str],
 ):
-    with open(Path(__file__).parent / "routines" / "upsert.sql", "r") as f:
-        query_template = sql.SQL(f.read())
-    query = query_template.format(
-        table_name=sql.Identifier(table_name),
-        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
-        values=sql.SQL(", ").join(sql.Placeholder() * len(columns)),
-        conflict_columns=sql.SQL(", ").join(map(sql.Identifier, conflict_columns)),
-        updates=sql.SQL(", ").join(
-            map(
-                lambda col: sql.SQL("{} = EXCLUDED.{}".format(col, col)),
-                columns,
-            )
-        ),
-    )
+    query = upsert_statement(table_name, columns, conflict_columns)
     batch_execute_query(query, values)
 
 
+def copy_upsert(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    """Upsert rows by streaming them with COPY into a temporary staging table
+    and merging that into the target with a single INSERT ... ON CONFLICT.
+
+    Rows sharing a conflict key within the batch are collapsed to the last one,
+    which is what the row-by-row upsert ends up storing as well.
+    """
+    create_query, copy_query, merge_query = copy_upsert_statements(
+        table_name, columns, conflict_columns
+    )
+
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor() as cur, METRICS.timer("db_seconds", phase="execute"):
+                cur.execute(create_query)
+                with cur.copy(copy_query) as copy:
+                    for row in values:
+                        copy.write_row(row)
+                cur.execute(merge_query)
+            with METRICS.timer("db_seconds", phase="commit"):
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
+def copy_insert(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    """Append rows with COPY straight into the table, without conflict handling.
+
+    Used by the bulk load mode, where the tables have no keys yet;
+    `conflict_columns` is accepted only to match the other writers.
+    """
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor() as cur, METRICS.timer("db_seconds", phase="execute"):
+                with cur.copy(copy_statement(table_name, columns)) as copy:
+                    for row in values:
+                        copy.write_row(row)
+            with METRICS.timer("db_seconds", phase="commit"):
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
+def copy_replace(
+    table_name: str,
+    columns: List[str],
+    values: Iterable[Iterable[str]],
+    conflict_columns: List[str],
+):
+    """Write a batch in the replace load mode.
+
+    Child tables (see schema.child_tables) are appended to with copy_insert.
+    Other tables are upserted as in copy_upsert, and in the same transaction
+    every child row referencing the batch is deleted first. Children are only flushed after
+    the tables they reference (see MigratorMixIn._flush_batch), so a study's
+    new child rows replace the old ones instead of piling up next to them.
+    """
+    if table_name in child_tables():
+        copy_insert(table_name, columns, values, conflict_columns)
+        return
+    create_query, copy_query, merge_query = copy_upsert_statements(
+        table_name, columns, conflict_columns
+    )
+
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor() as cur, METRICS.timer("db_seconds", phase="execute"):
+                for delete_query, position in delete_children_statements(
+                    table_name, columns
+                ):
+                    cur.execute(delete_query, ([row[position] for row in values],))
+                cur.execute(create_query)
+                with cur.copy(copy_query) as copy:
+                    for row in values:
+                        copy.write_row(row)
+                cur.execute(merge_query)
+            with METRICS.timer("db_seconds", phase="commit"):
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
 def drop(table_name: str):
-    with open(Path(__file__).parent / "routines" / "drop.sql", "r") as f:
-        query_template = sql.SQL(f.read())
-    query = query_template.format(
+    query = sql.SQL(read_routine("drop")).format(
         table_name=sql.Identifier(table_name),
     )
     execute_query(query)
 
 
-def init_database():
-    """Initialize the database with all schema files."""
-
-    # Get all SQL files in order (identification must be first due to foreign keys)
-    table_names = [
-        "identification",  # Must be first for foreign key references
-        "status",
-        "conditions",
-        "collaborators",
-        "oversight",
-        "design",
-        "phases",
-        "eligibility",
-        "groups",
-        "interventions",
-        "outcome",
-        "facility",
-        "contact",
-        "officials",
-    ]
+def init_database(bulk: bool = False):
+    """Initialize the database with all schema files.
+
+    With `bulk=True` only the bare tables are created: keys, foreign keys and
+    indexes are left for finalize_database once the data is loaded.
+    """
+
+    # Referenced tables come first so foreign keys can be created
+    table_names = table_order()
 
     try:
         # Execute each SQL file
-        for table_name in table_names:
+        for table_name in reversed(table_names):
             drop(table_name)
 
         for table_name in table_names:
-            file_path = Path(__file__).parent / "ddl" / f"{table_name}.sql"
-            with open(file_path, "r") as f:
-                sql = f.read()
-                execute_query(sql)
+            if bulk:
+                execute_query(split_ddl(table_name).create_table)
+            else:
+                execute_query(read_ddl(table_name))
 
         print("Database schema initialized successfully!")
     except Exception as e:
         print(f"Error initializing database: {e}")
+    finally:
+        # dbutils.interning imports this module, hence the late import
+        from dbutils.interning import clear_intern_caches
 
+        # The ids cached for the dropped dimension tables no longer exist
+        clear_intern_caches()
 
-def get_connection():
-    """Get a connection to the PostgreSQL database."""
-    return connect(
+
+def existing_key_mode() -> Optional[str]:
+    """The key mode (see dbutils.schema.KEY_MODES) the existing tables were
+    created in, or None if they do not exist."""
+    columns = execute_query(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s",
+        (HASHED_KEY_TABLES[0],),
+    )
+    if not columns:
+        return None
+    return "hashed" if (HASH_COLUMN,) in columns else "columns"
+
+
+def existing_interning() -> Optional[bool]:
+    """Whether the existing tables were created with interned columns (see
+    dbutils.schema.set_interning), or None if they do not exist."""
+    table_name, columns = next(iter(INTERNED_COLUMNS.items()))
+    data_type = execute_query(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() "
+        "AND table_name = %s AND column_name = %s",
+        (table_name, next(iter(columns))),
+    )
+    if not data_type:
+        return None
+    return data_type[0][0] == "integer"
+
+
+def _not_null(columns: List[str]) -> sql.Composable:
+    return sql.SQL(" AND ").join(
+        sql.SQL("{} IS NOT NULL").format(sql.Identifier(column)) for column in columns
+    )
+
+
+def _check_keys(conn, table_name: str, repair: bool) -> Dict[str, int]:
+    """Count (and optionally delete) rows that would violate the table's keys.
+
+    Only rows without NULLs in the key can collide, matching UNIQUE semantics.
+    When repairing, the most recently loaded row of each key is kept, which is
+    the row an upsert would have left behind.
+    """
+    report = {"duplicate_keys": 0, "duplicate_rows": 0}
+    serials = serial_columns(table_name)
+    for key in split_ddl(table_name).keys:
+        columns = clause_columns(key)
+        if set(columns) <= serials:
+            continue
+        params = dict(
+            table_name=sql.Identifier(table_name),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            not_null=_not_null(columns),
+        )
+        keys, rows = conn.execute(
+            sql.SQL(
+                "SELECT count(*), coalesce(sum(n - 1), 0) FROM ("
+                "SELECT count(*) AS n FROM {table_name} WHERE {not_null} "
+                "GROUP BY {columns} HAVING count(*) > 1) AS d"
+            ).format(**params)
+        ).fetchone()
+        report["duplicate_keys"] += keys
+        report["duplicate_rows"] += rows
+        if rows and repair:
+            conn.execute(
+                sql.SQL(
+                    "DELETE FROM {table_name} WHERE ctid IN ("
+                    "SELECT ctid FROM (SELECT ctid, row_number() OVER "
+                    "(PARTITION BY {columns} ORDER BY ctid DESC) AS rn "
+                    "FROM {table_name} WHERE {not_null}) AS d WHERE rn > 1)"
+                ).format(**params)
+            )
+    return report
+
+
+def _check_foreign_keys(conn, table_name: str, repair: bool) -> Dict[str, int]:
+    """Count (and optionally delete) rows whose parent row does not exist."""
+    report = {"orphan_rows": 0}
+    for foreign_key in split_ddl(table_name).foreign_keys:
+        columns = clause_columns(foreign_key)
+        parent, parent_columns = referenced_columns(foreign_key)
+        condition = sql.SQL(
+            "{not_null} AND NOT EXISTS (SELECT 1 FROM {parent} AS p WHERE {join})"
+        ).format(
+            not_null=_not_null(columns),
+            parent=sql.Identifier(parent),
+            join=sql.SQL(" AND ").join(
+                sql.SQL("p.{} = c.{}").format(sql.Identifier(p), sql.Identifier(c))
+                for p, c in zip(parent_columns, columns)
+            ),
+        )
+        orphans = conn.execute(
+            sql.SQL("SELECT count(*) FROM {table_name} AS c WHERE {condition}").format(
+                table_name=sql.Identifier(table_name), condition=condition
+            )
+        ).fetchone()[0]
+        report["orphan_rows"] += orphans
+        if orphans and repair:
+            conn.execute(
+                sql.SQL("DELETE FROM {table_name} AS c WHERE {condition}").format(
+                    table_name=sql.Identifier(table_name), condition=condition
+                )
+            )
+    return report
+
+
+def _ddl_connection():
+    conn = connect(**connection_params(), autocommit=True)
+    maintenance_work_mem = os.getenv("BULK_MAINTENANCE_WORK_MEM")
+    if maintenance_work_mem:
+        conn.execute(
+            sql.SQL("SET maintenance_work_mem = {}").format(
+                sql.Literal(maintenance_work_mem)
+            )
+        )
+    return conn
+
+
+def _run_check(check, table_name: str, repair: bool) -> Dict[str, int]:
+    with _ddl_connection() as conn:
+        return check(conn, table_name, repair)
+
+
+def _add_keys(table_name: str) -> None:
+    with _ddl_connection() as conn:
+        for key in split_ddl(table_name).keys:
+            conn.execute(
+                sql.SQL("ALTER TABLE {} ADD ").format(sql.Identifier(table_name))
+                + sql.SQL(key)
+            )
+
+
+def _add_foreign_keys_and_indexes(table_name: str) -> None:
+    table = split_ddl(table_name)
+    with _ddl_connection() as conn:
+        for i, foreign_key in enumerate(table.foreign_keys):
+            # NOT VALID + VALIDATE only holds a brief lock on the parent table,
+            # so children referencing the same parent can be validated in parallel
+            name = sql.Identifier(f"{table_name}_fkey_{i}")
+            conn.execute(
+                sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                    sql.Identifier(table_name), name
+                )
+                + sql.SQL(foreign_key)
+                + sql.SQL(" NOT VALID")
+            )
+            conn.execute(
+                sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(
+                    sql.Identifier(table_name), name
+                )
+            )
+        for index in table.indexes:
+            conn.execute(index)
+        conn.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table_name)))
+
+
+def finalize_database(
+    parallel: int = 1, repair: bool = True
+) -> Dict[str, Dict[str, int]]:
+    """Add the keys, foreign keys and indexes deferred by init_database(bulk=True).
+
+    Tables are processed on `parallel` connections at a time: first every
+    primary key and unique constraint, then every foreign key and secondary
+    index. Before each step the rows that would violate it are counted and,
+    with `repair=True`, deleted. Returns those counts per table; without
+    `repair`, any violation raises once the report has been printed.
+    """
+    table_names = table_order()
+    report = {table_name: {} for table_name in table_names}
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        for check, add in (
+            (_check_keys, _add_keys),
+            (_check_foreign_keys, _add_foreign_keys_and_indexes),
+        ):
+            results = executor.map(
+                lambda table_name: _run_check(check, table_name, repair), table_names
+            )
+            for table_name, result in zip(table_names, results):
+                report[table_name].update(result)
+            if not repair and any(any(c.values()) for c in report.values()):
+                _print_validation_report(report)
+                raise RuntimeError("Bulk-loaded data violates the schema constraints")
+            list(executor.map(add, table_names))
+
+    _print_validation_report(report)
+    return report
+
+
+def _print_validation_report(report: Dict[str, Dict[str, int]]) -> None:
+    problems = {t: c for t, c in report.items() if any(c.values())}
+    if not problems:
+        print("Constraint validation: no duplicate or orphan rows found")
+        return
+    print("Constraint validation found:")
+    for table_name, counts in problems.items():
+        details = ", ".join(
+            f"{name}={count}" for name, count in counts.items() if count
+        )
+        print(f"  {table_name}: {details}")
+
+
+def connection_params() -> Dict[str, str]:
+    """Connection settings read from the DB* environment variables."""
+    return dict(
         dbname=os.getenv("DBNAME", "argon_db"),
         user=os.getenv("DBUSER", "argon_user"),
         password=os.getenv("DBPASSWORD", "somepassword"),
@@ -104,34 +503,74 @@ def get_connection():
     )
 
 
-def batch_execute_query(query, params, batch_size=100):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            for i in range(0, len(params), batch_size):
-                batch = params[i : (i + batch_size)]
-                cur.executemany(query, batch)
-            conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+def get_connection():
+    """Get a connection to the PostgreSQL database."""
+    return connect(**connection_params())
 
 
-def execute_query(query, params=None):
-    """Execute a query and return results."""
-    conn = get_connection()
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the process-wide pool.
+
+    Pool sizing is read from `DBPOOL_MIN_SIZE` (default: 1), `DBPOOL_MAX_SIZE`
+    (default: 4), `DBPOOL_TIMEOUT`, `DBPOOL_MAX_LIFETIME` and
+    `DBPOOL_CHECK_INTERVAL` (seconds).
+    """
+    pool = get_pool(get_connection)
+    # Waiting for a free connection and opening new ones count as "connect"
+    with METRICS.timer("db_seconds", phase="connect"):
+        conn = pool.getconn()
     try:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            if cur.description:
-                return cur.fetchall()
-            conn.commit()
-            return None
-    except Exception as e:
-        conn.rollback()
-        print(query.as_string())
-        raise e
+        yield conn
     finally:
-        conn.close()
+        pool.putconn(conn)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Checkouts, waits and connection ages for the process-wide pool."""
+    return get_pool(get_connection).get_stats()
+
+
+atexit.register(close_pool)
+
+
+def batch_execute_query(query, params, batch_size=None):
+    """Run `query` for every row of `params` in one transaction.
+
+    The batch queues already size each flush by payload, so by default all
+    rows go to a single executemany; `batch_size` splits them into chunks.
+    """
+    batch_size = batch_size or max(len(params), 1)
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                with METRICS.timer("db_seconds", phase="execute"):
+                    for i in range(0, len(params), batch_size):
+                        batch = params[i : (i + batch_size)]
+                        cur.executemany(query, batch)
+                with METRICS.timer("db_seconds", phase="commit"):
+                    conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
+def execute_query(query, params=None, prepare=None):
+    """Execute a query and return results.
+
+    `prepare=True` makes the server parse and plan the statement once per
+    connection and reuse that plan on later calls with the same SQL text.
+    """
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                with METRICS.timer("db_seconds", phase="execute"):
+                    cur.execute(query, params, prepare=prepare)
+                    result = cur.fetchall() if cur.description else None
+                with METRICS.timer("db_seconds", phase="commit"):
+                    conn.commit()
+                return result
+        except Exception as e:
+            conn.rollback()
+            print(query.as_string() if isinstance(query, sql.Composable) else query)
+            raise e
@@ -0,0 +1,135 @@
+"""Surrogate ids for the values of schema.INTERNED_COLUMNS.
+
+With interning enabled (see schema.set_interning), those columns hold the id
+of their value in a dimension table, `(id SERIAL, value TEXT UNIQUE)`. Rows
+are queued with the text. When a batch is taken from its queue, the ids of
+values seen before come from an in-process cache per dimension, and the
+others are looked up or inserted with one statement per dimension.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import os
+
+from psycopg import sql
+
+from dbutils.helpers import execute_query
+from dbutils.metrics import METRICS
+from dbutils.schema import INTERNED_COLUMNS, interning
+
+# Values cached per dimension; the least recently used are evicted first
+INTERN_CACHE_SIZE = int(os.getenv("INTERN_CACHE_SIZE", "100000"))
+
+
+class InternCache:
+    """Value to id of one dimension table, holding at most `max_size`
+    values and evicting the least recently used."""
+
+    __slots__ = ("max_size", "_ids")
+
+    def __init__(self, max_size: int = INTERN_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, value: str) -> Optional[int]:
+        id_ = self._ids.get(value)
+        if id_ is not None:
+            self._ids.move_to_end(value)
+        return id_
+
+    def put(self, value: str, id_: int) -> None:
+        self._ids[value] = id_
+        self._ids.move_to_end(value)
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+
+_CACHES: Dict[str, InternCache] = {}
+
+
+def intern_cache(dimension: str) -> InternCache:
+    if dimension not in _CACHES:
+        _CACHES[dimension] = InternCache()
+    return _CACHES[dimension]
+
+
+def clear_intern_caches() -> None:
+    """Forget every cached id, e.g. once the dimension tables are recreated."""
+    _CACHES.clear()
+
+
+@lru_cache(maxsize=None)
+def _resolve_statement(dimension: str) -> str:
+    # Rows inserted by the CTE are not visible to the join in the same
+    # statement, so every value is returned exactly once by one of the two.
+    return (
+        sql.SQL(
+            "WITH v (value) AS (SELECT DISTINCT unnest(%s::text[])), "
+            "inserted AS (INSERT INTO {dimension} (value) SELECT value FROM v "
+            "ON CONFLICT (value) DO NOTHING RETURNING id, value) "
+            "SELECT id, value FROM inserted "
+            "UNION ALL SELECT d.id, d.value FROM {dimension} d JOIN v USING (value)"
+        )
+        .format(dimension=sql.Identifier(dimension))
+        .as_string(None)
+    )
+
+
+def resolve(dimension: str, values: Iterable[str]) -> Dict[str, int]:
+    """Ids of `values`, inserting those the dimension table does not have."""
+    ids: Dict[str, int] = {}
+    missing = list(values)
+    while missing:
+        for id_, value in execute_query(_resolve_statement(dimension), (missing,)):
+            ids[value] = id_
+        # A value another writer (e.g. a shard) inserted but had not yet
+        # committed is skipped by ON CONFLICT and invisible to the join; the
+        # next statement sees it.
+        missing = [value for value in missing if value not in ids]
+    return ids
+
+
+@lru_cache(maxsize=None)
+def _interned_positions(
+    table_name: str, columns: Tuple[str, ...]
+) -> Tuple[Tuple[int, str], ...]:
+    return tuple(
+        (columns.index(column), dimension)
+        for column, dimension in INTERNED_COLUMNS.get(table_name, {}).items()
+    )
+
+
+def intern_rows(
+    table_name: str, columns: Sequence[str], rows: List[Sequence[Any]]
+) -> List[Sequence[Any]]:
+    """Copies of the rows with the text of their interned columns replaced by
+    ids. NULLs are left alone."""
+    positions = _interned_positions(table_name, tuple(columns))
+    if not positions or not interning():
+        return rows
+    rows = [list(row) for row in rows]
+    for position, dimension in positions:
+        cache = intern_cache(dimension)
+        missing: Set[str] = set()
+        for row in rows:
+            value = row[position]
+            if type(value) is str:
+                id_ = cache.get(value)
+                if id_ is None:
+                    missing.add(value)
+                else:
+                    row[position] = id_
+        if not missing:
+            continue
+        ids = resolve(dimension, missing)
+        for value, id_ in ids.items():
+            cache.put(value, id_)
+        for row in rows:
+            if type(row[position]) is str:
+                row[position] = ids[row[position]]
+        METRICS.inc("intern_misses", len(missing), dimension=dimension)
+    return rows
@@ -0,0 +1,382 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+# Upper bounds in seconds; wide enough for a single parse and a large COPY
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+_HELP = {
+    "studies": "Studies processed",
+    "rows_queued": "Rows added to the batch queue",
+    "rows_flushed": "Rows written to the database",
+    "rows_deduplicated": "Queued rows replaced by a later row with the same key",
+    "intern_misses": "Values resolved against a dimension table, not the intern cache",
+    "bytes_flushed": "Estimated payload written to the database",
+    "flushes": "Batches written to the database",
+    "flush_errors": "Batches that failed to be written",
+    "flush_seconds": "Time to write one batch, including its commit",
+    "db_seconds": "Time spent per database phase (connect, execute, commit)",
+    "parse_seconds": "Time to validate one study with model_validate",
+    "queue_depth": "Rows currently waiting in the batch queue",
+    "queue_bytes": "Estimated payload of all batch queues",
+    "batch_budget_bytes": "Payload at which a table's queue is flushed",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum and maximum."""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, capped at the
+        largest observation."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsSink(ABC):
+    """Receives the registry on every export; see MetricsRegistry.export."""
+
+    @abstractmethod
+    def export(self, registry: "MetricsRegistry", final: bool) -> None:
+        """Write the registry out; `final` is set for the last export of a run."""
+
+
+def _write_atomically(path: str, content: str) -> None:
+    # Readers (node_exporter, dashboards) never see a partially written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class PrometheusTextfileSink(MetricsSink):
+    """Writes the Prometheus text format to `path`, for node_exporter's
+    textfile collector. The file is rewritten on every export."""
+
+    def __init__(self, path: str, prefix: str = "argon_"):
+        self.path = path
+        self.prefix = prefix
+
+    def render(self, registry: "MetricsRegistry") -> str:
+        counters, gauges, histograms = registry.collect()
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> str:
+            full_name = self.prefix + name
+            help_text = _HELP.get(name.removesuffix("_total"), name)
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        for name in sorted(counters):
+            full_name = header(name + "_total", "counter")
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for name in sorted(gauges):
+            full_name = header(name, "gauge")
+            for labels, value in sorted(gauges[name].items()):
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for name in sorted(histograms):
+            full_name = header(name, "histogram")
+            for labels, histogram in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = _format_labels(labels, ("le", repr(bound)))
+                    lines.append(f"{full_name}_bucket{le} {cumulative}")
+                le = _format_labels(labels, ("le", "+Inf"))
+                lines.append(f"{full_name}_bucket{le} {histogram.count}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(
+                    f"{full_name}_count{_format_labels(labels)} {histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def export(self, registry: "MetricsRegistry", final: bool) -> None:
+        _write_atomically(self.path, self.render(registry))
+
+
+class JsonSummarySink(MetricsSink):
+    """Writes MetricsRegistry.summary() as JSON once the run is over, to
+    `path` or to stdout for "-"."""
+
+    def __init__(self, path: str = "-"):
+        self.path = path
+
+    def export(self, registry: "MetricsRegistry", final: bool) -> None:
+        if not final:
+            return
+        content = json.dumps(registry.summary(), indent=2)
+        if self.path == "-":
+            print(content)
+        else:
+            _write_atomically(self.path, content + "\n")
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms keyed by name and labels.
+
+    All updates take a lock, so writer threads (e.g. finalize_database) can
+    record alongside the main thread. Sinks are called by export(), which
+    load loops call through maybe_export() at most every `export_interval`
+    seconds and once more at the end of the run.
+    """
+
+    def __init__(
+        self,
+        export_interval: float = 10.0,
+        sample_interval: float = 1.0,
+        max_samples: int = 3600,
+    ):
+        self.export_interval = export_interval
+        self.sample_interval = sample_interval
+        self.sinks: List[MetricsSink] = []
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters: Dict[str, Dict[Labels, float]] = {}
+            self._gauges: Dict[str, Dict[Labels, float]] = {}
+            self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+            # (seconds since start, {table: depth}), see sample_queue_depths
+            self._samples: Deque[Tuple[float, Dict[str, int]]] = deque(
+                maxlen=self._max_samples
+            )
+            self._started = time.monotonic()
+            self._last_export = self._last_sample = self._started
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def sample_queue_depths(self, depths: Dict[str, int]) -> None:
+        """Record the depth of every queue, keeping one sample per
+        `sample_interval` for the summary's time series."""
+        for table_name, depth in depths.items():
+            self.set("queue_depth", depth, table=table_name)
+        now = time.monotonic()
+        if now - self._last_sample >= self.sample_interval:
+            with self._lock:
+                self._last_sample = now
+                self._samples.append((round(now - self._started, 3), dict(depths)))
+
+    def add_sink(self, sink: MetricsSink) -> None:
+        self.sinks.append(sink)
+
+    def export(self, final: bool = False) -> None:
+        self._last_export = time.monotonic()
+        for sink in self.sinks:
+            sink.export(self, final)
+
+    def maybe_export(self) -> None:
+        if self.sinks and time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def collect(
+        self,
+    ) -> Tuple[
+        Dict[str, Dict[Labels, float]],
+        Dict[str, Dict[Labels, float]],
+        Dict[str, Dict[Labels, Histogram]],
+    ]:
+        """A consistent copy of every series, for sinks."""
+        with self._lock:
+            counters = {name: dict(s) for name, s in self._counters.items()}
+            gauges = {name: dict(s) for name, s in self._gauges.items()}
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = {}
+                for labels, histogram in series.items():
+                    copy = Histogram(histogram.buckets)
+                    copy.counts = list(histogram.counts)
+                    copy.count, copy.sum, copy.max = (
+                        histogram.count,
+                        histogram.sum,
+                        histogram.max,
+                    )
+                    histograms[name][labels] = copy
+        return counters, gauges, histograms
+
+    def merge(
+        self,
+        counters: Dict[str, Dict[Labels, float]],
+        histograms: Dict[str, Dict[Labels, Histogram]],
+    ) -> None:
+        """Add counters and histograms collected in another process, such as
+        a shard writer (see collect)."""
+        with self._lock:
+            for name, series in counters.items():
+                mine = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    mine[key] = mine.get(key, 0) + value
+            for name, series in histograms.items():
+                mine = self._histograms.setdefault(name, {})
+                for key, other in series.items():
+                    histogram = mine.setdefault(key, Histogram(other.buckets))
+                    histogram.counts = [
+                        a + b for a, b in zip(histogram.counts, other.counts)
+                    ]
+                    histogram.count += other.count
+                    histogram.sum += other.sum
+                    histogram.max = max(histogram.max, other.max)
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals per table and per database phase, in plain JSON types."""
+        counters, gauges, histograms = self.collect()
+
+        def by_label(series: Dict[Labels, Any], label: str) -> Dict[str, Any]:
+            return {
+                dict(labels).get(label, ""): value for labels, value in series.items()
+            }
+
+        tables: Dict[str, Dict[str, Any]] = {}
+        for name in (
+            "rows_queued",
+            "rows_flushed",
+            "rows_deduplicated",
+            "bytes_flushed",
+            "flushes",
+            "flush_errors",
+        ):
+            for table_name, value in by_label(counters.get(name, {}), "table").items():
+                tables.setdefault(table_name, {})[name] = value
+        for table_name, histogram in by_label(
+            histograms.get("flush_seconds", {}), "table"
+        ).items():
+            tables.setdefault(table_name, {})["flush_seconds"] = histogram.summary()
+        for table_name, budget in by_label(
+            gauges.get("batch_budget_bytes", {}), "table"
+        ).items():
+            tables.setdefault(table_name, {})["batch_budget_bytes"] = budget
+        with self._lock:
+            samples = list(self._samples)
+        return {
+            "elapsed_seconds": time.monotonic() - self._started,
+            "studies": sum(counters.get("studies", {}).values()),
+            "tables": dict(sorted(tables.items())),
+            "db_seconds": {
+                phase: histogram.summary()
+                for phase, histogram in by_label(
+                    histograms.get("db_seconds", {}), "phase"
+                ).items()
+            },
+            "parse_seconds": next(
+                (h.summary() for h in histograms.get("parse_seconds", {}).values()),
+                Histogram().summary(),
+            ),
+            "queue_depth": {
+                "final": by_label(gauges.get("queue_depth", {}), "table"),
+                "samples": [{"t": t, "depths": depths} for t, depths in samples],
+            },
+        }
+
+
+METRICS = MetricsRegistry(
+    export_interval=float(os.getenv("METRICS_EXPORT_INTERVAL", "10")),
+    sample_interval=float(os.getenv("METRICS_SAMPLE_INTERVAL", "1")),
+)
+
+
+def configure_sinks(
+    textfile: Optional[str] = None, json_summary: Optional[str] = None
+) -> None:
+    """Attach the built-in sinks, defaulting to `METRICS_TEXTFILE` and
+    `METRICS_JSON`."""
+    textfile = textfile or os.getenv("METRICS_TEXTFILE")
+    json_summary = json_summary or os.getenv("METRICS_JSON")
+    if textfile:
+        METRICS.add_sink(PrometheusTextfileSink(textfile))
+    if json_summary:
+        METRICS.add_sink(JsonSummarySink(json_summary))
@@ -1,123 +1,125 @@
-from dbutils.helpers import upsert, batch_upsert
-from typing import Dict, List, Any
+from dbutils.helpers import (
+    upsert,
+    batch_upsert,
+    copy_insert,
+    copy_replace,
+    copy_upsert,
+)
+from dbutils.async_helpers import (
+    async_batch_upsert,
+    async_copy_insert,
+    async_copy_replace,
+    async_copy_upsert,
+    close_async_pool,
+)
+from dbutils.batching import BatchSizer, estimate_row_bytes
+from dbutils.interning import intern_rows
+from dbutils.metrics import METRICS
+from dbutils.query import STUDY_CACHE
+from dbutils.schema import (
+    HASH_COLUMN,
+    HASHED_KEY_TABLES,
+    child_tables,
+    conflict_key_digest,
+    clause_columns,
+    foreign_keys,
+    referenced_columns,
+    set_key_mode as set_schema_key_mode,
+    split_ddl,
+    table_order,
+)
+from dbutils.tablespec import column_map
+from typing import (
+    AsyncIterator,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Any,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from operator import itemgetter
+import asyncio
+import os
+import time
 
 
 class MigratorMixIn:
+    # Mixed into pydantic models, where an annotated public attribute would be
+    # a field of every study: public settings are therefore ClassVars.
     _BATCH_QUEUE: Dict[str, list] = defaultdict(list)
-    _MAX_QUEUE_SIZE: int = 300
-    COLUMN_MAP: Dict[str, List[str]] = {
-        "collaborators": [
-            "nct_id",
-            "responsible_party_type",
-            "investigator_name",
-            "investigator_affiliation",
-            "collaborator_name",
-            "collaborator_class",
-            "collaborator_type",
-        ],
-        "conditions": ["nct_id", "name"],
-        "contact": ["nct_id", "name", "role", "phone", "email"],
-        "design": [
-            "nct_id",
-            "study_type",
-            "expanded_access_individual",
-            "expanded_access_intermediate",
-            "expanded_access_treatment",
-            "patient_registry",
-            "num_phases",
-            "allocation",
-            "intervention_model",
-            "primary_purpose",
-            "observational_model",
-            "biospec_retention",
-            "biospec_description",
-            "enrollment_count",
-        ],
-        "eligibility": [
-            "nct_id",
-            "accepts_healthy_volunteers",
-            "gender",
-            "gender_based",
-            "min_age",
-            "max_age",
-            "population_description",
-            "sampling_method",
-        ],
-        "facility": [
-            "nct_id",
-            "name",
-            "status",
-            "city",
-            "state",
-            "zip",
-            "country",
-            "contacts",
-        ],
-        "interventions": [
-            "nct_id",
-            "intervention_type",
-            "intervention_name",
-            "intervention_description",
-            "group_label",
-        ],
-        "officials": ["nct_id", "name", "role", "affiliation"],
-        "phases": ["nct_id", "phase"],
-        "oversight": [
-            "nct_id",
-            "oversight_has_dmc",
-            "is_fda_regulated_drug",
-            "is_fda_regulated_device",
-            "is_ppsd",
-            "is_us_export",
-            "is_unapproved_device",
-            "is_fda_violation",
-        ],
-        "outcome": ["nct_id", "type", "measure", "description", "time_frame"],
-        "status": [
-            "nct_id",
-            "status_verified_date",
-            "overall_status",
-            "last_known_status",
-            "why_stopped",
-            "start_date",
-            "primary_completion_date",
-            "completion_date",
-            "study_first_submit_date",
-            "study_first_submit_qc_date",
-            "study_first_post_date",
-            "results_waived",
-            "results_first_submit_date",
-            "results_first_submit_qc_date",
-            "results_first_post_date",
-            "last_update_submit_date",
-            "last_update_post_date",
-        ],
-        "identification": [
-            "nct_id",
-            "nct_id_alias",
-            "num_nct_aliases",
-            "org_study_id",
-            "org_study_id_type",
-            "org_study_id_link",
-            "num_secondary_ids",
-            "brief_title",
-            "official_title",
-            "acronym",
-            "org_name",
-            "org_class",
-            "brief_summary",
-            "detailed_description",
-            "num_conditions",
-        ],
-        "groups": [
-            "nct_id",
-            "group_type",
-            "group_description",
-            "group_label",
-        ],
+    # Estimated payload of every queue (see batching.estimate_row_bytes) and
+    # their sum. A queue is flushed once it reaches its table's byte budget,
+    # which _BATCH_SIZER adapts to the measured flush latency; the largest
+    # queue is flushed whenever the total exceeds QUEUE_MEMORY_LIMIT.
+    _QUEUE_BYTES: Dict[str, int] = defaultdict(int)
+    _TOTAL_QUEUE_BYTES: int = 0
+    # Position in its queue of every queued row, by conflict key. A row whose
+    # key is already queued replaces the queued row, so one batch never holds
+    # two rows for the same key; see add_to_batch.
+    _QUEUE_KEYS: Dict[str, Dict[Tuple[Any, ...], int]] = defaultdict(dict)
+    _CONFLICT_KEY_GETTERS: Dict[str, Callable[[Sequence[Any]], Tuple[Any, ...]]] = {}
+    # Per table, (referenced table, position of the referencing column in a
+    # row, position of the referenced column in a row of the referenced table)
+    # for each of its foreign keys to other queued tables, see _writable_rows
+    _PARENT_REFERENCES: Dict[str, List[Tuple[str, Optional[int], Optional[int]]]] = {}
+    # Rows dropped that way per table, since the start of the run
+    _DEDUPLICATED: Dict[str, int] = defaultdict(int)
+    _BATCH_SIZER: BatchSizer = BatchSizer.from_env()
+    QUEUE_MEMORY_LIMIT: ClassVar[int] = int(
+        os.getenv("QUEUE_MEMORY_LIMIT", str(256 << 20))
+    )
+    # Hard cap on rows per batch, whatever their size
+    _MAX_QUEUE_SIZE: int = int(os.getenv("BATCH_MAX_ROWS", "10000"))
+    # How queued batches are written: "executemany" sends each row through the
+    # upsert template, "copy" streams the batch into a staging table via COPY
+    # and merges it with one set-based upsert, "bulk" appends with COPY and is
+    # only valid on tables created by init_database(bulk=True). "replace" is
+    # "copy" for one-row-per-study tables, which also deletes the rows of the
+    # studies it writes from schema.child_tables(), and appends to those with
+    # COPY.
+    LOAD_MODES: ClassVar[Dict[str, Callable]] = {
+        "executemany": batch_upsert,
+        "copy": copy_upsert,
+        "bulk": copy_insert,
+        "replace": copy_replace,
+    }
+    _LOAD_MODE: str = os.getenv("LOAD_MODE", "executemany")
+    ASYNC_LOAD_MODES: ClassVar[Dict[str, Callable]] = {
+        "executemany": async_batch_upsert,
+        "copy": async_copy_upsert,
+        "bulk": async_copy_insert,
+        "replace": async_copy_replace,
     }
-    CONFLICT_COLUMNS: Dict[str, List[str]] = {
+    # Set while async_batches() is active: full queues are then written by
+    # background tasks on the event loop instead of blocking the caller.
+    _ASYNC_WRITES: Optional[Dict[str, Set[asyncio.Task]]] = None
+    _ASYNC_ERRORS: List[BaseException] = []
+    _ASYNC_TABLE_SLOTS: Dict[str, asyncio.Semaphore] = {}
+    ASYNC_TABLE_CONCURRENCY: ClassVar[int] = int(
+        os.getenv("ASYNC_TABLE_CONCURRENCY", "1")
+    )
+    ASYNC_MAX_IN_FLIGHT: ClassVar[int] = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "8"))
+    # When set, upsert_table appends (table_name, values) here instead of
+    # writing anything, see collect_rows.
+    _ROW_SINK: Optional[List[Tuple[str, Sequence[Any]]]] = None
+    # In the replace mode, the nct_id the last batch of a child table ended
+    # with and the conflict keys it wrote for it, see _drop_written
+    _REPLACE_TAILS: Dict[str, Tuple[Any, Set[Tuple[Any, ...]]]] = {}
+    # Tables written since the last pop_flushed_tables(), for checkpoints
+    _FLUSHED_TABLES: Set[str] = set()
+    # nct_ids written since the last pop_written_studies(), for rollups
+    _WRITTEN_STUDIES: Set[str] = set()
+    # Column order of every table, see dbutils.tablespec
+    COLUMN_MAP: ClassVar[Dict[str, List[str]]] = column_map()
+    CONFLICT_COLUMNS: ClassVar[Dict[str, List[str]]] = {
         "collaborators": [
             "nct_id",
             "responsible_party_type",
@@ -147,312 +149,519 @@ class MigratorMixIn:
         "outcome": ["nct_id", "type", "measure", "description", "time_frame"],
         "status": ["nct_id"],
     }
+    # The columns CONFLICT_COLUMNS holds in the "columns" key mode
+    _COLUMN_KEYS: Dict[str, List[str]] = dict(CONFLICT_COLUMNS)
+    # In the "hashed" key mode, a getter of the _COLUMN_KEYS values of a row
+    # per hashed table: their digest is appended to the row as HASH_COLUMN
+    _HASHED_KEYS: Dict[str, Callable[[Sequence[Any]], Tuple[Any, ...]]] = {}
+
+    @staticmethod
+    def _conflict_key(table_name: str) -> Callable[[Sequence[Any]], Tuple[Any, ...]]:
+        """Function returning the CONFLICT_COLUMNS values of a row."""
+        getter = MigratorMixIn._CONFLICT_KEY_GETTERS.get(table_name)
+        if getter is None:
+            columns = MigratorMixIn.COLUMN_MAP[table_name]
+            positions = [
+                columns.index(column)
+                for column in MigratorMixIn.CONFLICT_COLUMNS[table_name]
+            ]
+            if len(positions) > 1:
+                getter = itemgetter(*positions)
+            else:
+
+                def getter(row: Sequence[Any], position: int = positions[0]):
+                    return (row[position],)
+
+            MigratorMixIn._CONFLICT_KEY_GETTERS[table_name] = getter
+        return getter
+
+    @staticmethod
+    def _queue_row(table_name: str, data: Sequence[Any]) -> None:
+        """Append a row to its queue, or replace the queued row with the same
+        conflict key: the outcome of upserting both in order."""
+        queue = MigratorMixIn._BATCH_QUEUE[table_name]
+        size = estimate_row_bytes(data)
+        getter = MigratorMixIn._CONFLICT_KEY_GETTERS.get(table_name)
+        key = (getter or MigratorMixIn._conflict_key(table_name))(data)
+        # NULLs never conflict in a unique index, so such rows are all kept
+        if None in key:
+            queue.append(data)
+        else:
+            positions = MigratorMixIn._QUEUE_KEYS[table_name]
+            position = positions.setdefault(key, len(queue))
+            if position == len(queue):
+                queue.append(data)
+            else:
+                size -= estimate_row_bytes(queue[position])
+                queue[position] = data
+                MigratorMixIn._DEDUPLICATED[table_name] += 1
+                METRICS.inc("rows_deduplicated", table=table_name)
+        MigratorMixIn._QUEUE_BYTES[table_name] += size
+        MigratorMixIn._TOTAL_QUEUE_BYTES += size
+
+    @staticmethod
+    def set_key_mode(mode: str) -> None:
+        """Select how conflict keys are stored, see dbutils.schema.KEY_MODES.
+
+        In the "hashed" mode, rows of HASHED_KEY_TABLES get one more column,
+        HASH_COLUMN, which is also their only conflict column.
+        """
+        set_schema_key_mode(mode)
+        MigratorMixIn.COLUMN_MAP = column_map()
+        MigratorMixIn.CONFLICT_COLUMNS = dict(MigratorMixIn._COLUMN_KEYS)
+        MigratorMixIn._HASHED_KEYS = {}
+        MigratorMixIn._CONFLICT_KEY_GETTERS.clear()
+        MigratorMixIn._PARENT_REFERENCES.clear()
+        if mode != "hashed":
+            return
+        for table_name in HASHED_KEY_TABLES:
+            columns = MigratorMixIn.COLUMN_MAP[table_name]
+            MigratorMixIn._HASHED_KEYS[table_name] = itemgetter(
+                *(
+                    columns.index(column)
+                    for column in MigratorMixIn._COLUMN_KEYS[table_name]
+                )
+            )
+            MigratorMixIn.COLUMN_MAP[table_name] = columns + [HASH_COLUMN]
+            MigratorMixIn.CONFLICT_COLUMNS[table_name] = [HASH_COLUMN]
+
+    @staticmethod
+    def _with_key(table_name: str, data: Sequence[Any]) -> Sequence[Any]:
+        """The row as written: with its digest appended in the hashed mode."""
+        key_values = MigratorMixIn._HASHED_KEYS.get(table_name)
+        if key_values is None:
+            return data
+        return (*data, conflict_key_digest(key_values(data)))
+
+    @staticmethod
+    def add_to_batch(table_name: str, data: Sequence[Any]) -> None:
+        queue = MigratorMixIn._BATCH_QUEUE[table_name]
+        data = MigratorMixIn._with_key(table_name, data)
+        MigratorMixIn._queue_row(table_name, data)
+        METRICS.inc("rows_queued", table=table_name)
+        if (
+            MigratorMixIn._QUEUE_BYTES[table_name]
+            >= MigratorMixIn._BATCH_SIZER.budget(table_name)
+            or len(queue) >= MigratorMixIn._MAX_QUEUE_SIZE
+        ):
+            MigratorMixIn._flush_full(table_name)
+        elif MigratorMixIn._TOTAL_QUEUE_BYTES > MigratorMixIn.QUEUE_MEMORY_LIMIT:
+            queue_bytes = MigratorMixIn._QUEUE_BYTES
+            MigratorMixIn._flush_full(max(queue_bytes, key=queue_bytes.get))
 
     @staticmethod
-    def add_to_batch(table_name: str, data: List[Any]) -> None:
-        MigratorMixIn._BATCH_QUEUE[table_name].append(data)
-        if len(MigratorMixIn._BATCH_QUEUE[table_name]) >= MigratorMixIn._MAX_QUEUE_SIZE:
+    def _flush_full(table_name: str) -> None:
+        if MigratorMixIn._ASYNC_WRITES is not None:
+            MigratorMixIn._schedule_flush(table_name)
+        else:
             MigratorMixIn._flush_batch(table_name)
 
+    @staticmethod
+    def _take_queue(table_name: str) -> Tuple[List[List[Any]], int]:
+        """Detach a table's queue and its estimated size from the totals."""
+        rows = MigratorMixIn._BATCH_QUEUE[table_name]
+        size = MigratorMixIn._QUEUE_BYTES.pop(table_name, 0)
+        MigratorMixIn._BATCH_QUEUE[table_name] = []
+        MigratorMixIn._QUEUE_KEYS.pop(table_name, None)
+        MigratorMixIn._TOTAL_QUEUE_BYTES -= size
+        return rows, size
+
+    @staticmethod
+    def _take_batch(
+        table_name: str, limit: Optional[int] = None
+    ) -> Tuple[List[List[Any]], List[List[Any]], int]:
+        """Detach a table's queue to be written: its rows as written, the same
+        rows as queued, to be restored if the write fails, and their size.
+        With `limit`, only that many rows are taken and the rest stay queued."""
+        rows, size = MigratorMixIn._take_queue(table_name)
+        if limit is not None and limit < len(rows):
+            for row in rows[limit:]:
+                MigratorMixIn._queue_row(table_name, row)
+            rows = rows[:limit]
+            size -= MigratorMixIn._QUEUE_BYTES[table_name]
+        if MigratorMixIn._LOAD_MODE == "replace" and table_name in child_tables():
+            rows = MigratorMixIn._drop_written(table_name, rows)
+        try:
+            written = intern_rows(
+                table_name, MigratorMixIn.COLUMN_MAP[table_name], rows
+            )
+        except Exception:
+            MigratorMixIn._restore_queue(table_name, rows, size)
+            raise
+        # Queued rows keep their text, which their conflict keys are made of
+        return written, rows, size
+
+    @staticmethod
+    def _drop_written(table_name: str, rows: List[List[Any]]) -> List[List[Any]]:
+        """In the replace mode, child rows are appended without conflict
+        handling. A study whose rows straddle two batches of a table has its
+        old rows deleted only once, so rows of this batch whose key the
+        previous one already wrote for that study are dropped.
+        """
+        conflict_key = MigratorMixIn._conflict_key(table_name)
+        nct_id, written = MigratorMixIn._REPLACE_TAILS.get(table_name, (None, set()))
+        if written and rows[0][0] == nct_id:
+            rows = [
+                row
+                for row in rows
+                if row[0] != nct_id or conflict_key(row) not in written
+            ]
+        # Rows are queued study by study, so the last study's rows are at the end
+        last = rows[-1][0] if rows else None
+        tail = set()
+        for row in reversed(rows):
+            if row[0] != last:
+                break
+            key = conflict_key(row)
+            if None not in key:
+                tail.add(key)
+        MigratorMixIn._REPLACE_TAILS[table_name] = (last, tail)
+        return rows
+
+    @staticmethod
+    def _restore_queue(table_name: str, rows: List[List[Any]], size: int) -> None:
+        """Put rows that failed to be written back in front of the queue."""
+        # Their keys were not written after all
+        MigratorMixIn._REPLACE_TAILS.pop(table_name, None)
+        queued, _ = MigratorMixIn._take_queue(table_name)
+        MigratorMixIn._BATCH_QUEUE[table_name] = rows
+        MigratorMixIn._QUEUE_BYTES[table_name] = size
+        MigratorMixIn._TOTAL_QUEUE_BYTES += size
+        conflict_key = MigratorMixIn._conflict_key(table_name)
+        MigratorMixIn._QUEUE_KEYS[table_name] = {
+            key: position
+            for position, key in enumerate(map(conflict_key, rows))
+            if None not in key
+        }
+        # Rows queued while the batch was in flight are newer, so they replace
+        # the restored rows with the same key
+        for row in queued:
+            MigratorMixIn._queue_row(table_name, row)
+
+    @staticmethod
+    def set_load_mode(mode: str) -> None:
+        if mode not in MigratorMixIn.LOAD_MODES:
+            raise ValueError(
+                f"Unknown load mode {mode!r}, expected one of "
+                f"{', '.join(MigratorMixIn.LOAD_MODES)}"
+            )
+        MigratorMixIn._LOAD_MODE = mode
+
+    @staticmethod
+    def _parent_references(
+        table_name: str,
+    ) -> List[Tuple[str, Optional[int], Optional[int]]]:
+        references = MigratorMixIn._PARENT_REFERENCES.get(table_name)
+        if references is None:
+            references = []
+            columns = MigratorMixIn.COLUMN_MAP[table_name]
+            for foreign_key in split_ddl(table_name).foreign_keys:
+                parent, parent_columns = referenced_columns(foreign_key)
+                # Dimension tables are filled when batches are taken, not queued
+                if parent not in MigratorMixIn.COLUMN_MAP:
+                    continue
+                child_columns = clause_columns(foreign_key)
+                parent_map = MigratorMixIn.COLUMN_MAP[parent]
+                if (
+                    len(child_columns) == 1
+                    and child_columns[0] in columns
+                    and parent_columns[0] in parent_map
+                ):
+                    references.append(
+                        (
+                            parent,
+                            columns.index(child_columns[0]),
+                            parent_map.index(parent_columns[0]),
+                        )
+                    )
+                else:
+                    references.append((parent, None, None))
+            MigratorMixIn._PARENT_REFERENCES[table_name] = references
+        return references
+
+    @staticmethod
+    def _writable_rows(table_name: str) -> int:
+        """How many rows at the front of a table's queue reference no row that
+        is still queued for a table it references."""
+        queue = MigratorMixIn._BATCH_QUEUE[table_name]
+        writable = len(queue)
+        for parent, position, parent_position in MigratorMixIn._parent_references(
+            table_name
+        ):
+            parent_queue = MigratorMixIn._BATCH_QUEUE.get(parent)
+            if not parent_queue:
+                continue
+            if position is None:
+                return 0
+            pending = {row[parent_position] for row in parent_queue}
+            for i in range(writable):
+                if queue[i][position] in pending:
+                    writable = i
+                    break
+        return writable
+
     @staticmethod
     def _flush_batch(table_name: str) -> None:
+        if not MigratorMixIn._BATCH_QUEUE[table_name]:
+            return
+        # Rows referencing rows still queued for another table (e.g.
+        # identification) would violate their foreign keys. They are usually
+        # the last studies queued, so they are left for the next batch, unless
+        # they make up most of this one: then the referenced tables are flushed
+        # first, in batches of their own size rather than after every batch of
+        # their children.
+        writable = MigratorMixIn._writable_rows(table_name)
+        if writable * 2 < len(MigratorMixIn._BATCH_QUEUE[table_name]):
+            for parent in foreign_keys().get(table_name, ()):
+                MigratorMixIn._flush_batch(parent)
+            writable = len(MigratorMixIn._BATCH_QUEUE[table_name])
+        rows, queued, size = MigratorMixIn._take_batch(table_name, writable)
         try:
-            batch_upsert(
+            started = time.perf_counter()
+            MigratorMixIn.LOAD_MODES[MigratorMixIn._LOAD_MODE](
                 table_name,
                 MigratorMixIn.COLUMN_MAP[table_name],
-                MigratorMixIn._BATCH_QUEUE[table_name],
+                rows,
                 MigratorMixIn.CONFLICT_COLUMNS[table_name],
             )
-            MigratorMixIn._BATCH_QUEUE[table_name].clear()
+            MigratorMixIn._record_flush(
+                table_name, len(rows), size, time.perf_counter() - started
+            )
+            MigratorMixIn._FLUSHED_TABLES.add(table_name)
+            MigratorMixIn._record_written(table_name, rows)
         except Exception as e:
+            MigratorMixIn._restore_queue(table_name, queued, size)
+            METRICS.inc("flush_errors", table=table_name)
             print(f"Error flushing batch for table {table_name}: {e}")
             raise e
 
     @staticmethod
-    def flush_all_batches() -> None:
-        for table_name in MigratorMixIn._BATCH_QUEUE:
-            MigratorMixIn._flush_batch(table_name)
+    def _record_flush(table_name: str, rows: int, size: int, seconds: float) -> None:
+        budget = MigratorMixIn._BATCH_SIZER.record(table_name, size, seconds)
+        METRICS.observe("flush_seconds", seconds, table=table_name)
+        METRICS.inc("rows_flushed", rows, table=table_name)
+        METRICS.inc("bytes_flushed", size, table=table_name)
+        METRICS.inc("flushes", table=table_name)
+        METRICS.set("batch_budget_bytes", budget, table=table_name)
+        METRICS.set("queue_bytes", MigratorMixIn._TOTAL_QUEUE_BYTES)
+        METRICS.sample_queue_depths(
+            {name: len(queue) for name, queue in MigratorMixIn._BATCH_QUEUE.items()}
+        )
+        METRICS.maybe_export()
 
     @staticmethod
-    def upsert_table(table_name: str, values: List[Any], batch: bool = False) -> None:
-        if batch:
-            MigratorMixIn.add_to_batch(table_name, values)
-        else:
-            upsert(
-                table_name,
-                MigratorMixIn.COLUMN_MAP[table_name],
-                values,
-                MigratorMixIn.CONFLICT_COLUMNS[table_name],
-            )
+    def _record_written(table_name: str, rows: Iterable[Sequence[Any]]) -> None:
+        # Every row starts with its nct_id. Studies whose rows were just
+        # written are read again on their next fetch (see dbutils.query), and
+        # every study written has an identification row (see dbutils.rollups).
+        if not STUDY_CACHE.is_idle():
+            STUDY_CACHE.discard({row[0] for row in rows})
+        if table_name == "identification":
+            MigratorMixIn._WRITTEN_STUDIES.update(row[0] for row in rows)
 
     @staticmethod
-    def migrate_collaborators(
-        nct_id: str,
-        responsible_party_type: str,
-        investigator_name: str,
-        investigator_affiliation: str,
-        collaborator_name: str,
-        collaborator_class: str,
-        collaborator_type: str,
-        batch: bool = False,
-    ) -> None:
-        values = [
-            nct_id,
-            responsible_party_type,
-            investigator_name,
-            investigator_affiliation,
-            collaborator_name,
-            collaborator_class,
-            collaborator_type,
-        ]
-        MigratorMixIn.upsert_table("collaborators", values, batch)
+    def flush_all_batches() -> None:
+        for table_name in table_order():
+            if table_name in MigratorMixIn._BATCH_QUEUE:
+                MigratorMixIn._flush_batch(table_name)
 
     @staticmethod
-    def migrate_conditions(nct_id: str, name: str, batch: bool = False) -> None:
-        values = [nct_id, name]
-        MigratorMixIn.upsert_table("conditions", values, batch)
+    @asynccontextmanager
+    async def async_batches() -> AsyncIterator[None]:
+        """Write full queues concurrently from background tasks.
+
+        Inside this context add_to_batch no longer blocks on a full queue: the
+        rows are handed to a task on the running event loop, and independent
+        tables are written at the same time on separate connections. Leaving
+        the context with an exception (including cancellation) cancels the
+        writes still in flight and puts their rows back in the queues.
+        """
+        MigratorMixIn._ASYNC_WRITES = defaultdict(set)
+        MigratorMixIn._ASYNC_ERRORS = []
+        MigratorMixIn._ASYNC_TABLE_SLOTS = {}
+        try:
+            yield
+            await MigratorMixIn._async_wait()
+        except BaseException:
+            tasks = MigratorMixIn._async_pending()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            MigratorMixIn._ASYNC_WRITES = None
+            await close_async_pool()
 
     @staticmethod
-    def migrate_status(
-        nct_id: str,
-        status_verified_date: str,
-        overall_status: str,
-        last_known_status: str,
-        why_stopped: str,
-        start_date: str,
-        primary_completion_date: str,
-        completion_date: str,
-        study_first_submit_date: str,
-        study_first_submit_qc_date: str,
-        study_first_post_date: str,
-        results_waived: bool,
-        results_first_submit_date: str,
-        results_first_submit_qc_date: str,
-        results_first_post_date: str,
-        last_update_submit_date: str,
-        last_update_post_date: str,
-        batch: bool = False,
-    ) -> None:
-        values = [
-            nct_id,
-            status_verified_date,
-            overall_status,
-            last_known_status,
-            why_stopped,
-            start_date,
-            primary_completion_date,
-            completion_date,
-            study_first_submit_date,
-            study_first_submit_qc_date,
-            study_first_post_date,
-            results_waived,
-            results_first_submit_date,
-            results_first_submit_qc_date,
-            results_first_post_date,
-            last_update_submit_date,
-            last_update_post_date,
-        ]
-        MigratorMixIn.upsert_table("status", values, batch)
+    def _async_pending() -> Set[asyncio.Task]:
+        return set().union(*MigratorMixIn._ASYNC_WRITES.values())
 
     @staticmethod
-    def migrate_phases(nct_id: str, phase: str, batch: bool = False) -> None:
-        values = [nct_id, phase]
-        MigratorMixIn.upsert_table("phases", values, batch)
+    async def _async_wait(limit: int = 0) -> None:
+        """Wait until at most `limit` writes are in flight, then re-raise the
+        first background failure, if any."""
+        while True:
+            pending = MigratorMixIn._async_pending()
+            if len(pending) <= limit:
+                break
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if MigratorMixIn._ASYNC_ERRORS:
+            raise MigratorMixIn._ASYNC_ERRORS[0]
 
     @staticmethod
-    def migrate_oversight(
-        nct_id: str,
-        oversight_has_dmc: bool,
-        is_fda_regulated_drug: bool,
-        is_fda_regulated_device: bool,
-        is_ppsd: bool,
-        is_us_export: bool,
-        is_unapproved_device: bool,
-        is_fda_violation: bool,
-        batch: bool = False,
-    ) -> None:
-        values = [
-            nct_id,
-            oversight_has_dmc,
-            is_fda_regulated_drug,
-            is_fda_regulated_device,
-            is_ppsd,
-            is_us_export,
-            is_unapproved_device,
-            is_fda_violation,
-        ]
-        MigratorMixIn.upsert_table("oversight", values, batch)
+    async def async_throttle() -> None:
+        """Let in-flight writes progress; call once per study while loading.
+
+        Blocks while more than ASYNC_MAX_IN_FLIGHT writes are pending so the
+        queues cannot outgrow the database.
+        """
+        await asyncio.sleep(0)
+        await MigratorMixIn._async_wait(MigratorMixIn.ASYNC_MAX_IN_FLIGHT)
 
     @staticmethod
-    def migrate_outcome(
-        nct_id: str,
-        type: str,
-        measure: str,
-        description: str,
-        time_frame: str,
-        batch: bool = False,
-    ) -> None:
-        values = [nct_id, type, measure, description, time_frame]
-        MigratorMixIn.upsert_table("outcome", values, batch)
+    def _schedule_flush(table_name: str) -> Optional[asyncio.Task]:
+        if not MigratorMixIn._BATCH_QUEUE[table_name]:
+            return None
+        rows, queued, size = MigratorMixIn._take_batch(table_name)
+        writes = MigratorMixIn._ASYNC_WRITES[table_name]
+        task = asyncio.get_running_loop().create_task(
+            MigratorMixIn._async_flush_batch(table_name, rows, queued, size)
+        )
+        writes.add(task)
+
+        def done(task: asyncio.Task) -> None:
+            writes.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                MigratorMixIn._ASYNC_ERRORS.append(task.exception())
+
+        task.add_done_callback(done)
+        return task
 
     @staticmethod
-    def migrate_officials(
-        nct_id: str, name: str, role: str, affiliation: str, batch: bool = False
+    async def _async_flush_batch(
+        table_name: str, rows: List[List[Any]], queued: List[List[Any]], size: int
     ) -> None:
-        values = [nct_id, name, role, affiliation]
-        MigratorMixIn.upsert_table("officials", values, batch)
+        try:
+            # Same rule as _flush_batch: everything queued for the referenced
+            # tables before these rows must be committed first.
+            parents = foreign_keys().get(table_name, ())
+            for parent in parents:
+                MigratorMixIn._schedule_flush(parent)
+            before = set().union(
+                *(MigratorMixIn._ASYNC_WRITES[parent] for parent in parents)
+            )
+            if before:
+                await asyncio.wait(before)
+            if MigratorMixIn._ASYNC_ERRORS:
+                raise RuntimeError(
+                    f"Not flushing {table_name}: a batch it depends on failed"
+                )
+
+            slots = MigratorMixIn._ASYNC_TABLE_SLOTS.setdefault(
+                table_name, asyncio.Semaphore(MigratorMixIn.ASYNC_TABLE_CONCURRENCY)
+            )
+            async with slots:
+                started = time.perf_counter()
+                await MigratorMixIn.ASYNC_LOAD_MODES[MigratorMixIn._LOAD_MODE](
+                    table_name,
+                    MigratorMixIn.COLUMN_MAP[table_name],
+                    rows,
+                    MigratorMixIn.CONFLICT_COLUMNS[table_name],
+                )
+                seconds = time.perf_counter() - started
+            MigratorMixIn._record_flush(table_name, len(rows), size, seconds)
+            MigratorMixIn._FLUSHED_TABLES.add(table_name)
+            MigratorMixIn._record_written(table_name, rows)
+        except BaseException as e:
+            MigratorMixIn._restore_queue(table_name, queued, size)
+            if not isinstance(e, asyncio.CancelledError):
+                METRICS.inc("flush_errors", table=table_name)
+                print(f"Error flushing batch for table {table_name}: {e}")
+            raise e
 
     @staticmethod
-    def migrate_interventions(
-        nct_id: str,
-        intervention_type: str,
-        intervention_name: str,
-        intervention_description: str,
-        group_label: str,
-        batch: bool = False,
-    ) -> None:
-        values = [
-            nct_id,
-            intervention_type,
-            intervention_name,
-            intervention_description,
-            group_label,
-        ]
-        MigratorMixIn.upsert_table("interventions", values, batch)
+    async def async_flush_all_batches() -> None:
+        """Flush every queue concurrently, parents still committed before
+        their children, and wait for all writes to finish."""
+        if MigratorMixIn._ASYNC_WRITES is None:
+            async with MigratorMixIn.async_batches():
+                await MigratorMixIn.async_flush_all_batches()
+            return
+        for table_name in table_order():
+            if table_name in MigratorMixIn._BATCH_QUEUE:
+                MigratorMixIn._schedule_flush(table_name)
+        await MigratorMixIn._async_wait()
 
     @staticmethod
-    def migrate_identification(
-        nct_id: str,
-        nct_id_alias: list,
-        num_nct_aliases: int,
-        org_study_id: str,
-        org_study_id_type: str,
-        org_study_id_link: str,
-        num_secondary_ids: int,
-        brief_title: str,
-        official_title: str,
-        acronym: str,
-        org_name: str,
-        org_class: str,
-        brief_summary: str,
-        detailed_description: str,
-        num_conditions: int,
-        batch: bool = False,
-    ) -> None:
-        values = [
-            nct_id,
-            nct_id_alias,
-            num_nct_aliases,
-            org_study_id,
-            org_study_id_type,
-            org_study_id_link,
-            num_secondary_ids,
-            brief_title,
-            official_title,
-            acronym,
-            org_name,
-            org_class,
-            brief_summary,
-            detailed_description,
-            num_conditions,
-        ]
-        MigratorMixIn.upsert_table("identification", values, batch)
+    @contextmanager
+    def collect_rows() -> Iterator[List[Tuple[str, Sequence[Any]]]]:
+        """Capture the rows passed to upsert_table instead of writing them.
+
+        Used to build rows in worker processes and replay them with
+        add_to_batch in the process that owns the database connection.
+        """
+        previous = MigratorMixIn._ROW_SINK
+        rows: List[Tuple[str, Sequence[Any]]] = []
+        MigratorMixIn._ROW_SINK = rows
+        try:
+            yield rows
+        finally:
+            MigratorMixIn._ROW_SINK = previous
 
     @staticmethod
-    def migrate_groups(
-        nct_id: str,
-        group_type: str,
-        group_description: str,
-        group_label: str,
-        batch: bool = False,
-    ) -> None:
-        values = [nct_id, group_type, group_description, group_label]
-        MigratorMixIn.upsert_table("groups", values, batch)
+    def report_deduplicated() -> None:
+        """Print how many queued rows were replaced by a later row with the
+        same conflict key, per table."""
+        if not MigratorMixIn._DEDUPLICATED:
+            return
+        print("Duplicate rows dropped from batches (the last one was kept):")
+        for table_name, count in sorted(MigratorMixIn._DEDUPLICATED.items()):
+            print(f"  {table_name}: {count}")
 
     @staticmethod
-    def migrate_facility(
-        nct_id: str,
-        name: str,
-        status: str,
-        city: str,
-        state: str,
-        zip: str,
-        country: str,
-        contacts: dict,
-        batch: bool = False,
-    ) -> None:
-        values = [nct_id, name, status, city, state, zip, country, contacts]
-        MigratorMixIn.upsert_table("facility", values, batch)
+    def pop_flushed_tables() -> List[str]:
+        """Tables written since the previous call."""
+        flushed = sorted(MigratorMixIn._FLUSHED_TABLES)
+        MigratorMixIn._FLUSHED_TABLES.clear()
+        return flushed
 
     @staticmethod
-    def migrate_eligibility(
-        nct_id: str,
-        accepts_healthy_volunteers: bool,
-        gender: str,
-        gender_based: bool,
-        min_age: str,
-        max_age: str,
-        population_description: str,
-        sampling_method: str,
-        batch: bool = False,
-    ) -> None:
-        values = [
-            nct_id,
-            accepts_healthy_volunteers,
-            gender,
-            gender_based,
-            min_age,
-            max_age,
-            population_description,
-            sampling_method,
-        ]
-
-        MigratorMixIn.upsert_table("eligibility", values, batch)
+    def pop_written_studies() -> Set[str]:
+        """nct_ids of the studies written since the previous call."""
+        written = set(MigratorMixIn._WRITTEN_STUDIES)
+        MigratorMixIn._WRITTEN_STUDIES.clear()
+        return written
 
     @staticmethod
-    def migrate_design(
-        nct_id: str,
-        study_type: str,
-        expanded_access_individual: bool,
-        expanded_access_intermediate: bool,
-        expanded_access_treatment: bool,
-        patient_registry: bool,
-        num_phases: int,
-        allocation: str,
-        intervention_model: str,
-        primary_purpose: str,
-        observational_model: str,
-        biospec_retention: str,
-        biospec_description: str,
-        enrollment_count: int,
-        batch: bool = False,
+    def upsert_table(
+        table_name: str, values: Sequence[Any], batch: bool = False
     ) -> None:
-        values = [
-            nct_id,
-            study_type,
-            expanded_access_individual,
-            expanded_access_intermediate,
-            expanded_access_treatment,
-            patient_registry,
-            num_phases,
-            allocation,
-            intervention_model,
-            primary_purpose,
-            observational_model,
-            biospec_retention,
-            biospec_description,
-            enrollment_count,
-        ]
-        MigratorMixIn.upsert_table("design", values, batch)
+        if MigratorMixIn._ROW_SINK is not None:
+            MigratorMixIn._ROW_SINK.append((table_name, values))
+        elif batch:
+            MigratorMixIn.add_to_batch(table_name, values)
+        else:
+            upsert(
+                table_name,
+                MigratorMixIn.COLUMN_MAP[table_name],
+                intern_rows(
+                    table_name,
+                    MigratorMixIn.COLUMN_MAP[table_name],
+                    [MigratorMixIn._with_key(table_name, values)],
+                )[0],
+                MigratorMixIn.CONFLICT_COLUMNS[table_name],
+            )
+            MigratorMixIn._record_written(table_name, (values,))
 
     @staticmethod
-    def migrate_contact(
-        nct_id: str,
-        name: str,
-        role: str,
-        phone: str,
-        email: str,
-        batch: bool = False,
-    ) -> None:
-        values = [nct_id, name, role, phone, email]
-        MigratorMixIn.upsert_table("contact", values, batch)
+    def upsert_rows(rows: List[Tuple[str, Sequence[Any]]], batch: bool = False) -> None:
+        """upsert_table for many rows, deciding where they go once."""
+        if MigratorMixIn._ROW_SINK is not None:
+            MigratorMixIn._ROW_SINK.extend(rows)
+        elif batch:
+            add_to_batch = MigratorMixIn.add_to_batch
+            for table_name, values in rows:
+                add_to_batch(table_name, values)
+        else:
+            for table_name, values in rows:
+                MigratorMixIn.upsert_table(table_name, values)
@@ -0,0 +1,240 @@
+from psycopg.pq import TransactionStatus
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """A small thread-safe pool of long-lived psycopg connections.
+
+    Connections are created lazily up to `max_size`, with `min_size` opened
+    up front. Idle connections that have not been used for `check_interval`
+    seconds are pinged before being handed out, and connections older than
+    `max_lifetime` seconds are recycled.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 4,
+        timeout: float = 30.0,
+        max_lifetime: float = 3600.0,
+        check_interval: float = 30.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+
+        self._idle: Deque[_PooledConnection] = deque()
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._cond = threading.Condition()
+        self._opening = 0
+        self._closed = False
+        self._pid = os.getpid()
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "health_check_failures": 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append(_PooledConnection(self._open()))
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        self._stats["connections_closed"] += 1
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        now = time.monotonic()
+        conn = pooled.conn
+        if conn.closed or getattr(conn, "broken", False):
+            return False
+        if now - pooled.created_at > self.max_lifetime:
+            return False
+        if now - pooled.last_used > self.check_interval:
+            try:
+                conn.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for one."""
+        if os.getpid() != self._pid:
+            raise RuntimeError("ConnectionPool cannot be shared across processes")
+
+        deadline = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("ConnectionPool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._in_use[id(pooled.conn)] = pooled
+                    break
+                if self.size < self.max_size:
+                    pooled = None
+                    self._opening += 1
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    wait_started = time.monotonic()
+                    self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self._stats["wait_time"] += time.monotonic() - wait_started
+                    raise PoolTimeout(
+                        f"No connection available after {self.timeout} seconds"
+                    )
+            if deadline is not None:
+                self._stats["wait_time"] += time.monotonic() - wait_started
+
+        # Health checks and new connections happen outside the lock so a slow
+        # server does not block other threads returning their connections.
+        if pooled is not None and not self._is_healthy(pooled):
+            with self._cond:
+                del self._in_use[id(pooled.conn)]
+                self._stats["health_check_failures"] += 1
+                self._discard(pooled)
+                self._opening += 1
+            pooled = None
+
+        if pooled is None:
+            try:
+                pooled = _PooledConnection(self._open())
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if pooled is not None:
+                        self._in_use[id(pooled.conn)] = pooled
+                    self._cond.notify()
+
+        with self._cond:
+            self._stats["checkouts"] += 1
+        return pooled.conn
+
+    def putconn(self, conn) -> None:
+        """Return a connection to the pool, discarding it if it is unusable."""
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is None:
+                raise ValueError("Connection does not belong to this pool")
+            if self._closed or conn.closed or getattr(conn, "broken", False):
+                self._discard(pooled)
+            else:
+                if conn.info.transaction_status != TransactionStatus.IDLE:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        self._discard(pooled)
+                        self._cond.notify()
+                        return
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters plus the size of the pool and the age of its connections."""
+        now = time.monotonic()
+        with self._cond:
+            ages = [now - p.created_at for p in (*self._idle, *self._in_use.values())]
+            stats = dict(self._stats)
+            stats.update(
+                {
+                    "pool_size": self.size,
+                    "pool_min": self.min_size,
+                    "pool_max": self.max_size,
+                    "pool_available": len(self._idle),
+                    "pool_in_use": len(self._in_use),
+                    "connection_age_min": min(ages) if ages else 0.0,
+                    "connection_age_max": max(ages) if ages else 0.0,
+                    "connection_age_avg": sum(ages) / len(ages) if ages else 0.0,
+                }
+            )
+        return stats
+
+
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(connect: Callable[[], Any]) -> ConnectionPool:
+    """Return the process-wide pool, creating it from the environment on first use.
+
+    A pool inherited through fork is dropped and a fresh one is created, since
+    the parent's sockets must not be shared with the child.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL._pid != os.getpid() or _POOL._closed:
+            _POOL = ConnectionPool(
+                connect,
+                min_size=int(os.getenv("DBPOOL_MIN_SIZE", "1")),
+                max_size=int(os.getenv("DBPOOL_MAX_SIZE", "4")),
+                timeout=float(os.getenv("DBPOOL_TIMEOUT", "30")),
+                max_lifetime=float(os.getenv("DBPOOL_MAX_LIFETIME", "3600")),
+                check_interval=float(os.getenv("DBPOOL_CHECK_INTERVAL", "30")),
+            )
+        return _POOL
+
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL._pid == os.getpid():
+            _POOL.close()
+        _POOL = None
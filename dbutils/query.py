@@ -0,0 +1,204 @@
+"""Read studies back as one JSON document each.
+
+fetch_studies() reassembles every table's rows of a batch of studies with a
+single statement: the server builds one JSON object per study, with an
+object for each table that has one row per study and an array for each
+table with many. Results go through STUDY_CACHE, an in-process LRU cache
+whose entries expire after STUDY_CACHE_TTL seconds. MigratorMixIn evicts a
+study whenever migrate_to_db or a batch flush writes its rows. Writes made
+by other processes (e.g. shards) are only seen once the entry expires.
+Cached studies are shared, so callers must not modify them.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+import time
+
+from psycopg import sql
+
+from dbutils.helpers import execute_query
+from dbutils.schema import interning, text_expression
+from dbutils.tablespec import TABLE_SPECS, column_map
+
+STUDY_CACHE_SIZE = int(os.getenv("STUDY_CACHE_SIZE", "10000"))
+STUDY_CACHE_TTL = float(os.getenv("STUDY_CACHE_TTL", "60"))
+
+Study = Dict[str, Any]
+
+
+class StudyCache:
+    """nct_id to reassembled study, holding at most `max_size` studies for
+    at most `ttl` seconds each. Safe to share between threads.
+
+    A study read from the database is only cached if it was not discarded
+    while it was being read: reserve() takes its version before the query,
+    discard() bumps it, and fill() skips the studies whose version moved.
+    """
+
+    def __init__(self, max_size: int = STUDY_CACHE_SIZE, ttl: float = STUDY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._studies: "OrderedDict[str, Tuple[float, Study]]" = OrderedDict()
+        # nct_id -> [version, reads in flight], only while reads are in flight
+        self._versions: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._studies)
+
+    def is_idle(self) -> bool:
+        """Whether nothing is cached and no read is in flight, in which case
+        discard() has nothing to do."""
+        return not self._studies and not self._versions
+
+    def get(self, nct_id: str) -> Optional[Study]:
+        with self._lock:
+            entry = self._studies.get(nct_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._studies[nct_id]
+                return None
+            self._studies.move_to_end(nct_id)
+            return entry[1]
+
+    def _put(self, nct_id: str, study: Study) -> None:
+        self._studies[nct_id] = (time.monotonic() + self.ttl, study)
+        self._studies.move_to_end(nct_id)
+        if len(self._studies) > self.max_size:
+            self._studies.popitem(last=False)
+
+    def put(self, nct_id: str, study: Study) -> None:
+        with self._lock:
+            self._put(nct_id, study)
+
+    def reserve(self, nct_ids: Iterable[str]) -> Dict[str, int]:
+        """The versions of `nct_ids` before they are read; every call must be
+        matched by a fill() with what it returns."""
+        versions = {}
+        with self._lock:
+            for nct_id in nct_ids:
+                entry = self._versions.setdefault(nct_id, [0, 0])
+                entry[1] += 1
+                versions[nct_id] = entry[0]
+        return versions
+
+    def fill(self, versions: Dict[str, int], studies: Dict[str, Study]) -> None:
+        """Cache the `studies` read since reserve() returned `versions`,
+        except those discarded in the meantime."""
+        with self._lock:
+            for nct_id, version in versions.items():
+                entry = self._versions[nct_id]
+                if nct_id in studies and entry[0] == version:
+                    self._put(nct_id, studies[nct_id])
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._versions[nct_id]
+
+    def discard(self, nct_ids: Iterable[str]) -> None:
+        with self._lock:
+            for nct_id in nct_ids:
+                self._studies.pop(nct_id, None)
+                entry = self._versions.get(nct_id)
+                if entry is not None:
+                    entry[0] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._studies.clear()
+            for entry in self._versions.values():
+                entry[0] += 1
+
+
+STUDY_CACHE = StudyCache()
+
+
+def _one_row_tables() -> List[str]:
+    """Tables with a single row per study: one spec, not built from a list."""
+    specs: Dict[str, List[Any]] = {}
+    for spec in TABLE_SPECS:
+        specs.setdefault(spec.table, []).append(spec)
+    return [
+        table_name
+        for table_name, table_specs in specs.items()
+        if len(table_specs) == 1 and table_specs[0].source is None
+    ]
+
+
+def _row_object(table_name: str, columns: List[str], interned: bool) -> sql.Composable:
+    return sql.SQL("jsonb_build_object({})").format(
+        sql.SQL(", ").join(
+            sql.SQL("{}, {}").format(
+                sql.Literal(column),
+                sql.SQL(text_expression("t", table_name, column, interned)),
+            )
+            for column in columns
+            if column != "nct_id"
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def _fetch_statement(interned: bool) -> str:
+    one_row_tables = _one_row_tables()
+    parts = []
+    for table_name, columns in column_map().items():
+        row = _row_object(table_name, columns, interned)
+        if table_name in one_row_tables:
+            value = sql.SQL("(SELECT {row} FROM {table} t WHERE t.nct_id = i.nct_id)")
+        else:
+            # Rows in the order they were first inserted
+            value = sql.SQL(
+                "(SELECT coalesce(jsonb_agg({row} ORDER BY t.id), '[]') "
+                "FROM {table} t WHERE t.nct_id = i.nct_id)"
+            )
+        parts.append(
+            sql.SQL("{}, {}").format(
+                sql.Literal(table_name),
+                value.format(row=row, table=sql.Identifier(table_name)),
+            )
+        )
+    return (
+        sql.SQL(
+            "SELECT i.nct_id, jsonb_build_object({}) FROM identification i "
+            "WHERE i.nct_id = ANY(%s)"
+        )
+        .format(sql.SQL(", ").join(parts))
+        .as_string(None)
+    )
+
+
+def fetch_studies(nct_ids: Iterable[str], cache: bool = True) -> Dict[str, Study]:
+    """Every table's rows of the given studies, by nct_id, fetched in one
+    round trip for the studies not in STUDY_CACHE. Unknown nct_ids are left
+    out of the result."""
+    studies: Dict[str, Study] = {}
+    missing = []
+    for nct_id in dict.fromkeys(nct_ids):
+        study = STUDY_CACHE.get(nct_id) if cache else None
+        if study is None:
+            missing.append(nct_id)
+        else:
+            studies[nct_id] = study
+    if missing:
+        # Taken before the query, so a flush that commits while it runs keeps
+        # its pre-write result out of the cache
+        versions = STUDY_CACHE.reserve(missing) if cache else {}
+        fetched: Dict[str, Study] = {}
+        try:
+            for nct_id, study in execute_query(
+                _fetch_statement(interning()), (missing,), prepare=True
+            ):
+                fetched[nct_id] = study
+        finally:
+            STUDY_CACHE.fill(versions, fetched)
+        studies.update(fetched)
+    return studies
+
+
+def fetch_study(nct_id: str, cache: bool = True) -> Optional[Study]:
+    """One study as fetch_studies() returns it, or None if it is not loaded."""
+    return fetch_studies((nct_id,), cache).get(nct_id)
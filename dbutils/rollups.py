@@ -0,0 +1,99 @@
+"""Trial counts per value of a few dashboard dimensions, kept up to date.
+
+`rollup_members` holds the distinct values every study has in each of
+ROLLUPS, and `rollup_counts` the number of studies per value. refresh()
+only recomputes the members of the studies it is given, and adds the
+difference to the counts, so a load updates them for the studies it wrote.
+Reading a dimension is then a scan of one primary key prefix.
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+from dbutils.helpers import execute_query, pooled_connection
+from dbutils.metrics import METRICS
+from dbutils.schema import interning, text_expression
+
+# Dimension -> (table, column, extra condition on the table's rows)
+ROLLUPS = {
+    "overall_status": ("status", "overall_status", None),
+    "phase": ("phases", "phase", None),
+    "condition": ("conditions", "name", None),
+    "country": ("facility", "country", None),
+    "sponsor_class": (
+        "collaborators",
+        "collaborator_class",
+        "t.collaborator_type = 'lead sponsor'",
+    ),
+}
+_REFRESH_CHUNK = 10_000
+
+
+def _members_query(interned: bool) -> str:
+    selects = []
+    for dimension, (table_name, column, condition) in ROLLUPS.items():
+        value = text_expression("t", table_name, column, interned)
+        selects.append(
+            f"SELECT t.nct_id, '{dimension}', {value} FROM {table_name} t "
+            f"WHERE t.nct_id = ANY(%(nct_ids)s) AND t.{column} IS NOT NULL"
+            + (f" AND {condition}" if condition else "")
+        )
+    # UNION also drops a study's repeated values, e.g. several sites in one
+    # country
+    return " UNION ".join(selects)
+
+
+@lru_cache(maxsize=None)
+def _refresh_statements(interned: bool) -> Tuple[str, str, str]:
+    add_counts = (
+        "INSERT INTO rollup_counts AS r (dimension, value, trials) "
+        "SELECT dimension, value, {sign}count(*) FROM {changed} "
+        "GROUP BY dimension, value "
+        "ON CONFLICT (dimension, value) "
+        "DO UPDATE SET trials = r.trials + excluded.trials"
+    )
+    remove = (
+        "WITH removed AS (DELETE FROM rollup_members "
+        "WHERE nct_id = ANY(%(nct_ids)s) RETURNING dimension, value) "
+        + add_counts.format(sign="-", changed="removed")
+    )
+    add = (
+        "WITH added AS (INSERT INTO rollup_members (nct_id, dimension, value) "
+        f"{_members_query(interned)} RETURNING dimension, value) "
+        + add_counts.format(sign="", changed="added")
+    )
+    prune = "DELETE FROM rollup_counts WHERE trials <= 0"
+    return remove, add, prune
+
+
+def refresh(nct_ids: Iterable[str]) -> None:
+    """Recount the studies `nct_ids` in every rollup, as they are now in the
+    tables, in one transaction per chunk of studies."""
+    nct_ids = sorted(set(nct_ids))
+    statements = _refresh_statements(interning())
+    for i in range(0, len(nct_ids), _REFRESH_CHUNK):
+        params = {"nct_ids": nct_ids[i : i + _REFRESH_CHUNK]}
+        with pooled_connection() as conn:
+            try:
+                with conn.cursor() as cur, METRICS.timer("db_seconds", phase="execute"):
+                    for statement in statements:
+                        cur.execute(statement, params)
+                with METRICS.timer("db_seconds", phase="commit"):
+                    conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+
+
+def rollup(dimension: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+    """(value, trials) of a dimension of ROLLUPS, most trials first."""
+    if dimension not in ROLLUPS:
+        raise ValueError(
+            f"Unknown rollup {dimension!r}, expected one of {', '.join(ROLLUPS)}"
+        )
+    return execute_query(
+        "SELECT value, trials FROM rollup_counts WHERE dimension = %s "
+        "ORDER BY trials DESC, value LIMIT %s",
+        (dimension, limit),
+        prepare=True,
+    )
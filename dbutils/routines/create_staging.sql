@@ -0,0 +1,2 @@
+CREATE TEMP TABLE {staging_name} ON COMMIT DROP AS
+SELECT {columns} FROM {table_name} WITH NO DATA;
\ No newline at end of file
@@ -0,0 +1,8 @@
+INSERT INTO {table_name} ({columns})
+(SELECT DISTINCT ON ({conflict_columns}) {columns} FROM {staging_name}
+WHERE ({conflict_columns}) IS NOT NULL
+ORDER BY {conflict_columns}, ctid DESC)
+UNION ALL
+SELECT {columns} FROM {staging_name}
+WHERE NOT (({conflict_columns}) IS NOT NULL)
+ON CONFLICT ({conflict_columns}) DO UPDATE SET {updates};
\ No newline at end of file
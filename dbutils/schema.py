@@ -0,0 +1,286 @@
+from functools import lru_cache
+from graphlib import TopologicalSorter
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Sequence, Set, Tuple
+import re
+
+DDL_DIR = Path(__file__).parent / "ddl"
+
+_FOREIGN_KEY = re.compile(
+    r"FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+\"?(\w+)\"?", re.IGNORECASE
+)
+
+
+# How the conflict keys of HASHED_KEY_TABLES are enforced: "columns" is the
+# UNIQUE constraint of their DDL file; "hashed" replaces it with a UNIQUE
+# constraint on HASH_COLUMN, a digest of the same columns computed by the
+# client (see conflict_key_digest).
+KEY_MODES = ("columns", "hashed")
+_KEY_MODE = "columns"
+# Tables whose conflict key spans several free-text columns
+HASHED_KEY_TABLES = (
+    "collaborators",
+    "contact",
+    "facility",
+    "groups",
+    "interventions",
+    "officials",
+    "outcome",
+)
+HASH_COLUMN = "conflict_key"
+
+_UNIQUE = re.compile(r"\bUNIQUE\s*\([^)]*\)", re.IGNORECASE)
+
+# With interning enabled (see set_interning), these columns hold the id of
+# their value in a dimension table instead of the text, see dbutils.interning
+INTERNED_COLUMNS: Dict[str, Dict[str, str]] = {
+    "collaborators": {"collaborator_name": "dim_organization"},
+    "conditions": {"name": "dim_condition"},
+    "design": {"study_type": "dim_study_type"},
+    "facility": {
+        "name": "dim_facility_name",
+        "city": "dim_city",
+        "country": "dim_country",
+    },
+    "interventions": {"intervention_type": "dim_intervention_type"},
+    "officials": {"affiliation": "dim_organization"},
+    "phases": {"phase": "dim_phase"},
+    "status": {"overall_status": "dim_overall_status"},
+}
+DIMENSION_TABLES = tuple(
+    sorted({dim for columns in INTERNED_COLUMNS.values() for dim in columns.values()})
+)
+_INTERNING = False
+
+
+def set_key_mode(mode: str) -> None:
+    global _KEY_MODE
+    if mode not in KEY_MODES:
+        raise ValueError(
+            f"Unknown key mode {mode!r}, expected one of {', '.join(KEY_MODES)}"
+        )
+    _KEY_MODE = mode
+    split_ddl.cache_clear()
+    child_tables.cache_clear()
+
+
+def key_mode() -> str:
+    return _KEY_MODE
+
+
+def set_interning(enabled: bool) -> None:
+    global _INTERNING
+    _INTERNING = enabled
+    split_ddl.cache_clear()
+    foreign_keys.cache_clear()
+    table_order.cache_clear()
+    child_tables.cache_clear()
+
+
+def interning() -> bool:
+    return _INTERNING
+
+
+def text_expression(alias: str, table_name: str, column: str, interned: bool) -> str:
+    """SQL for the text of `alias.column`: the column itself, or the value
+    it refers to in its dimension table if it is interned."""
+    dimension = INTERNED_COLUMNS.get(table_name, {}).get(column) if interned else None
+    if dimension is None:
+        return f"{alias}.{column}"
+    return f"(SELECT dim.value FROM {dimension} dim WHERE dim.id = {alias}.{column})"
+
+
+def table_names() -> Tuple[str, ...]:
+    """Every table of the schema: one per file in `dbutils/ddl`, plus the
+    dimension tables when interning is enabled."""
+    names = tuple(sorted(path.stem for path in DDL_DIR.glob("*.sql")))
+    return names + DIMENSION_TABLES if _INTERNING else names
+
+
+def _intern_columns(table_name: str, ddl: str) -> str:
+    """Turn the INTERNED_COLUMNS of a table into ids referencing their
+    dimension tables."""
+    foreign_keys = []
+    for column, dimension in INTERNED_COLUMNS[table_name].items():
+        ddl = re.sub(
+            rf'^(\s*"?{column}"?\s+)TEXT\b', r"\1INTEGER", ddl, count=1, flags=re.M
+        )
+        foreign_keys.append(f"FOREIGN KEY ({column}) REFERENCES {dimension} (id)")
+    return re.sub(
+        r"\n\);",
+        lambda _: ",\n    " + ",\n    ".join(foreign_keys) + "\n);",
+        ddl,
+        count=1,
+    )
+
+
+def read_ddl(table_name: str) -> str:
+    if table_name in DIMENSION_TABLES:
+        return (
+            f"CREATE TABLE IF NOT EXISTS {table_name} (\n"
+            "    id SERIAL PRIMARY KEY,\n"
+            "    value TEXT NOT NULL UNIQUE\n"
+            ");\n"
+        )
+    with open(DDL_DIR / f"{table_name}.sql", "r") as f:
+        ddl = f.read()
+    if _KEY_MODE == "hashed" and table_name in HASHED_KEY_TABLES:
+        ddl = _UNIQUE.sub(
+            f"{HASH_COLUMN} BYTEA NOT NULL,\n    UNIQUE ({HASH_COLUMN})", ddl, count=1
+        )
+    if _INTERNING and table_name in INTERNED_COLUMNS:
+        ddl = _intern_columns(table_name, ddl)
+    return ddl
+
+
+def conflict_key_digest(values: Sequence[Any]) -> bytes:
+    """16-byte digest identifying a conflict key.
+
+    PostgreSQL text cannot contain NUL, so it separates the values, and NULL
+    is encoded apart from every string. Unlike the UNIQUE constraint it
+    replaces, keys with NULLs therefore conflict like any other.
+    """
+    encoded = "\0".join("\1" if value is None else f"\2{value}" for value in values)
+    return blake2b(encoded.encode(), digest_size=16).digest()
+
+
+@lru_cache(maxsize=None)
+def foreign_keys() -> Dict[str, Set[str]]:
+    """Map every table (see table_names) to the tables it references."""
+    graph = {}
+    for table_name in table_names():
+        graph[table_name] = {
+            parent
+            for parent in _FOREIGN_KEY.findall(read_ddl(table_name))
+            if parent != table_name
+        }
+    return graph
+
+
+@lru_cache(maxsize=None)
+def table_order() -> Tuple[str, ...]:
+    """All tables with every referenced table placed before its referrers.
+
+    Tables at the same depth are sorted by name so the order is stable.
+    """
+    sorter = TopologicalSorter(foreign_keys())
+    sorter.prepare()
+    order = []
+    while sorter.is_active():
+        ready = sorted(sorter.get_ready())
+        order.extend(ready)
+        sorter.done(*ready)
+    return tuple(order)
+
+
+_CREATE_TABLE = re.compile(r"CREATE\s+TABLE", re.IGNORECASE)
+_TABLE_CONSTRAINT = re.compile(
+    r"^(PRIMARY\s+KEY|UNIQUE|FOREIGN\s+KEY|CONSTRAINT)\b", re.IGNORECASE
+)
+_INLINE_PRIMARY_KEY = re.compile(r"\s+PRIMARY\s+KEY\b", re.IGNORECASE)
+
+
+class TableDDL(NamedTuple):
+    """One DDL file split into what bulk loading can defer."""
+
+    name: str
+    create_table: str  # CREATE TABLE without keys or constraints
+    keys: List[str]  # PRIMARY KEY / UNIQUE clauses for ALTER TABLE ... ADD
+    foreign_keys: List[str]  # FOREIGN KEY clauses for ALTER TABLE ... ADD
+    indexes: List[str]  # CREATE INDEX statements
+
+
+def _split_top_level(body: str) -> List[str]:
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(body):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(body[start:i].strip())
+            start = i + 1
+    items.append(body[start:].strip())
+    return [item for item in items if item]
+
+
+@lru_cache(maxsize=None)
+def split_ddl(table_name: str) -> TableDDL:
+    """Separate the bare table definition from its keys, foreign keys and
+    secondary indexes, so they can be created after the data is loaded."""
+    ddl = re.sub(r"--[^\n]*", "", read_ddl(table_name))
+    statements = [s.strip() for s in ddl.split(";") if s.strip()]
+
+    create_table, keys, fks, indexes = None, [], [], []
+    for statement in statements:
+        if not _CREATE_TABLE.match(statement):
+            indexes.append(statement + ";")
+            continue
+        head, body = statement.split("(", 1)
+        body = body[: body.rindex(")")]
+        columns = []
+        for item in _split_top_level(body):
+            constraint = _TABLE_CONSTRAINT.match(item)
+            if constraint and constraint.group(1).upper().startswith("FOREIGN"):
+                fks.append(item)
+            elif constraint:
+                keys.append(item)
+            elif _INLINE_PRIMARY_KEY.search(item):
+                column = item.split()[0]
+                columns.append(_INLINE_PRIMARY_KEY.sub("", item))
+                keys.insert(0, f"PRIMARY KEY ({column})")
+            else:
+                columns.append(item)
+        create_table = head.rstrip() + " (\n    " + ",\n    ".join(columns) + "\n);"
+    return TableDDL(table_name, create_table, keys, fks, indexes)
+
+
+def clause_columns(clause: str) -> List[str]:
+    """Columns of the first parenthesized list in a key or foreign key clause."""
+    inner = clause[clause.index("(") + 1 : clause.index(")")]
+    return [column.strip().strip('"') for column in inner.split(",")]
+
+
+def referenced_columns(foreign_key: str) -> Tuple[str, List[str]]:
+    """The referenced table and columns of a FOREIGN KEY clause."""
+    target = re.split(r"REFERENCES", foreign_key, flags=re.IGNORECASE)[1]
+    return target.split("(")[0].strip().strip('"'), clause_columns(target)
+
+
+@lru_cache(maxsize=None)
+def child_tables() -> FrozenSet[str]:
+    """Tables holding any number of rows per study: those with a foreign key
+    to `identification` that is not also their primary key. The replace load
+    mode deletes a study's rows from them and appends its new ones (see
+    helpers.copy_replace)."""
+    children = set()
+    for table_name in table_names():
+        table = split_ddl(table_name)
+        keys = [clause_columns(key) for key in table.keys]
+        for foreign_key in table.foreign_keys:
+            target, _ = referenced_columns(foreign_key)
+            if target == "identification" and clause_columns(foreign_key) not in keys:
+                children.add(table_name)
+    return frozenset(children)
+
+
+def child_references(table_name: str) -> List[Tuple[str, str, str]]:
+    """(child table, its column, referenced column of `table_name`) for every
+    single-column foreign key from child_tables() to `table_name`."""
+    references = []
+    for child in sorted(child_tables()):
+        for foreign_key in split_ddl(child).foreign_keys:
+            target, target_columns = referenced_columns(foreign_key)
+            columns = clause_columns(foreign_key)
+            if target == table_name and len(columns) == 1:
+                references.append((child, columns[0], target_columns[0]))
+    return references
+
+
+def serial_columns(table_name: str) -> Set[str]:
+    return set(
+        re.findall(
+            r"^\s*\"?(\w+)\"?\s+(?:BIG)?SERIAL\b", read_ddl(table_name), re.M | re.I
+        )
+    )
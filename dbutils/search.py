@@ -0,0 +1,87 @@
+"""Ranked full-text search over studies.
+
+`identification`, `outcome` and `interventions` each have a generated
+`search_vector` column with a GIN index, so it is kept up to date by every
+load mode. The weights rank a match in the brief title (A) above the
+official title and intervention names (B), outcome measures and the brief
+summary (C), and the detailed description (D). A study's rank is that of
+its best matching row.
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional
+
+from dbutils.helpers import execute_query
+from dbutils.schema import interning, text_expression
+
+# Must match the configuration of the search_vector columns in dbutils/ddl
+SEARCH_CONFIG = "english"
+_SEARCHED_TABLES = ("identification", "outcome", "interventions")
+
+
+class SearchHit(NamedTuple):
+    nct_id: str
+    brief_title: Optional[str]
+    overall_status: Optional[str]
+    study_type: Optional[str]
+    rank: float
+
+
+@lru_cache(maxsize=None)
+def _search_statement(interned: bool) -> str:
+    matches = " UNION ALL ".join(
+        f"SELECT t.nct_id, ts_rank_cd(t.search_vector, q.query) AS rank "
+        f"FROM {table_name} t, q WHERE t.search_vector @@ q.query"
+        for table_name in _SEARCHED_TABLES
+    )
+    overall_status = text_expression("s", "status", "overall_status", interned)
+    study_type = text_expression("d", "design", "study_type", interned)
+    phase = text_expression("p", "phases", "phase", interned)
+    # A NULL filter matches every study, so one statement serves every
+    # combination of filters
+    return (
+        f"WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', %(query)s) "
+        f"AS query), matches AS ({matches}) "
+        f"SELECT m.nct_id, i.brief_title, {overall_status}, {study_type}, "
+        "max(m.rank) AS rank FROM matches m "
+        "JOIN identification i ON i.nct_id = m.nct_id "
+        "LEFT JOIN status s ON s.nct_id = m.nct_id "
+        "LEFT JOIN design d ON d.nct_id = m.nct_id "
+        f"WHERE (%(statuses)s::text[] IS NULL OR {overall_status} = ANY(%(statuses)s)) "
+        f"AND (%(study_types)s::text[] IS NULL OR {study_type} = ANY(%(study_types)s)) "
+        "AND (%(phases)s::text[] IS NULL OR EXISTS (SELECT 1 FROM phases p "
+        f"WHERE p.nct_id = m.nct_id AND {phase} = ANY(%(phases)s))) "
+        "GROUP BY m.nct_id, i.brief_title, s.overall_status, d.study_type "
+        "ORDER BY rank DESC, m.nct_id LIMIT %(k)s"
+    )
+
+
+def _filter(values: Optional[Iterable[str]]) -> Optional[List[str]]:
+    return None if values is None else list(values)
+
+
+def search(
+    query: str,
+    k: int = 10,
+    statuses: Optional[Iterable[str]] = None,
+    phases: Optional[Iterable[str]] = None,
+    study_types: Optional[Iterable[str]] = None,
+) -> List[SearchHit]:
+    """The `k` studies that best match `query`, best first.
+
+    `query` uses web search syntax: words are ANDed, "quoted phrases",
+    `or` and `-excluded` words. `statuses` (overall_status), `phases` and
+    `study_types` keep only studies with one of the given values.
+    """
+    rows = execute_query(
+        _search_statement(interning()),
+        {
+            "query": query,
+            "k": k,
+            "statuses": _filter(statuses),
+            "phases": _filter(phases),
+            "study_types": _filter(study_types),
+        },
+        prepare=True,
+    )
+    return [SearchHit(*row) for row in rows]
@@ -0,0 +1,132 @@
+from dbutils.helpers import execute_query
+from hashlib import blake2b
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import json
+
+# (nct_id, lastUpdatePostDate as YYYY-MM-DD, content fingerprint)
+StudyVersion = Tuple[str, Optional[str], str]
+
+SYNC_COLUMNS = ["nct_id", "last_update_post_date", "fingerprint"]
+_COMMIT_CHUNK = 10_000
+# Fingerprint of the studies indexed by a full load, which does not decode
+# studies to fingerprint them (see SyncIndex.seed). Until an incremental run
+# records their fingerprint, they are matched on their date alone.
+UNKNOWN_FINGERPRINT = ""
+
+
+def _normalize_date(date: Optional[str]) -> Optional[str]:
+    # Same normalization as PartialDateMixin: partial YYYY-MM dates become YYYY-MM-01
+    if date and len(date.split("-")) == 2:
+        return date + "-01"
+    return date
+
+
+def study_version(study: Dict[str, Any]) -> StudyVersion:
+    """Identify the version of a raw study dict without validating it.
+
+    The fingerprint hashes a canonical encoding of the whole study, so key
+    order and whitespace differences between exports do not count as changes.
+    """
+    protocol = study["protocolSection"]
+    nct_id = protocol["identificationModule"]["nctId"]
+    last_update = (
+        (protocol.get("statusModule") or {}).get("lastUpdatePostDateStruct") or {}
+    ).get("date")
+    canonical = json.dumps(study, sort_keys=True, separators=(",", ":"))
+    fingerprint = blake2b(canonical.encode(), digest_size=16).hexdigest()
+    return nct_id, _normalize_date(last_update), fingerprint
+
+
+def is_loaded(
+    indexed: Optional[Tuple[Optional[str], str]], version: StudyVersion
+) -> bool:
+    """Whether `indexed`, the SyncIndex.index entry of a study, is `version`."""
+    return (
+        indexed is not None
+        and indexed[0] == version[1]
+        and indexed[1] in (version[2], UNKNOWN_FINGERPRINT)
+    )
+
+
+class SyncIndex:
+    """What was last loaded for every nct_id, kept in the `sync_index` table
+    and held in memory as a dict for the duration of a run."""
+
+    def __init__(self, index: Optional[Dict[str, Tuple[Optional[str], str]]] = None):
+        self.index = index if index is not None else {}
+        self.seen: Set[str] = set()
+        self.pending: List[StudyVersion] = []
+        self.skipped = 0
+
+    @classmethod
+    def load(cls) -> "SyncIndex":
+        rows = execute_query(
+            "SELECT nct_id, last_update_post_date::text, fingerprint FROM sync_index"
+        )
+        return cls({nct_id: (date, fingerprint) for nct_id, date, fingerprint in rows})
+
+    def is_unchanged(self, version: StudyVersion) -> bool:
+        """Mark the study as present in this export and check it against the
+        index. Unchanged studies are counted as skipped."""
+        nct_id, _, fingerprint = version
+        self.seen.add(nct_id)
+        indexed = self.index.get(nct_id)
+        if not is_loaded(indexed, version):
+            return False
+        if indexed[1] != fingerprint:
+            # Indexed by a full load: from now on, compared in full
+            self.record(version)
+        self.skipped += 1
+        return True
+
+    def record(self, version: StudyVersion) -> None:
+        """Remember a study that was (re)loaded, to be written by commit()."""
+        self.pending.append(version)
+
+    def commit(self, writer: Callable) -> None:
+        """Write the recorded versions once the study rows themselves are
+        committed, so an interrupted run never marks unloaded studies as synced.
+
+        `writer` is one of MigratorMixIn.LOAD_MODES.
+        """
+        for i in range(0, len(self.pending), _COMMIT_CHUNK):
+            writer(
+                "sync_index",
+                SYNC_COLUMNS,
+                [list(version) for version in self.pending[i : i + _COMMIT_CHUNK]],
+                ["nct_id"],
+            )
+        for nct_id, last_update, fingerprint in self.pending:
+            self.index[nct_id] = (last_update, fingerprint)
+        self.pending.clear()
+
+    @staticmethod
+    def seed(nct_ids: Iterable[str]) -> None:
+        """Index studies written by a full load, which has no versions to
+        record, with the lastUpdatePostDate they were loaded with."""
+        nct_ids = sorted(set(nct_ids))
+        for i in range(0, len(nct_ids), _COMMIT_CHUNK):
+            execute_query(
+                "INSERT INTO sync_index (nct_id, last_update_post_date, fingerprint) "
+                "SELECT i.nct_id, s.last_update_post_date, %s FROM identification i "
+                "LEFT JOIN status s ON s.nct_id = i.nct_id WHERE i.nct_id = ANY(%s) "
+                "ON CONFLICT (nct_id) DO UPDATE SET "
+                "last_update_post_date = excluded.last_update_post_date, "
+                "fingerprint = excluded.fingerprint",
+                (UNKNOWN_FINGERPRINT, nct_ids[i : i + _COMMIT_CHUNK]),
+            )
+
+    def missing(self) -> Set[str]:
+        """Studies in the index that did not appear in this export."""
+        return self.index.keys() - self.seen
+
+    def report(self) -> None:
+        missing = sorted(self.missing())
+        print(
+            f"Incremental sync: {len(self.seen) - self.skipped} new or changed, "
+            f"{self.skipped} unchanged, {len(missing)} no longer in the export"
+        )
+        if missing:
+            shown = ", ".join(missing[:20])
+            more = f" and {len(missing) - 20} more" if len(missing) > 20 else ""
+            print(f"  missing: {shown}{more}")
@@ -0,0 +1,371 @@
+"""Declarative mapping from a validated study to the rows of every table.
+
+Each RowSpec produces the rows of one table, either one row per study or
+one per item of a list in the study. Each Column takes its value from a
+dotted attribute path: paths starting with `item` are relative to the list
+item, other paths to the study. COLUMN_MAP is derived from these specs, and
+compile_extractor turns them into one generated function that emits all
+rows of a study in a single pass.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import json
+
+from dbutils.geo import geo_cell
+
+Row = Tuple[str, Tuple[Any, ...]]
+
+
+class Column(NamedTuple):
+    name: str
+    # Dotted attribute path; None for a constant `value`
+    path: Optional[str]
+    transform: Optional[Callable[[Any], Any]] = None
+    value: Any = None
+
+
+class RowSpec(NamedTuple):
+    table: str
+    columns: Tuple[Column, ...]
+    # Dotted path of the list to emit one row per item of; None for one row
+    # per study
+    source: Optional[str] = None
+
+
+def _len(values: Optional[list]) -> int:
+    return len(values or ())
+
+
+def _first(values: Optional[list]) -> Any:
+    return values[0] if values else None
+
+
+def _is_patient_registry(study_type: Optional[str]) -> Optional[bool]:
+    return study_type == "PATIENT_REGISTRY" if study_type else None
+
+
+def _latitude(point) -> Optional[float]:
+    return point.lat if point is not None else None
+
+
+def _longitude(point) -> Optional[float]:
+    return point.lon if point is not None else None
+
+
+def _contacts_json(contacts: Optional[list]) -> Optional[str]:
+    if not contacts:
+        return None
+    return json.dumps({"contacts": [contact.model_dump() for contact in contacts]})
+
+
+P = "protocolSection"
+NCT_ID = Column("nct_id", f"{P}.identificationModule.nctId")
+
+
+def _module(module: str, *columns: Tuple[str, str]) -> Tuple[Column, ...]:
+    """NCT_ID followed by columns read from one module of the protocol."""
+    return (NCT_ID,) + tuple(
+        Column(name, f"{P}.{module}.{path}") for name, path in columns
+    )
+
+
+def _items(*columns: Tuple[str, str]) -> Tuple[Column, ...]:
+    """NCT_ID followed by columns read from the current list item."""
+    return (NCT_ID,) + tuple(
+        Column(name, f"item.{path}" if path else "item") for name, path in columns
+    )
+
+
+_SPONSORS = f"{P}.sponsorCollaboratorsModule"
+_RESPONSIBLE_PARTY = (
+    Column("responsible_party_type", f"{_SPONSORS}.responsibleParty.type"),
+    Column("investigator_name", f"{_SPONSORS}.responsibleParty.investigatorFullName"),
+    Column(
+        "investigator_affiliation",
+        f"{_SPONSORS}.responsibleParty.investigatorAffiliation",
+    ),
+)
+
+
+def _outcomes(source: str, kind: str) -> RowSpec:
+    return RowSpec(
+        "outcome",
+        (
+            NCT_ID,
+            Column("type", None, value=kind),
+            Column("measure", "item.measure"),
+            Column("description", "item.description"),
+            Column("time_frame", "item.timeFrame"),
+        ),
+        f"{P}.outcomesModule.{source}",
+    )
+
+
+# In the order migrate_to_db has always emitted them
+TABLE_SPECS: Tuple[RowSpec, ...] = (
+    RowSpec(
+        "identification",
+        _module(
+            "identificationModule",
+            ("nct_id_alias", "nctIdAlias"),
+            ("num_nct_aliases", "numNctAliases"),
+            ("org_study_id", "orgStudyIdInfo.id"),
+            ("org_study_id_type", "orgStudyIdInfo.type"),
+            ("org_study_id_link", "secondaryIdInfo.secondaryIdLink"),
+            ("num_secondary_ids", "numSecondaryIds"),
+            ("brief_title", "briefTitle"),
+            ("official_title", "officialTitle"),
+            ("acronym", "acronym"),
+            ("org_name", "organization.fullName"),
+            ("org_class", "organization.class_"),
+        )
+        + (
+            Column("brief_summary", f"{P}.descriptionModule.briefSummary"),
+            Column(
+                "detailed_description", f"{P}.descriptionModule.detailedDescription"
+            ),
+            Column("num_conditions", f"{P}.conditionsModule.conditions", _len),
+        ),
+    ),
+    RowSpec(
+        "status",
+        _module(
+            "statusModule",
+            ("status_verified_date", "statusVerifiedDate"),
+            ("overall_status", "overallStatus"),
+            ("last_known_status", "lastKnownStatus"),
+            ("why_stopped", "whyStopped"),
+            ("start_date", "startDateStruct.date"),
+            ("primary_completion_date", "primaryCompletionDateStruct.date"),
+            ("completion_date", "completionDateStruct.date"),
+            ("study_first_submit_date", "studyFirstSubmitDate"),
+            ("study_first_submit_qc_date", "studyFirstSubmitQcDate"),
+            ("study_first_post_date", "studyFirstPostDateStruct.date"),
+            ("results_waived", "resultsWaived"),
+            ("results_first_submit_date", "resultsFirstSubmitDate"),
+            ("results_first_submit_qc_date", "resultsFirstSubmitQcDate"),
+            ("results_first_post_date", "resultsFirstPostDateStruct.date"),
+            ("last_update_submit_date", "lastUpdateSubmitDate"),
+            ("last_update_post_date", "lastUpdatePostDateStruct.date"),
+        ),
+    ),
+    RowSpec(
+        "oversight",
+        _module(
+            "oversightModule",
+            ("oversight_has_dmc", "oversightHasDmc"),
+            ("is_fda_regulated_drug", "isFdaRegulatedDrug"),
+            ("is_fda_regulated_device", "isFdaRegulatedDevice"),
+            ("is_ppsd", "isPpsd"),
+            ("is_us_export", "isUsExport"),
+            ("is_unapproved_device", "isUnapprovedDevice"),
+            ("is_fda_violation", "isFdaViolation"),
+        ),
+    ),
+    RowSpec(
+        "design",
+        _module(
+            "designModule",
+            ("study_type", "studyType"),
+            ("expanded_access_individual", "expandedAccessTypes.individual"),
+            ("expanded_access_intermediate", "expandedAccessTypes.intermediate"),
+            ("expanded_access_treatment", "expandedAccessTypes.treatment"),
+        )
+        + (
+            Column(
+                "patient_registry",
+                f"{P}.designModule.studyType",
+                _is_patient_registry,
+            ),
+        )
+        + _module(
+            "designModule",
+            ("num_phases", "numPhases"),
+            ("allocation", "designInfo.allocation"),
+            ("intervention_model", "designInfo.interventionModel"),
+            ("primary_purpose", "designInfo.primaryPurpose"),
+            ("observational_model", "designInfo.observationalModel"),
+            ("biospec_retention", "bioSpec.retention"),
+            ("biospec_description", "bioSpec.description"),
+            ("enrollment_count", "enrollmentInfo.count"),
+        )[1:],
+    ),
+    RowSpec("phases", _items(("phase", "")), f"{P}.designModule.phases"),
+    RowSpec(
+        "eligibility",
+        _module(
+            "eligibilityModule",
+            ("accepts_healthy_volunteers", "healthyVolunteers"),
+            ("gender", "sex"),
+            ("gender_based", "genderBased"),
+            ("min_age", "minimumAge"),
+            ("max_age", "maximumAge"),
+            ("population_description", "studyPopulation"),
+            ("sampling_method", "samplingMethod"),
+        ),
+    ),
+    RowSpec("conditions", _items(("name", "")), f"{P}.conditionsModule.conditions"),
+    RowSpec(
+        "collaborators",
+        (NCT_ID,)
+        + _RESPONSIBLE_PARTY
+        + (
+            Column("collaborator_name", f"{_SPONSORS}.leadSponsor.name"),
+            Column("collaborator_class", f"{_SPONSORS}.leadSponsor.class_"),
+            Column("collaborator_type", None, value="lead sponsor"),
+        ),
+    ),
+    RowSpec(
+        "collaborators",
+        (NCT_ID,)
+        + _RESPONSIBLE_PARTY
+        + (
+            Column("collaborator_name", "item.name"),
+            Column("collaborator_class", "item.class_"),
+            Column("collaborator_type", None, value="collaborator"),
+        ),
+        f"{_SPONSORS}.collaborators",
+    ),
+    _outcomes("primaryOutcomes", "primary"),
+    _outcomes("secondaryOutcomes", "secondary"),
+    _outcomes("otherOutcomes", "other"),
+    RowSpec(
+        "interventions",
+        _items(
+            ("intervention_type", "type"),
+            ("intervention_name", "name"),
+            ("intervention_description", "description"),
+        )
+        + (Column("group_label", "item.armGroupLabels", _first),),
+        f"{P}.armsInterventionsModule.interventions",
+    ),
+    RowSpec(
+        "groups",
+        _items(
+            ("group_type", "type"),
+            ("group_description", "description"),
+            ("group_label", "label"),
+        ),
+        f"{P}.armsInterventionsModule.armGroups",
+    ),
+    RowSpec(
+        "facility",
+        _items(
+            ("name", "facility"),
+            ("status", "status"),
+            ("city", "city"),
+            ("state", "state"),
+            ("zip", "zip"),
+            ("country", "country"),
+        )
+        + (
+            Column("contacts", "item.contacts", _contacts_json),
+            Column("latitude", "item.geoPoint", _latitude),
+            Column("longitude", "item.geoPoint", _longitude),
+            Column("geo_cell", "item.geoPoint", geo_cell),
+        ),
+        f"{P}.contactsLocationsModule.locations",
+    ),
+    RowSpec(
+        "contact",
+        _items(
+            ("name", "name"), ("role", "role"), ("phone", "phone"), ("email", "email")
+        ),
+        f"{P}.contactsLocationsModule.centralContacts",
+    ),
+    RowSpec(
+        "officials",
+        _items(("name", "name"), ("role", "role"), ("affiliation", "affiliation")),
+        f"{P}.contactsLocationsModule.overallOfficials",
+    ),
+)
+
+
+def column_map(specs: Sequence[RowSpec] = TABLE_SPECS) -> Dict[str, List[str]]:
+    """Column names per table; every spec of a table must agree on them."""
+    columns: Dict[str, List[str]] = {}
+    for spec in specs:
+        names = [column.name for column in spec.columns]
+        if columns.setdefault(spec.table, names) != names:
+            raise ValueError(f"Row specs for {spec.table} disagree on its columns")
+    return columns
+
+
+class _Compiler:
+    """Emits the source of an extractor. Every prefix of a study path is read
+    once into a local, outside of any loop, so rows are built from locals and
+    item attributes only."""
+
+    def __init__(self):
+        self.lines = [
+            "def extract(study):",
+            "    rows = []",
+            "    append = rows.append",
+        ]
+        self.namespace: Dict[str, Any] = {}
+        self.locals: Dict[Tuple[str, Any], str] = {}
+
+    def study_value(self, path: str, transform: Optional[Callable] = None) -> str:
+        key = (path, transform)
+        if key in self.locals:
+            return self.locals[key]
+        if transform is not None:
+            expression = f"{self.function(transform)}({self.study_value(path)})"
+        elif "." in path:
+            parent, attribute = path.rsplit(".", 1)
+            expression = f"{self.study_value(parent)}.{attribute}"
+        else:
+            expression = f"study.{path}"
+        name = self.locals[key] = f"v{len(self.locals)}"
+        self.lines.append(f"    {name} = {expression}")
+        return name
+
+    def function(self, transform: Callable) -> str:
+        name = f"_{transform.__name__.lstrip('_')}"
+        self.namespace[name] = transform
+        return name
+
+    def constant(self, value: Any) -> str:
+        name = f"c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def column(self, column: Column) -> str:
+        if column.path is None:
+            return self.constant(column.value)
+        if column.path == "item" or column.path.startswith("item."):
+            if column.transform is None:
+                return column.path
+            return f"{self.function(column.transform)}({column.path})"
+        return self.study_value(column.path, column.transform)
+
+    def row(self, spec: RowSpec) -> None:
+        values = [self.column(column) for column in spec.columns]
+        row = f"append(({spec.table!r}, ({', '.join(values)},)))"
+        if spec.source is None:
+            self.lines.append(f"    {row}")
+        else:
+            items = self.study_value(spec.source)
+            self.lines.append(f"    for item in {items} or ():")
+            self.lines.append(f"        {row}")
+
+
+def compile_extractor(
+    specs: Sequence[RowSpec] = TABLE_SPECS,
+) -> Callable[[Any], List[Row]]:
+    """Generate `extract(study) -> [(table, row), ...]` for validated studies.
+
+    The generated source is kept on the function as `__source__`.
+    """
+    compiler = _Compiler()
+    for spec in specs:
+        compiler.row(spec)
+    compiler.lines.append("    return rows")
+    source = "\n".join(compiler.lines) + "\n"
+    exec(compile(source, "<tablespec.extract>", "exec"), compiler.namespace)
+    extract = compiler.namespace["extract"]
+    extract.__source__ = source
+    return extract
+
+
+extract_rows = compile_extractor()
@@ -1,27 +1,457 @@
+import argparse
+import asyncio
 import json
-from models import ClinicalTrialStudy
-from dbutils.helpers import init_database
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Collection, Iterator, Optional, Tuple
+from models import ClinicalTrialStudy, parse_study
+from reader import iter_raw_studies
+from pipeline import StudyTransformError, transform_parallel
+from sharding import ShardedLoader
+from checkpoint import Checkpoint, graceful_stop
+from dbutils.helpers import (
+    execute_query,
+    existing_interning,
+    existing_key_mode,
+    finalize_database,
+    init_database,
+)
+from dbutils.metrics import METRICS, configure_sinks
+from dbutils.migrator import MigratorMixIn
+from dbutils.rollups import refresh as refresh_rollups
+from dbutils.schema import set_interning
+from dbutils.sync import SyncIndex, study_version
 from tqdm import tqdm
 
 
-def main(init_db: bool = True):
-    if init_db:
-        init_database()
+def load_studies(
+    path: str,
+    workers: int = 1,
+    chunk_size: int = 64,
+    sync: Optional[SyncIndex] = None,
+    start_offset: int = 0,
+    initial: int = 0,
+    projected: bool = False,
+) -> Iterator[int]:
+    """Queue the rows of every study in `path` from byte `start_offset` on,
+    yielding the input offset just past each study once its rows are queued.
+
+    With a SyncIndex, studies whose version is already loaded are skipped
+    before validation and the others are recorded for SyncIndex.commit.
+    With `projected`, studies are validated without the sections the
+    migrator never reads (see models.parse_study).
+    """
+    if workers > 1:
+        # Validation and row building run in a process pool; this process only
+        # replays the rows into the batch queues, in input order.
+        end_offsets = deque()
 
-    with open("ctg-studies.json", "r") as f:
-        clinical_studies = json.load(f)
+        def raw_studies():
+            for offset, raw in iter_raw_studies(path, start_offset):
+                end_offsets.append(offset + len(raw))
+                yield raw
 
-    for i in tqdm(range(len(clinical_studies)), desc="Processing studies"):
         try:
-            parsed_study = ClinicalTrialStudy.model_validate(clinical_studies[i])
-            if i == len(clinical_studies) - 1:
-                parsed_study.migrate_to_db(batch=True, flush_all=True)
-            else:
-                parsed_study.migrate_to_db(batch=True)
-        except Exception as e:
-            open("errors.json", "a").write(json.dumps(clinical_studies[i]) + "\n")
+            for _, rows, version in tqdm(
+                transform_parallel(
+                    raw_studies(),
+                    workers,
+                    chunk_size,
+                    sync.index if sync is not None else None,
+                    projected,
+                ),
+                desc="Processing studies",
+                initial=initial,
+            ):
+                end_offset = end_offsets.popleft()
+                METRICS.inc("studies")
+                if sync is not None and sync.is_unchanged(version):
+                    yield end_offset
+                    continue
+                for table_name, values in rows:
+                    MigratorMixIn.add_to_batch(table_name, values)
+                if sync is not None:
+                    sync.record(version)
+                yield end_offset
+        except StudyTransformError as e:
+            open("errors.json", "a").write(e.raw.decode() + "\n")
             raise e
+    else:
+        # Studies are streamed one at a time (JSON array or JSON Lines), so
+        # memory stays flat regardless of the size of the export.
+        for offset, raw in tqdm(
+            iter_raw_studies(path, start_offset),
+            desc="Processing studies",
+            initial=initial,
+        ):
+            METRICS.inc("studies")
+            try:
+                started = time.perf_counter()
+                if sync is None:
+                    # Validated straight from the raw bytes, no dict tree
+                    parsed_study = parse_study(raw, projected)
+                else:
+                    study = json.loads(raw)
+                    version = study_version(study)
+                    if sync.is_unchanged(version):
+                        yield offset + len(raw)
+                        continue
+                    started = time.perf_counter()
+                    if projected:
+                        parsed_study = parse_study(raw, projected=True)
+                    else:
+                        parsed_study = ClinicalTrialStudy.model_validate(study)
+                METRICS.observe("parse_seconds", time.perf_counter() - started)
+                parsed_study.migrate_to_db(batch=True)
+                if sync is not None:
+                    sync.record(version)
+            except Exception as e:
+                open("errors.json", "a").write(raw.decode() + "\n")
+                raise e
+            yield offset + len(raw)
+
+
+def _prepare(
+    path: str,
+    init_db: bool,
+    load_mode: str,
+    bulk: bool,
+    incremental: bool,
+    resume: bool,
+    hashed_keys: bool = False,
+    interned: bool = False,
+    repair: bool = True,
+) -> Tuple[Optional[SyncIndex], Checkpoint]:
+    if incremental and (init_db or bulk):
+        raise ValueError("Incremental loads run against the existing tables")
+    if resume:
+        # Everything up to the checkpoint is committed, so the tables are kept
+        # and the input is read from the checkpointed offset on.
+        if init_db:
+            raise ValueError("Resuming needs the tables of the interrupted load")
+        checkpoint = Checkpoint.load(path)
+        print(f"Resuming after {checkpoint.studies} studies (byte {checkpoint.offset})")
+    else:
+        checkpoint = Checkpoint(path)
+    if bulk:
+        # Bare tables are loaded with plain COPY; keys, foreign keys and indexes
+        # are only built (and violations reported) once everything is in.
+        if not (init_db or resume):
+            raise ValueError("Bulk loading needs freshly initialized tables")
+        if interned:
+            raise ValueError("Interned columns need the dimension tables' keys")
+        if resume and not repair:
+            # Studies written after the checkpoint are appended a second time,
+            # and only the repair removes the copies before the keys are added
+            raise ValueError("Resuming a bulk load needs the repair of duplicate keys")
+        load_mode = "bulk"
+    MigratorMixIn.set_load_mode(load_mode)
+    key_mode = "hashed" if hashed_keys else "columns"
+    if not init_db:
+        # Rows are built for the key mode the existing tables were created in
+        existing = existing_key_mode()
+        if hashed_keys and existing == "columns":
+            raise ValueError("The existing tables were not created with hashed keys")
+        key_mode = existing or key_mode
+        existing_interned = existing_interning()
+        if interned and existing_interned is False:
+            raise ValueError("The existing tables were not created with interning")
+        interned = interned if existing_interned is None else existing_interned
+    MigratorMixIn.set_key_mode(key_mode)
+    set_interning(interned)
+    if init_db:
+        init_database(bulk=bulk)
+    # The index of what is already loaded is read once into memory
+    sync = SyncIndex.load() if incremental else None
+    return sync, checkpoint
+
+
+def _index_written(sync: Optional[SyncIndex], nct_ids: Collection[str]) -> None:
+    """Count the studies just written in the rollups and, unless the load is
+    incremental and records their versions itself, in the sync index."""
+    refresh_rollups(nct_ids)
+    if sync is None:
+        SyncIndex.seed(nct_ids)
+
+
+def _save_checkpoint(
+    checkpoint: Checkpoint, sync: Optional[SyncIndex], offset: int, studies: int
+) -> None:
+    # Only called once every queue is flushed, so all studies before `offset`
+    # are committed and their versions can be recorded too.
+    if sync is not None:
+        sync.commit(MigratorMixIn.LOAD_MODES[MigratorMixIn._LOAD_MODE])
+    if MigratorMixIn._LOAD_MODE != "bulk":
+        # A resumed load would not know which studies before the checkpoint
+        # still had to be counted
+        _index_written(sync, MigratorMixIn.pop_written_studies())
+    checkpoint.save(offset, studies, MigratorMixIn.pop_flushed_tables())
+
+
+def _finish(
+    checkpoint: Checkpoint,
+    sync: Optional[SyncIndex],
+    bulk: bool,
+    index_workers: int,
+    repair: bool,
+) -> None:
+    if sync is not None:
+        sync.commit(MigratorMixIn.LOAD_MODES[MigratorMixIn._LOAD_MODE])
+        sync.report()
+    MigratorMixIn.report_deduplicated()
+    if bulk:
+        finalize_database(parallel=index_workers, repair=repair)
+        # The rollups are counted once the tables have their indexes, and
+        # for every study, since repairs may have removed some rows
+        MigratorMixIn.pop_written_studies()
+        _index_written(
+            sync, [row[0] for row in execute_query("SELECT nct_id FROM identification")]
+        )
+    else:
+        _index_written(sync, MigratorMixIn.pop_written_studies())
+    checkpoint.clear()
+
+
+def main(
+    init_db: bool = True,
+    path: str = "ctg-studies.json",
+    load_mode: str = MigratorMixIn._LOAD_MODE,
+    workers: int = 1,
+    chunk_size: int = 64,
+    bulk: bool = False,
+    index_workers: int = 1,
+    repair: bool = True,
+    incremental: bool = False,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    projected: bool = False,
+    hashed_keys: bool = False,
+    interned: bool = False,
+    shards: int = 1,
+):
+    """Load every study in `path`.
+
+    With `checkpoint_every=N`, all queues are flushed every N studies and the
+    input position is checkpointed, so a crashed load can continue with
+    `resume=True`. SIGINT/SIGTERM flush and checkpoint before exiting.
+    `projected` skips validating the sections no table is built from.
+    `hashed_keys` creates the tables with hashed conflict keys, see
+    dbutils.schema.KEY_MODES. `interned` stores repeated text columns as ids
+    into dimension tables, see dbutils.interning. With `shards=N`, studies
+    are validated and written by N processes, partitioned by nct_id (see
+    sharding.py).
+    """
+    if shards > 1 and (workers > 1 or incremental):
+        raise ValueError("Sharded loads do not combine with workers or incremental")
+    sync, checkpoint = _prepare(
+        path,
+        init_db,
+        load_mode,
+        bulk,
+        incremental,
+        resume,
+        hashed_keys,
+        interned,
+        repair,
+    )
+    studies = checkpoint.studies
+
+    sharded = ShardedLoader(shards, chunk_size, projected) if shards > 1 else None
+    with sharded or nullcontext(), graceful_stop() as stop:
+        if sharded is None:
+            offsets = load_studies(
+                path, workers, chunk_size, sync, checkpoint.offset, studies, projected
+            )
+            flush = MigratorMixIn.flush_all_batches
+        else:
+            offsets = sharded.load(path, checkpoint.offset, studies)
+            flush = sharded.flush
+        for offset in offsets:
+            studies += 1
+            if stop or (checkpoint_every and studies % checkpoint_every == 0):
+                flush()
+                _save_checkpoint(checkpoint, sync, offset, studies)
+            if stop:
+                print(f"Stopped after {studies} studies; rerun with --resume")
+                return
+
+    MigratorMixIn.flush_all_batches()
+    _finish(checkpoint, sync, bulk, index_workers, repair)
+
+
+async def main_async(
+    init_db: bool = True,
+    path: str = "ctg-studies.json",
+    load_mode: str = MigratorMixIn._LOAD_MODE,
+    workers: int = 1,
+    chunk_size: int = 64,
+    bulk: bool = False,
+    index_workers: int = 1,
+    repair: bool = True,
+    incremental: bool = False,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    projected: bool = False,
+    hashed_keys: bool = False,
+    interned: bool = False,
+):
+    """Like main, but full batches are written concurrently on separate
+    connections while parsing continues."""
+    sync, checkpoint = _prepare(
+        path,
+        init_db,
+        load_mode,
+        bulk,
+        incremental,
+        resume,
+        hashed_keys,
+        interned,
+        repair,
+    )
+    studies = checkpoint.studies
+
+    with graceful_stop() as stop:
+        async with MigratorMixIn.async_batches():
+            for offset in load_studies(
+                path,
+                workers,
+                chunk_size,
+                sync,
+                checkpoint.offset,
+                studies,
+                projected,
+            ):
+                studies += 1
+                await MigratorMixIn.async_throttle()
+                if stop or (checkpoint_every and studies % checkpoint_every == 0):
+                    await MigratorMixIn.async_flush_all_batches()
+                    _save_checkpoint(checkpoint, sync, offset, studies)
+                if stop:
+                    print(f"Stopped after {studies} studies; rerun with --resume")
+                    return
+            await MigratorMixIn.async_flush_all_batches()
+    _finish(checkpoint, sync, bulk, index_workers, repair)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Load ClinicalTrials.gov studies")
+    parser.add_argument("--input", default="ctg-studies.json")
+    parser.add_argument(
+        "--no-init", action="store_true", help="Keep the existing tables"
+    )
+    parser.add_argument(
+        "--load-mode",
+        choices=list(MigratorMixIn.LOAD_MODES),
+        default=MigratorMixIn._LOAD_MODE,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WORKERS", "1")),
+        help="Processes used to validate and transform studies",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=int(os.getenv("CHUNK_SIZE", "64")),
+        help="Studies sent to a worker at a time",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Write batches concurrently with asyncio",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Load into bare tables and build keys and indexes afterwards",
+    )
+    parser.add_argument(
+        "--index-workers",
+        type=int,
+        default=1,
+        help="Tables whose keys and indexes are built in parallel (--bulk)",
+    )
+    parser.add_argument(
+        "--no-repair",
+        action="store_true",
+        help="Fail instead of deleting duplicate and orphan rows (--bulk)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only load new or changed studies (implies --no-init)",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=int(os.getenv("CHECKPOINT_EVERY", "0")),
+        help="Flush and checkpoint every N studies (0 disables)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the last checkpoint (implies --no-init)",
+    )
+    parser.add_argument(
+        "--projected",
+        action="store_true",
+        help="Skip validating sections no table is built from "
+        "(derivedSection, resultsSection, ...)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.getenv("SHARDS", "1")),
+        help="Writer processes, each loading the studies of some nct_ids",
+    )
+    parser.add_argument(
+        "--hashed-keys",
+        action="store_true",
+        help="Enforce multi-column conflict keys with a UNIQUE digest column",
+    )
+    parser.add_argument(
+        "--interned",
+        action="store_true",
+        help="Store repeated text columns as ids into dimension tables",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        default=os.getenv("METRICS_TEXTFILE"),
+        help="Keep Prometheus metrics in this file (node_exporter textfile format)",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        default=os.getenv("METRICS_JSON"),
+        help='Write a JSON metrics summary here at the end ("-" for stdout)',
+    )
+    args = parser.parse_args()
+    kwargs = dict(
+        init_db=not (args.no_init or args.incremental or args.resume),
+        path=args.input,
+        load_mode=args.load_mode,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        bulk=args.bulk,
+        index_workers=args.index_workers,
+        repair=not args.no_repair,
+        incremental=args.incremental,
+        checkpoint_every=args.checkpoint_every,
+        resume=args.resume,
+        projected=args.projected,
+        hashed_keys=args.hashed_keys,
+        interned=args.interned,
+    )
+    if args.shards > 1 and args.use_async:
+        parser.error("--shards already writes concurrently; drop --async")
+    configure_sinks(args.metrics_textfile, args.metrics_json)
+    try:
+        if args.use_async:
+            asyncio.run(main_async(**kwargs))
+        else:
+            main(**kwargs, shards=args.shards)
+    finally:
+        METRICS.export(final=True)
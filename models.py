@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional, Dict, Any
-from dbutils.migrator import MigratorMixIn
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
+from typing import List, Optional, Dict, Any, Callable
 import json
+from dbutils.migrator import MigratorMixIn
+from dbutils.tablespec import extract_rows
+from reader import split_sections
 
 
 class OrgStudyIdInfo(BaseModel):
@@ -314,6 +316,7 @@ class Location(BaseModel):
     country: Optional[str] = None
     contacts: Optional[List[CentralContact]] = Field(default_factory=list)
     investigators: Optional[List[Dict[str, str]]] = Field(default_factory=list)
+    geoPoint: Optional[GeoPoint] = None
 
 
 class ContactsLocationsModule(BaseModel):
@@ -367,7 +370,9 @@ class StudyDesignInfo(BaseModel):
     timePerspectiveList: Optional[Dict[str, List[str]]] = Field(default_factory=dict)
 
 
-class ProtocolSection(BaseModel):
+class ProjectedProtocolSection(BaseModel):
+    """The modules of the protocol that rows are built from."""
+
     identificationModule: IdentificationModule
     statusModule: Optional[StatusModule] = StatusModule()
     sponsorCollaboratorsModule: Optional[SponsorCollaboratorsModule] = (
@@ -385,6 +390,9 @@ class ProtocolSection(BaseModel):
     contactsLocationsModule: Optional[ContactsLocationsModule] = (
         ContactsLocationsModule()
     )
+
+
+class ProtocolSection(ProjectedProtocolSection):
     ipdSharingStatementModule: Optional[IPDSharingStatementModule] = (
         IPDSharingStatementModule()
     )
@@ -423,258 +431,82 @@ class DerivedSection(BaseModel):
     hasResults: Optional[bool] = None
 
 
-class ClinicalTrialStudy(BaseModel, MigratorMixIn):
-    protocolSection: ProtocolSection
-    derivedSection: DerivedSection
-    resultsSection: Optional[Dict[str, Any]] = None
+class ProjectedStudy(BaseModel, MigratorMixIn):
+    """The part of a study migrate_to_db reads; ClinicalTrialStudy adds every
+    other section.
+
+    Validating JSON against this model skips the other sections without
+    building them at all (see parse_study). Those stay in the study's raw
+    bytes, and raw_section and deferred_section get them back on demand.
+    """
+
+    protocolSection: ProjectedProtocolSection
+    # The study's JSON when validated with parse_study(projected=True)
+    _raw: Optional[bytes] = PrivateAttr(None)
+    _sections: Dict[str, Any] = PrivateAttr(default_factory=dict)
 
     @field_validator("protocolSection")
     def validate_protocol_section(cls, v):
         # Could add custom validation logic here
         return v
 
-    def migrate_to_db(self, batch: bool = False, flush_all: bool = False):
-        # Extract NCT ID from the identification module
-        nct_id = self.protocolSection.identificationModule.nctId
-
-        # Migrate identification data
-        id_module = self.protocolSection.identificationModule
-        self.migrate_identification(
-            nct_id=nct_id,
-            nct_id_alias=id_module.nctIdAlias,
-            num_nct_aliases=id_module.numNctAliases,
-            org_study_id=id_module.orgStudyIdInfo.id,
-            org_study_id_type=id_module.orgStudyIdInfo.type,
-            org_study_id_link=id_module.secondaryIdInfo.secondaryIdLink,
-            num_secondary_ids=id_module.numSecondaryIds,
-            brief_title=id_module.briefTitle,
-            official_title=id_module.officialTitle,
-            acronym=id_module.acronym,
-            org_name=id_module.organization.fullName,
-            org_class=id_module.organization.class_,
-            brief_summary=self.protocolSection.descriptionModule.briefSummary,
-            detailed_description=self.protocolSection.descriptionModule.detailedDescription,
-            num_conditions=len(self.protocolSection.conditionsModule.conditions),
-            # batch=batch,
-        )
-
-        # Migrate status data
-        status_module = self.protocolSection.statusModule
-        self.migrate_status(
-            nct_id=nct_id,
-            status_verified_date=status_module.statusVerifiedDate,
-            overall_status=status_module.overallStatus,
-            last_known_status=status_module.lastKnownStatus,
-            why_stopped=status_module.whyStopped,
-            start_date=status_module.startDateStruct.date,
-            primary_completion_date=status_module.primaryCompletionDateStruct.date,
-            completion_date=status_module.completionDateStruct.date,
-            study_first_submit_date=status_module.studyFirstSubmitDate,
-            study_first_submit_qc_date=status_module.studyFirstSubmitQcDate,
-            study_first_post_date=status_module.studyFirstPostDateStruct.date,
-            results_waived=status_module.resultsWaived,
-            results_first_submit_date=status_module.resultsFirstSubmitDate,
-            results_first_submit_qc_date=status_module.resultsFirstSubmitQcDate,
-            results_first_post_date=status_module.resultsFirstPostDateStruct.date,
-            last_update_submit_date=status_module.lastUpdateSubmitDate,
-            last_update_post_date=status_module.lastUpdatePostDateStruct.date,
-            batch=batch,
-        )
-
-        # Migrate oversight data
-        oversight_module = self.protocolSection.oversightModule
-        self.migrate_oversight(
-            nct_id=nct_id,
-            oversight_has_dmc=oversight_module.oversightHasDmc,
-            is_fda_regulated_drug=oversight_module.isFdaRegulatedDrug,
-            is_fda_regulated_device=oversight_module.isFdaRegulatedDevice,
-            is_ppsd=oversight_module.isPpsd,
-            is_us_export=oversight_module.isUsExport,
-            is_unapproved_device=oversight_module.isUnapprovedDevice,
-            is_fda_violation=oversight_module.isFdaViolation,
-            batch=batch,
-        )
-
-        # Migrate design data
-        design_module = self.protocolSection.designModule
-        self.migrate_design(
-            nct_id=nct_id,
-            study_type=design_module.studyType,
-            patient_registry=(
-                design_module.studyType == "PATIENT_REGISTRY"
-                if design_module.studyType
-                else None
-            ),
-            allocation=design_module.designInfo.allocation,
-            intervention_model=design_module.designInfo.interventionModel,
-            primary_purpose=design_module.designInfo.primaryPurpose,
-            observational_model=design_module.designInfo.observationalModel,
-            enrollment_count=design_module.enrollmentInfo.count,
-            expanded_access_individual=design_module.expandedAccessTypes.individual,
-            expanded_access_intermediate=design_module.expandedAccessTypes.intermediate,
-            expanded_access_treatment=design_module.expandedAccessTypes.treatment,
-            num_phases=design_module.numPhases,
-            biospec_retention=design_module.bioSpec.retention,
-            biospec_description=design_module.bioSpec.description,
-            batch=batch,
-        )
-
-        # Migrate phases data
-        if design_module.phases:
-            for phase in design_module.phases:
-                self.migrate_phases(nct_id=nct_id, phase=phase)
-
-        # Migrate eligibility data
-        eligibility_module = self.protocolSection.eligibilityModule
-        self.migrate_eligibility(
-            nct_id=nct_id,
-            accepts_healthy_volunteers=eligibility_module.healthyVolunteers,
-            gender=eligibility_module.sex,
-            min_age=eligibility_module.minimumAge,
-            max_age=eligibility_module.maximumAge,
-            gender_based=eligibility_module.genderBased,
-            population_description=eligibility_module.studyPopulation,
-            sampling_method=eligibility_module.samplingMethod,
-            batch=batch,
-        )
-
-        # Migrate conditions data
-        for condition in self.protocolSection.conditionsModule.conditions:
-            self.migrate_conditions(nct_id=nct_id, name=condition, batch=batch)
-
-        # Migrate collaborators data
-        sponsor_module = self.protocolSection.sponsorCollaboratorsModule
-
-        # Lead sponsor
-        self.migrate_collaborators(
-            nct_id=nct_id,
-            responsible_party_type=sponsor_module.responsibleParty.type,
-            investigator_name=sponsor_module.responsibleParty.investigatorFullName,
-            investigator_affiliation=sponsor_module.responsibleParty.investigatorAffiliation,
-            collaborator_name=sponsor_module.leadSponsor.name,
-            collaborator_class=sponsor_module.leadSponsor.class_,
-            collaborator_type="lead sponsor",
-            batch=batch,
-        )
-
-        # Other collaborators
-        for collaborator in sponsor_module.collaborators:
-            self.migrate_collaborators(
-                nct_id=nct_id,
-                responsible_party_type=sponsor_module.responsibleParty.type,
-                investigator_name=sponsor_module.responsibleParty.investigatorFullName,
-                investigator_affiliation=sponsor_module.responsibleParty.investigatorAffiliation,
-                collaborator_name=collaborator.name,
-                collaborator_class=collaborator.class_,
-                collaborator_type="collaborator",
-                batch=batch,
-            )
-
-        # Migrate outcomes data
-        outcomes_module = self.protocolSection.outcomesModule
-
-        # Primary outcomes
-        for outcome in outcomes_module.primaryOutcomes:
-            self.migrate_outcome(
-                nct_id=nct_id,
-                type="primary",
-                measure=outcome.measure,
-                description=outcome.description,
-                time_frame=outcome.timeFrame,
-                batch=batch,
-            )
-
-        # Secondary outcomes
-        for outcome in outcomes_module.secondaryOutcomes:
-            self.migrate_outcome(
-                nct_id=nct_id,
-                type="secondary",
-                measure=outcome.measure,
-                description=outcome.description,
-                time_frame=outcome.timeFrame,
-                batch=batch,
-            )
+    def raw_section(self, path: str) -> Optional[bytes]:
+        """Raw bytes of one of the DEFERRED_SECTIONS of a projected study,
+        None if the study has none."""
+        if self._raw is None:
+            raise ValueError("Only studies parsed with projected=True keep raw bytes")
+        if path not in self._sections:
+            _, sections = split_sections(self._raw, [path])
+            self._sections[path] = sections.get(path)
+        return self._sections[path]
+
+    def deferred_section(self, path: str) -> Any:
+        """One of the DEFERRED_SECTIONS, validated as ClinicalTrialStudy would."""
+        raw = self.raw_section(path)
+        return None if raw is None else DEFERRED_SECTIONS[path](raw)
 
-        # Other outcomes
-        for outcome in outcomes_module.otherOutcomes:
-            self.migrate_outcome(
-                nct_id=nct_id,
-                type="other",
-                measure=outcome.measure,
-                description=outcome.description,
-                time_frame=outcome.timeFrame,
-                batch=batch,
-            )
-
-        # Migrate interventions data
-        for intervention in self.protocolSection.armsInterventionsModule.interventions:
-            self.migrate_interventions(
-                nct_id=nct_id,
-                intervention_type=intervention.type,
-                intervention_name=intervention.name,
-                intervention_description=intervention.description,
-                group_label=(
-                    intervention.armGroupLabels[0]
-                    if intervention.armGroupLabels
-                    else None
-                ),
-                batch=batch,
-            )
+    def migrate_to_db(self, batch: bool = False, flush_all: bool = False):
+        # Rows of every table in one pass, see dbutils.tablespec.TABLE_SPECS
+        MigratorMixIn.upsert_rows(extract_rows(self), batch)
 
-        # Migrate groups data
-        for group in self.protocolSection.armsInterventionsModule.armGroups:
-            self.migrate_groups(
-                nct_id=nct_id,
-                group_type=group.type,
-                group_description=group.description,
-                group_label=group.label,
-                batch=batch,
-            )
+        if batch and flush_all:
+            MigratorMixIn.flush_all_batches()
 
-        # Migrate facility data
-        for location in self.protocolSection.contactsLocationsModule.locations:
-            self.migrate_facility(
-                nct_id=nct_id,
-                name=location.facility,
-                status=location.status,
-                city=location.city,
-                state=location.state,
-                zip=location.zip,
-                country=location.country,
-                contacts=(
-                    json.dumps(
-                        {
-                            "contacts": [
-                                contact.model_dump() for contact in location.contacts
-                            ]
-                        }
-                    )
-                    if location.contacts
-                    else None
-                ),
-                batch=batch,
-            )
 
-        # Migrate contact data
-        for contact in self.protocolSection.contactsLocationsModule.centralContacts:
-            self.migrate_contact(
-                nct_id=nct_id,
-                name=contact.name,
-                role=contact.role,
-                phone=contact.phone,
-                email=contact.email,
-                batch=batch,
-            )
+class ClinicalTrialStudy(ProjectedStudy):
+    protocolSection: ProtocolSection
+    derivedSection: DerivedSection
+    resultsSection: Optional[Dict[str, Any]] = None
 
-        # Migrate official data
-        for official in self.protocolSection.contactsLocationsModule.overallOfficials:
-            self.migrate_officials(
-                nct_id=nct_id,
-                name=official.name,
-                role=official.role,
-                affiliation=official.affiliation,
-                batch=batch,
-            )
 
-        if batch and flush_all:
-            MigratorMixIn.flush_all_batches()
+# Sections migrate_to_db never reads (absent from ProjectedStudy), with how
+# deferred_section validates each one
+DEFERRED_SECTIONS: Dict[str, Callable[[bytes], Any]] = {
+    "derivedSection": DerivedSection.model_validate_json,
+    "resultsSection": json.loads,
+    "documentSection": DocumentSection.model_validate_json,
+    "protocolSection.referencesModule": json.loads,
+    "protocolSection.ipdSharingStatementModule": (
+        IPDSharingStatementModule.model_validate_json
+    ),
+}
+
+
+# The validators are built once with the classes. Validating the raw bytes of
+# a study skips json.loads and the intermediate dict tree entirely.
+_validate_study_json = ClinicalTrialStudy.__pydantic_validator__.validate_json
+_validate_projected_json = ProjectedStudy.__pydantic_validator__.validate_json
+
+
+def parse_study(raw: bytes, projected: bool = False) -> ProjectedStudy:
+    """Validate one study straight from its JSON bytes (see reader.iter_raw_studies).
+
+    With `projected`, only the fields of ProjectedStudy are validated; the
+    parser steps over everything else (MeSH trees, results) without building
+    it. The raw bytes are kept on the study for raw_section.
+    """
+    if not projected:
+        return _validate_study_json(raw)
+    study = _validate_projected_json(raw)
+    study._raw = raw
+    return study
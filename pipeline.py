@@ -0,0 +1,125 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import json
+import signal
+import time
+
+from models import ClinicalTrialStudy, parse_study
+from dbutils.metrics import METRICS
+from dbutils.migrator import MigratorMixIn
+from dbutils.sync import StudyVersion, is_loaded, study_version
+
+Rows = List[Tuple[str, Sequence[Any]]]
+
+# Snapshot of SyncIndex.index, installed in each worker by _init_worker
+_SYNC_INDEX: Optional[Dict[str, Tuple[Optional[str], str]]] = None
+# Whether studies are validated with parse_study(projected=True)
+_PROJECTED = False
+
+
+class StudyTransformError(Exception):
+    """A study failed validation or row building in a worker process."""
+
+    def __init__(self, raw: bytes, message: str):
+        super().__init__(message)
+        self.raw = raw
+
+
+def transform_study(
+    raw: bytes,
+) -> Tuple[Optional[Rows], Optional[StudyVersion], Optional[float]]:
+    """Validate one raw study and return the rows migrate_to_db would queue.
+
+    With a sync index installed, also returns the study's version, and no
+    rows at all if that version is already loaded. The last item is the time
+    model_validate took, recorded by the parent process (None if skipped).
+    """
+    version = None
+    started = time.perf_counter()
+    if _SYNC_INDEX is None:
+        parsed_study = parse_study(raw, _PROJECTED)
+    else:
+        # The version fingerprint needs the decoded study anyway
+        study = json.loads(raw)
+        version = study_version(study)
+        if is_loaded(_SYNC_INDEX.get(version[0]), version):
+            return None, version, None
+        started = time.perf_counter()
+        if _PROJECTED:
+            # The raw bytes let the parser step over the unread sections
+            parsed_study = parse_study(raw, projected=True)
+        else:
+            parsed_study = ClinicalTrialStudy.model_validate(study)
+    parse_seconds = time.perf_counter() - started
+    with MigratorMixIn.collect_rows() as rows:
+        parsed_study.migrate_to_db(batch=True)
+    return rows, version, parse_seconds
+
+
+def _init_worker(
+    sync_index: Optional[Dict[str, Tuple[Optional[str], str]]], projected: bool
+) -> None:
+    global _SYNC_INDEX, _PROJECTED
+    _SYNC_INDEX = sync_index
+    _PROJECTED = projected
+    # Ctrl-C reaches the whole process group; only the parent should react
+    # to it, by flushing and checkpointing before it shuts the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _transform_chunk(chunk: List[bytes]) -> List[Tuple[Any, Optional[str]]]:
+    # Exceptions are returned as text: pydantic errors do not always pickle,
+    # and one bad study should not hide the results of the rest of the chunk.
+    results = []
+    for raw in chunk:
+        try:
+            results.append((transform_study(raw), None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def transform_parallel(
+    raw_studies: Iterable[bytes],
+    workers: int,
+    chunk_size: int = 64,
+    sync_index: Optional[Dict[str, Tuple[Optional[str], str]]] = None,
+    projected: bool = False,
+) -> Iterator[Tuple[bytes, Optional[Rows], Optional[StudyVersion]]]:
+    """Yield (raw study, rows, version) in input order, transforming on
+    `workers` processes.
+
+    Studies are sent to the pool in chunks of `chunk_size`; at most two chunks
+    per worker are in flight, so memory stays bounded for any input size.
+    `sync_index` (see SyncIndex.index) lets workers skip unchanged studies,
+    which are yielded with `rows=None`. `projected` is passed on to
+    parse_study.
+    """
+    studies = iter(raw_studies)
+    in_flight: Deque[Tuple[List[bytes], Future]] = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(sync_index, projected)
+    ) as executor:
+        try:
+            while True:
+                while len(in_flight) < 2 * workers:
+                    chunk = list(islice(studies, chunk_size))
+                    if not chunk:
+                        break
+                    in_flight.append((chunk, executor.submit(_transform_chunk, chunk)))
+                if not in_flight:
+                    return
+
+                chunk, future = in_flight.popleft()
+                for raw, (result, error) in zip(chunk, future.result()):
+                    if error is not None:
+                        raise StudyTransformError(raw, error)
+                    rows, version, parse_seconds = result
+                    if parse_seconds is not None:
+                        METRICS.observe("parse_seconds", parse_seconds)
+                    yield raw, rows, version
+        finally:
+            for _, future in in_flight:
+                future.cancel()
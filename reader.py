@@ -0,0 +1,157 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, Tuple, Union
+
+# A complete string literal. Runs of plain characters are consumed in one
+# step, which is much faster with `re` than one repetition per character.
+_STRING_LITERAL = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+# Skips over everything that is not a bracket, treating complete string
+# literals as opaque so brackets inside strings are never counted.
+_SKIP = re.compile(rb'(?:[^"\[\]{}]+|' + _STRING_LITERAL + rb")*", re.DOTALL)
+# Separators allowed between top-level studies: whitespace for JSON Lines,
+# commas and the enclosing brackets for a JSON array.
+_SEPARATORS = re.compile(rb"[\s,\[\]]*")
+# Tokens of an object's members, see split_sections
+_STRING = re.compile(_STRING_LITERAL, re.DOTALL)
+_SCALAR = re.compile(rb"[^\s,\]}]+")
+_MEMBER_SEPARATORS = re.compile(rb"[\s,]*")
+_NAME_SEPARATOR = re.compile(rb"\s*:\s*")
+
+_CHUNK_SIZE = 1 << 20
+
+
+def iter_raw_studies(
+    path: str, start_offset: int = 0, chunk_size: int = _CHUNK_SIZE
+) -> Iterator[Tuple[int, bytes]]:
+    """Yield (byte offset, raw JSON bytes) for each study in the file.
+
+    Works for both a top-level JSON array and JSON Lines. Only one study (plus
+    one read chunk) is held in memory at a time. `start_offset` must point at
+    the beginning of a study or at the separator right before one, e.g. an
+    offset previously yielded by this function.
+    """
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        buf = b""
+        base = start_offset  # file offset of buf[0]
+        pos = 0
+        eof = False
+
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
+                    return
+                base += pos
+                buf, pos = f.read(chunk_size), 0
+                eof = not buf
+                continue
+
+            if buf[pos] != ord("{"):
+                raise ValueError(
+                    f"Expected a JSON object at byte {base + pos}, "
+                    f"found {buf[pos:pos + 20]!r}"
+                )
+
+            start, depth, scan = pos, 0, pos
+            while True:
+                scan = _SKIP.match(buf, scan).end()
+                if scan == len(buf) or buf[scan] == ord('"'):
+                    # Study (or a string inside it) continues in the next chunk
+                    more = f.read(max(chunk_size, len(buf) - start))
+                    if not more:
+                        raise ValueError(
+                            f"Truncated JSON object starting at byte {base + start}"
+                        )
+                    buf = buf[start:] + more
+                    base += start
+                    scan -= start
+                    start = 0
+                    continue
+                depth += 1 if buf[scan] in b"[{" else -1
+                scan += 1
+                if depth == 0:
+                    break
+
+            yield base + start, buf[start:scan]
+            pos = scan
+
+
+def _value_end(raw: bytes, pos: int) -> int:
+    """End of the JSON value starting at `pos`."""
+    if raw[pos] == ord('"'):
+        return _STRING.match(raw, pos).end()
+    if raw[pos] not in b"[{":
+        return _SCALAR.match(raw, pos).end()
+    depth = 0
+    while True:
+        pos = _SKIP.match(raw, pos).end()
+        depth += 1 if raw[pos] in b"[{" else -1
+        pos += 1
+        if depth == 0:
+            return pos
+
+
+# Member name -> dotted path to cut out, or the members to cut out of the
+# object it holds
+_PathTree = Dict[bytes, Union[str, "_PathTree"]]
+
+
+def _split_object(
+    raw: bytes, start: int, tree: _PathTree, sections: Dict[str, bytes]
+) -> Tuple[bytes, int]:
+    kept = []
+    cut = False
+    pos = start + 1
+    while True:
+        pos = _MEMBER_SEPARATORS.match(raw, pos).end()
+        if raw[pos] == ord("}"):
+            break
+        name_end = _STRING.match(raw, pos).end()
+        value_start = _NAME_SEPARATOR.match(raw, name_end).end()
+        node = tree.get(raw[pos + 1 : name_end - 1])
+        if isinstance(node, str):
+            value_end = _value_end(raw, value_start)
+            sections[node] = raw[value_start:value_end]
+            cut = True
+        elif node is not None and raw[value_start] == ord("{"):
+            value, value_end = _split_object(raw, value_start, node, sections)
+            cut = cut or value_end - value_start != len(value)
+            kept.append(raw[pos:value_start] + value)
+        else:
+            value_end = _value_end(raw, value_start)
+            kept.append(raw[pos:value_end])
+        pos = value_end
+    end = pos + 1
+    if not cut:
+        return raw[start:end], end
+    return b"{" + b",".join(kept) + b"}", end
+
+
+def split_sections(raw: bytes, paths: Iterable[str]) -> Tuple[bytes, Dict[str, bytes]]:
+    """Cut the members at the dotted `paths` out of one raw JSON object.
+
+    Returns the object without them, and the raw bytes of each member that
+    was present by path. Only the objects along the paths are tokenized; the
+    values in between are skipped over by bracket matching, as in
+    iter_raw_studies.
+    """
+    tree: _PathTree = {}
+    for path in paths:
+        node = tree
+        *parents, name = path.split(".")
+        for parent in parents:
+            node = node.setdefault(parent.encode(), {})
+        node[name.encode()] = path
+    sections: Dict[str, bytes] = {}
+    pos = _MEMBER_SEPARATORS.match(raw).end()
+    projected, _ = _split_object(raw, pos, tree, sections)
+    return projected, sections
+
+
+def iter_studies(
+    path: str, start_offset: int = 0, chunk_size: int = _CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """Yield each study in the file as a dict, one at a time."""
+    for _, raw in iter_raw_studies(path, start_offset, chunk_size):
+        yield json.loads(raw)
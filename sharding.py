@@ -0,0 +1,219 @@
+"""Load studies with several writer processes, partitioned by nct_id.
+
+Every conflict key starts with nct_id, so studies hashed to different shards
+never write the same rows. Each shard validates its studies and writes them
+through its own MigratorMixIn queues and connection pool, which flush
+referenced tables (identification) before their children as they would in a
+single process.
+"""
+
+from multiprocessing import get_context
+from queue import Empty, Full
+from typing import Any, Dict, Iterator, List, Set, Tuple
+import re
+import signal
+import time
+import zlib
+
+from dbutils.metrics import METRICS
+from dbutils.migrator import MigratorMixIn
+from dbutils.schema import interning, key_mode, set_interning
+from models import parse_study
+from pipeline import StudyTransformError
+from reader import iter_raw_studies
+from tqdm import tqdm
+
+_NCT_ID = re.compile(rb'"nctId"\s*:\s*"([^"]*)"')
+# Seconds between checks that every shard is still alive while waiting on one
+_POLL_INTERVAL = 1.0
+
+
+def shard_of(raw: bytes, shards: int) -> int:
+    """The shard of a raw study: crc32 of its nctId, modulo `shards`."""
+    match = _NCT_ID.search(raw)
+    # A study without an nctId fails validation in whichever shard gets it
+    return zlib.crc32(match.group(1)) % shards if match else 0
+
+
+def _report(outbox, kind: str, shard: int) -> None:
+    # Sent as deltas: the shard's counters restart after each report and the
+    # parent adds them to its own.
+    counters, _, histograms = METRICS.collect()
+    METRICS.reset()
+    deduplicated = dict(MigratorMixIn._DEDUPLICATED)
+    MigratorMixIn._DEDUPLICATED.clear()
+    outbox.put(
+        (
+            kind,
+            shard,
+            (
+                counters,
+                histograms,
+                deduplicated,
+                MigratorMixIn.pop_flushed_tables(),
+                MigratorMixIn.pop_written_studies(),
+            ),
+        )
+    )
+
+
+def _run_shard(
+    shard: int,
+    inbox,
+    outbox,
+    load_mode: str,
+    keys: str,
+    interned: bool,
+    projected: bool,
+) -> None:
+    # Ctrl-C reaches the whole process group; the parent decides when the
+    # shards flush and stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    METRICS.sinks = []
+    METRICS.reset()
+    MigratorMixIn.set_load_mode(load_mode)
+    MigratorMixIn.set_key_mode(keys)
+    set_interning(interned)
+    while True:
+        message = inbox.get()
+        if message is None or message == "flush":
+            MigratorMixIn.flush_all_batches()
+            _report(outbox, "done" if message is None else "flushed", shard)
+            if message is None:
+                return
+            continue
+        for raw in message:
+            try:
+                started = time.perf_counter()
+                parsed_study = parse_study(raw, projected)
+                METRICS.observe("parse_seconds", time.perf_counter() - started)
+                parsed_study.migrate_to_db(batch=True)
+            except Exception as e:
+                outbox.put(("error", shard, (raw, f"{type(e).__name__}: {e}")))
+                return
+
+
+class ShardedLoader:
+    """Routes raw studies to `shards` writer processes by shard_of.
+
+    Studies are sent in chunks of `chunk_size` per shard, with at most two
+    chunks waiting per shard, so a slow shard holds the reader back instead
+    of filling memory. flush() returns once every study sent so far is
+    committed, which is what checkpoints need. Use as a context manager: on
+    a clean exit the shards flush and stop, on an error they are terminated.
+    """
+
+    def __init__(self, shards: int, chunk_size: int = 64, projected: bool = False):
+        if shards < 2:
+            raise ValueError("A sharded load needs at least 2 shards")
+        self.shards = shards
+        self.chunk_size = chunk_size
+        self.projected = projected
+        self._context = get_context()
+        self._outbox = self._context.Queue()
+        self._inboxes = []
+        self._processes = []
+        self._buffers: List[List[bytes]] = [[] for _ in range(shards)]
+        # Shards that answered, by reply, since the last _broadcast
+        self._answered: Dict[str, Set[int]] = {"flushed": set(), "done": set()}
+
+    def __enter__(self) -> "ShardedLoader":
+        for shard in range(self.shards):
+            inbox = self._context.Queue(maxsize=2)
+            process = self._context.Process(
+                target=_run_shard,
+                args=(
+                    shard,
+                    inbox,
+                    self._outbox,
+                    MigratorMixIn._LOAD_MODE,
+                    key_mode(),
+                    interning(),
+                    self.projected,
+                ),
+                name=f"shard-{shard}",
+                daemon=True,
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self._broadcast(None, "done")
+            for process in self._processes:
+                process.join()
+        else:
+            for process in self._processes:
+                process.terminate()
+
+    def _merge(self, report: Tuple[Any, ...]) -> None:
+        counters, histograms, deduplicated, flushed_tables, written = report
+        METRICS.merge(counters, histograms)
+        for table_name, count in deduplicated.items():
+            MigratorMixIn._DEDUPLICATED[table_name] += count
+        MigratorMixIn._FLUSHED_TABLES.update(flushed_tables)
+        MigratorMixIn._WRITTEN_STUDIES.update(written)
+
+    def _receive(self, block: bool) -> None:
+        """Handle the next message from a shard, raising the error a shard
+        stopped on."""
+        try:
+            kind, shard, payload = self._outbox.get(block, _POLL_INTERVAL)
+        except Empty:
+            for process in self._processes:
+                if process.exitcode not in (None, 0):
+                    raise RuntimeError(
+                        f"{process.name} exited with code {process.exitcode}"
+                    )
+            return
+        if kind == "error":
+            raw, message = payload
+            open("errors.json", "a").write(raw.decode() + "\n")
+            raise StudyTransformError(raw, message)
+        self._merge(payload)
+        self._answered[kind].add(shard)
+
+    def _send(self, shard: int, message: Any) -> None:
+        while True:
+            try:
+                self._inboxes[shard].put(message, timeout=_POLL_INTERVAL)
+                return
+            except Full:
+                # A shard that died would otherwise block the reader forever
+                self._receive(block=False)
+
+    def _broadcast(self, message: Any, reply: str) -> None:
+        """Send `message` to every shard after its pending studies and wait
+        for each to answer with `reply`."""
+        self._answered[reply].clear()
+        for shard, buffer in enumerate(self._buffers):
+            if buffer:
+                self._send(shard, buffer)
+                self._buffers[shard] = []
+            self._send(shard, message)
+        while len(self._answered[reply]) < self.shards:
+            self._receive(block=True)
+
+    def flush(self) -> None:
+        """Commit every study sent to the shards so far."""
+        self._broadcast("flush", "flushed")
+
+    def load(self, path: str, start_offset: int = 0, initial: int = 0) -> Iterator[int]:
+        """Send every study in `path` from byte `start_offset` on to its
+        shard, yielding the input offset just past each study once it is
+        sent."""
+        for offset, raw in tqdm(
+            iter_raw_studies(path, start_offset),
+            desc="Processing studies",
+            initial=initial,
+        ):
+            METRICS.inc("studies")
+            shard = shard_of(raw, self.shards)
+            buffer = self._buffers[shard]
+            buffer.append(raw)
+            if len(buffer) >= self.chunk_size:
+                self._send(shard, buffer)
+                self._buffers[shard] = []
+            yield offset + len(raw)
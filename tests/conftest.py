@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+import pytest
+
+from dbutils.helpers import get_connection
+from dbutils.migrator import MigratorMixIn
+
+
+def _database_reachable() -> bool:
+    try:
+        get_connection().close()
+    except Exception:
+        return False
+    return True
+
+
+def pytest_collection_modifyitems(config, items):
+    db_items = [item for item in items if "db" in item.keywords]
+    if db_items and not _database_reachable():
+        skip = pytest.mark.skip(reason="no PostgreSQL server reachable")
+        for item in db_items:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def queues(monkeypatch):
+    """Empty batch queues for the duration of a test."""
+    monkeypatch.setattr(MigratorMixIn, "_BATCH_QUEUE", defaultdict(list))
+    monkeypatch.setattr(MigratorMixIn, "_QUEUE_BYTES", defaultdict(int))
+    monkeypatch.setattr(MigratorMixIn, "_TOTAL_QUEUE_BYTES", 0)
+    monkeypatch.setattr(MigratorMixIn, "_QUEUE_KEYS", defaultdict(dict))
+    monkeypatch.setattr(MigratorMixIn, "_DEDUPLICATED", defaultdict(int))
+    monkeypatch.setattr(MigratorMixIn, "_REPLACE_TAILS", {})
+    monkeypatch.setattr(MigratorMixIn, "_WRITTEN_STUDIES", set())
+    return MigratorMixIn._BATCH_QUEUE
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from dbutils.geo import _MAX_CELLS, covering_cells, distance_km, geohash
+
+
+def test_geohash():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash(-25.382708, -49.265506, 7) == "6gkzwgj"
+    assert geohash(0.0, 0.0, 1) == "s"
+
+
+def test_distance():
+    assert distance_km(0.0, 0.0, 0.0, 0.0) == 0.0
+    assert distance_km(0.0, 0.0, 0.0, 1.0) == pytest.approx(111.195, abs=0.01)
+    assert distance_km(0.0, 179.5, 0.0, -179.5) == pytest.approx(111.195, abs=0.01)
+    # Paris to London
+    assert distance_km(48.8566, 2.3522, 51.5074, -0.1278) == pytest.approx(
+        343.5, rel=0.01
+    )
+
+
+@pytest.mark.parametrize(
+    "lat, lon, radius_km",
+    [
+        (40.7128, -74.006, 0.5),
+        (40.7128, -74.006, 25.0),
+        (-33.8688, 151.2093, 300.0),
+        (0.0, 179.95, 50.0),
+        (0.0, -179.95, 50.0),
+        (89.5, 0.0, 100.0),
+    ],
+)
+def test_covering_cells(lat, lon, radius_km):
+    cells = covering_cells(lat, lon, radius_km)
+    assert 0 < len(cells) <= _MAX_CELLS
+    rng = random.Random(0)
+    degrees = radius_km / 111.0
+    covered = 0
+    while covered < 500:
+        point_lat = lat + rng.uniform(-degrees, degrees)
+        point_lon = lon + rng.uniform(-3 * degrees, 3 * degrees)
+        if (
+            abs(point_lat) > 90
+            or distance_km(lat, lon, point_lat, point_lon) > radius_km
+        ):
+            continue
+        point_lon = (point_lon + 180.0) % 360.0 - 180.0
+        cell = geohash(point_lat, point_lon)
+        assert any(cell.startswith(prefix) for prefix in cells)
+        covered += 1
+
+
+def test_covering_the_world():
+    assert covering_cells(0.0, 0.0, 30000.0) == [""]
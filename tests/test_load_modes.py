@@ -0,0 +1,66 @@
+"""Every load mode against a real server.
+
+These tests drop and recreate every table of the database the DB* environment
+variables point at, so they only run when selected with `pytest -m db`.
+"""
+
+from typing import Dict
+
+import pytest
+
+from benchmarks.corpus import write_corpus
+from dbutils.helpers import execute_query, finalize_database, init_database
+from dbutils.migrator import MigratorMixIn
+from main import load_studies
+
+pytestmark = pytest.mark.db
+
+STUDIES = 30
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory) -> str:
+    path = tmp_path_factory.mktemp("corpus") / "studies.json"
+    write_corpus(str(path), STUDIES, seed=1)
+    return str(path)
+
+
+def _load(path: str, mode: str, init_db: bool = True) -> Dict[str, int]:
+    """Load the corpus in `mode` and count the rows of every table."""
+    previous = MigratorMixIn._LOAD_MODE
+    MigratorMixIn.set_load_mode(mode)
+    try:
+        if init_db:
+            init_database(bulk=mode == "bulk")
+        for _ in load_studies(path):
+            pass
+        MigratorMixIn.flush_all_batches()
+        if mode == "bulk":
+            finalize_database()
+    finally:
+        MigratorMixIn.set_load_mode(previous)
+    return {
+        table_name: execute_query(f"SELECT count(*) FROM {table_name}")[0][0]
+        for table_name in MigratorMixIn.COLUMN_MAP
+    }
+
+
+@pytest.fixture(scope="module")
+def expected(corpus) -> Dict[str, int]:
+    counts = _load(corpus, "executemany")
+    assert counts["identification"] == STUDIES
+    return counts
+
+
+@pytest.mark.parametrize("mode", list(MigratorMixIn.LOAD_MODES))
+def test_load_mode(corpus, expected, mode):
+    assert _load(corpus, mode) == expected
+
+
+@pytest.mark.parametrize(
+    "mode", [mode for mode in MigratorMixIn.LOAD_MODES if mode != "bulk"]
+)
+def test_reload(corpus, expected, mode):
+    _load(corpus, mode)
+    # Loading the same studies again changes nothing
+    assert _load(corpus, mode, init_db=False) == expected
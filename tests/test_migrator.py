@@ -0,0 +1,96 @@
+from dbutils.batching import estimate_row_bytes
+from dbutils.migrator import MigratorMixIn
+from dbutils.query import STUDY_CACHE
+
+
+def test_queue_dedupe(queues):
+    MigratorMixIn._queue_row("conditions", ("NCT1", "asthma"))
+    MigratorMixIn._queue_row("conditions", ("NCT1", "copd"))
+    MigratorMixIn._queue_row("conditions", ("NCT1", "asthma"))
+    assert queues["conditions"] == [("NCT1", "asthma"), ("NCT1", "copd")]
+    assert MigratorMixIn._DEDUPLICATED["conditions"] == 1
+    assert MigratorMixIn._QUEUE_BYTES["conditions"] == sum(
+        map(estimate_row_bytes, queues["conditions"])
+    )
+    assert MigratorMixIn._TOTAL_QUEUE_BYTES == MigratorMixIn._QUEUE_BYTES["conditions"]
+
+
+def test_queue_dedupe_keeps_the_last_row(queues):
+    # Coordinates are not part of a facility's conflict key
+    site = ("NCT1", "Clinic", "RECRUITING", "Oslo", "Oslo", "0150", "Norway", None)
+    first = site + (59.9, 10.7, "u4xsu")
+    last = site + (59.91, 10.75, "u4xsv")
+    MigratorMixIn._queue_row("facility", first)
+    MigratorMixIn._queue_row("facility", last)
+    assert queues["facility"] == [last]
+    assert MigratorMixIn._QUEUE_BYTES["facility"] == estimate_row_bytes(last)
+
+
+def test_queue_keeps_null_keys(queues):
+    row = ("NCT1", None, None, None, None, None, None)
+    MigratorMixIn._queue_row("collaborators", row)
+    MigratorMixIn._queue_row("collaborators", row)
+    assert queues["collaborators"] == [row, row]
+    assert MigratorMixIn._DEDUPLICATED["collaborators"] == 0
+
+
+def test_take_batch_with_limit(queues):
+    for name in ("a", "b", "c"):
+        MigratorMixIn._queue_row("conditions", ("NCT1", name))
+    written, queued, size = MigratorMixIn._take_batch("conditions", 2)
+    assert written == queued == [("NCT1", "a"), ("NCT1", "b")]
+    assert size == sum(map(estimate_row_bytes, queued))
+    assert queues["conditions"] == [("NCT1", "c")]
+    # The rest can still be deduplicated against
+    MigratorMixIn._queue_row("conditions", ("NCT1", "c"))
+    assert queues["conditions"] == [("NCT1", "c")]
+
+
+def test_restore_queue(queues):
+    MigratorMixIn._queue_row("conditions", ("NCT1", "a"))
+    MigratorMixIn._queue_row("conditions", ("NCT1", "b"))
+    _, queued, size = MigratorMixIn._take_batch("conditions")
+    MigratorMixIn._queue_row("conditions", ("NCT1", "b"))
+    MigratorMixIn._queue_row("conditions", ("NCT2", "a"))
+    MigratorMixIn._restore_queue("conditions", queued, size)
+    assert queues["conditions"] == [("NCT1", "a"), ("NCT1", "b"), ("NCT2", "a")]
+    assert MigratorMixIn._TOTAL_QUEUE_BYTES == sum(
+        map(estimate_row_bytes, queues["conditions"])
+    )
+
+
+def test_replace_straddle(queues):
+    first = [("NCT1", "a"), ("NCT2", "a"), ("NCT2", "b")]
+    assert MigratorMixIn._drop_written("conditions", first) == first
+    # NCT2 continues: the rows its first batch already wrote are dropped
+    second = [("NCT2", "a"), ("NCT2", "c"), ("NCT3", "a"), ("NCT3", "b")]
+    assert MigratorMixIn._drop_written("conditions", second) == second[1:]
+    # NCT3 does not continue, so NCT4 keeps a key NCT3 wrote
+    third = [("NCT4", "a"), ("NCT4", "b")]
+    assert MigratorMixIn._drop_written("conditions", third) == third
+
+
+def test_replace_straddle_keeps_null_keys(queues):
+    row = ("NCT1", None, None, None, None, None, None)
+    assert MigratorMixIn._drop_written("collaborators", [row]) == [row]
+    assert MigratorMixIn._drop_written("collaborators", [row]) == [row]
+
+
+def test_replace_straddle_through_take_batch(queues, monkeypatch):
+    monkeypatch.setattr(MigratorMixIn, "_LOAD_MODE", "replace")
+    for row in [("NCT1", "a"), ("NCT1", "b"), ("NCT1", "c")]:
+        MigratorMixIn._queue_row("conditions", row)
+    MigratorMixIn._take_batch("conditions", 2)
+    # The same study queued again, e.g. from a later duplicate in the export
+    MigratorMixIn._queue_row("conditions", ("NCT1", "a"))
+    written, _, _ = MigratorMixIn._take_batch("conditions")
+    assert written == [("NCT1", "c")]
+
+
+def test_write_during_read(queues):
+    STUDY_CACHE.clear()
+    # A read starts while nothing is cached, then the study is written
+    versions = STUDY_CACHE.reserve(["NCT1"])
+    MigratorMixIn._record_written("conditions", [("NCT1", "asthma")])
+    STUDY_CACHE.fill(versions, {"NCT1": {"conditions": []}})
+    assert STUDY_CACHE.get("NCT1") is None
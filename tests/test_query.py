@@ -0,0 +1,65 @@
+import time
+
+from dbutils.query import StudyCache
+
+
+def test_get_and_put():
+    cache = StudyCache(max_size=2, ttl=60)
+    cache.put("NCT1", {"n": 1})
+    cache.put("NCT2", {"n": 2})
+    assert cache.get("NCT1") == {"n": 1}
+    # NCT1 was used last, so NCT2 is evicted
+    cache.put("NCT3", {"n": 3})
+    assert cache.get("NCT2") is None
+    assert len(cache) == 2
+
+
+def test_expiry():
+    cache = StudyCache(ttl=0.01)
+    cache.put("NCT1", {})
+    time.sleep(0.02)
+    assert cache.get("NCT1") is None
+    assert len(cache) == 0
+
+
+def test_fill():
+    cache = StudyCache()
+    versions = cache.reserve(["NCT1", "NCT2"])
+    cache.fill(versions, {"NCT1": {"n": 1}})
+    assert cache.get("NCT1") == {"n": 1}
+    # Studies that were not found are not cached
+    assert cache.get("NCT2") is None
+    assert cache._versions == {}
+
+
+def test_discard_during_read():
+    cache = StudyCache()
+    cache.put("NCT1", {"n": 0})
+    versions = cache.reserve(["NCT1", "NCT2"])
+    cache.discard(["NCT1"])
+    assert cache.get("NCT1") is None
+    cache.fill(versions, {"NCT1": {"n": 1}, "NCT2": {"n": 2}})
+    assert cache.get("NCT1") is None
+    assert cache.get("NCT2") == {"n": 2}
+    assert cache._versions == {}
+
+
+def test_overlapping_reads():
+    cache = StudyCache()
+    before = cache.reserve(["NCT1"])
+    cache.discard(["NCT1"])
+    after = cache.reserve(["NCT1"])
+    cache.fill(after, {"NCT1": {"n": 2}})
+    assert cache.get("NCT1") == {"n": 2}
+    # The read started before the discard finishes last
+    cache.fill(before, {"NCT1": {"n": 1}})
+    assert cache.get("NCT1") == {"n": 2}
+    assert cache._versions == {}
+
+
+def test_clear_during_read():
+    cache = StudyCache()
+    versions = cache.reserve(["NCT1"])
+    cache.clear()
+    cache.fill(versions, {"NCT1": {}})
+    assert cache.get("NCT1") is None
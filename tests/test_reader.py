@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from reader import iter_raw_studies
+
+# Strings holding brackets, quotes and escapes, which must not be counted
+STUDIES = [
+    {"nctId": "NCT00000001", "title": 'a "quoted" {brace} [bracket]', "n": [1, 2]},
+    {"nctId": "NCT00000002", "nested": {"list": [{"x": "\\"}, {"y": "]}"}]}},
+    {"nctId": "NCT00000003", "title": "x" * 50},
+]
+
+
+def _write(tmp_path, jsonl: bool) -> str:
+    path = tmp_path / ("studies.jsonl" if jsonl else "studies.json")
+    encoded = [json.dumps(study) for study in STUDIES]
+    path.write_text(
+        "\n".join(encoded) + "\n" if jsonl else "[" + ",\n".join(encoded) + "]"
+    )
+    return str(path)
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 20])
+def test_studies_straddling_chunks(tmp_path, jsonl, chunk_size):
+    path = _write(tmp_path, jsonl)
+    with open(path, "rb") as f:
+        data = f.read()
+    studies = list(iter_raw_studies(path, chunk_size=chunk_size))
+    assert [json.loads(raw) for _, raw in studies] == STUDIES
+    for offset, raw in studies:
+        assert data[offset : offset + len(raw)] == raw
+
+
+@pytest.mark.parametrize("jsonl", [False, True])
+def test_start_offset(tmp_path, jsonl):
+    path = _write(tmp_path, jsonl)
+    offsets = [offset for offset, _ in iter_raw_studies(path)]
+    for i, offset in enumerate(offsets):
+        resumed = list(iter_raw_studies(path, start_offset=offset, chunk_size=5))
+        assert [json.loads(raw) for _, raw in resumed] == STUDIES[i:]
+        assert [offset for offset, _ in resumed] == offsets[i:]
+    # Right after a study, i.e. at the separator before the next one
+    end = offsets[0] + len(next(iter_raw_studies(path))[1])
+    assert [offset for offset, _ in iter_raw_studies(path, end)] == offsets[1:]
+
+
+def test_truncated(tmp_path):
+    path = tmp_path / "studies.json"
+    path.write_text('[{"nctId": "NCT00000001"}, {"nctId": "NCT0')
+    with pytest.raises(ValueError, match="Truncated"):
+        list(iter_raw_studies(str(path), chunk_size=4))
+
+
+def test_not_an_object(tmp_path):
+    path = tmp_path / "studies.json"
+    path.write_text('[{"nctId": "NCT00000001"}, 42]')
+    with pytest.raises(ValueError, match="Expected a JSON object"):
+        list(iter_raw_studies(str(path)))
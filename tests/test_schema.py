@@ -0,0 +1,72 @@
+import pytest
+
+from dbutils.schema import (
+    DIMENSION_TABLES,
+    child_tables,
+    foreign_keys,
+    interning,
+    set_interning,
+    split_ddl,
+    table_names,
+    table_order,
+)
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "interned"])
+def interned(request):
+    enabled = interning()
+    set_interning(request.param)
+    yield request.param
+    set_interning(enabled)
+
+
+def test_table_order(interned):
+    order = table_order()
+    assert sorted(order) == sorted(table_names())
+    if interned:
+        assert set(DIMENSION_TABLES) <= set(order)
+    for table_name, parents in foreign_keys().items():
+        for parent in parents:
+            assert order.index(parent) < order.index(table_name)
+
+
+def test_table_order_is_stable():
+    assert table_order() == table_order.__wrapped__()
+
+
+def test_split_ddl():
+    table = split_ddl("conditions")
+    assert table.create_table.startswith("CREATE TABLE IF NOT EXISTS conditions (")
+    assert "PRIMARY KEY" not in table.create_table
+    assert "REFERENCES" not in table.create_table
+    assert "id SERIAL" in table.create_table
+    assert table.keys == ["PRIMARY KEY (id)", "UNIQUE (nct_id, name)"]
+    assert table.foreign_keys == [
+        "FOREIGN KEY (nct_id) REFERENCES identification (nct_id)"
+    ]
+    assert table.indexes == [
+        "CREATE INDEX IF NOT EXISTS idx_conditions_nct_id ON conditions(nct_id);"
+    ]
+
+
+def test_split_ddl_comments_and_generated_columns():
+    table = split_ddl("identification")
+    assert "--" not in table.create_table
+    assert "GENERATED ALWAYS AS" in table.create_table
+    assert table.keys == ["PRIMARY KEY (nct_id)"]
+    assert table.foreign_keys == []
+
+
+def test_split_ddl_interned(interned):
+    for table_name in table_names():
+        table = split_ddl(table_name)
+        assert "REFERENCES" not in table.create_table
+        for foreign_key in table.foreign_keys:
+            assert "REFERENCES" in foreign_key
+
+
+def test_child_tables():
+    children = child_tables()
+    assert "conditions" in children and "facility" in children
+    # One row per study: the foreign key to identification is the primary key
+    assert not children & {"identification", "status", "design", "eligibility"}